@@ -0,0 +1,187 @@
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+# CONSTANTS
+BLOCK_TYPE_NAMES = ('Yard', 'Ground', 'River')
+BUILT_UP = ('Yard',)                 # heat-island side of the UHI index
+NATURAL = ('Ground', 'River')        # vegetated / water reference side
+GROUPS = BLOCK_TYPE_NAMES + ('UHI',)
+THRESHOLD = 30.0                     # °C above which degree-hours accumulate
+STEP = 1 / 60                        # hours between samples (1 minute)
+CHUNK_BYTES = 64 * 2**20             # temperature samples held at once
+FIELDS = ('min', 'max', 'mean', 'peak_time', 'degree_hours')
+
+
+# 22.1 code ref
+# Running min / max / mean and time of the maximum of several series, fed
+# one chunk of samples (times, series) at a time
+class RunningStats:
+    def __init__(self, columns):
+        self.min = np.full(columns, np.inf)
+        self.max = np.full(columns, -np.inf)
+        self.peak_time = np.full(columns, np.nan)
+        self.total = np.zeros(columns)
+        self.count = 0
+
+    def update(self, times, values):
+        np.minimum(self.min, values.min(axis=0), out=self.min)
+        peak = values.argmax(axis=0)
+        high = values[peak, np.arange(values.shape[1])]
+        better = high > self.max
+        self.max[better] = high[better]
+        self.peak_time[better] = times[peak[better]]
+        self.total += values.sum(axis=0)
+        self.count += len(times)
+
+    def result(self):
+        return {'min': self.min, 'max': self.max, 'mean': self.total / max(self.count, 1),
+                'peak_time': self.peak_time}
+
+
+# 22.2 code ref
+# Function 55: Stream a ThermalMap over [start, stop) every `step` hours and
+# accumulate per-block and per-block-type statistics without keeping frames.
+# A block's temperature is the area-weighted mean of the pixels it covers;
+# degree-hours are accumulated per pixel above `threshold` and averaged over
+# the area. The UHI index is the built-up minus the natural area mean.
+# `temperatures(times, slots)` defaults to the engine's diurnal model.
+def stream_statistics(thermal_map, start=0.0, stop=24.0, step=STEP, threshold=THRESHOLD,
+                      chunk_bytes=CHUNK_BYTES, temperatures=None, progress=None):
+    engine = thermal_map.engine
+    temperatures = temperatures or engine.temperatures
+    block_slots, _, block_types = thermal_map._block_table()
+    block_index = np.zeros(engine.size, dtype=np.intp)
+    block_index[block_slots] = np.arange(len(block_slots))
+
+    # Visible slots ordered by block, weighted by their share of the block's area
+    pixels = np.bincount(thermal_map.label_raster.ravel(), minlength=engine.size)
+    slot_block = block_index[engine.owner]
+    visible = np.flatnonzero(pixels)
+    slots = visible[np.argsort(slot_block[visible], kind='stable')]
+    areas = np.bincount(slot_block[slots], pixels[slots], minlength=len(block_slots))
+    weights = pixels[slots] / areas[slot_block[slots]]
+    bounds = np.searchsorted(slot_block[slots], np.arange(len(block_slots)))
+
+    # Block means -> Yard / Ground / River / built-up / natural area means
+    groups = np.zeros((len(block_slots), len(BLOCK_TYPE_NAMES) + 2))
+    for column, names in enumerate([(name,) for name in BLOCK_TYPE_NAMES] + [BUILT_UP, NATURAL]):
+        members = np.isin(block_types, names)
+        if members.any():
+            groups[members, column] = areas[members] / areas[members].sum()
+        else:
+            groups[:, column] = np.nan
+
+    count = int(round((stop - start) / step))
+    chunk = max(1, chunk_bytes // (8 * 3 * len(slots)))
+    block_stats = RunningStats(len(block_slots))
+    group_stats = RunningStats(len(GROUPS))
+    degree_hours = np.zeros(len(slots))
+    for first in range(0, count, chunk):
+        times = start + step * np.arange(first, min(first + chunk, count))
+        temps = temperatures(times, slots)
+        degree_hours += np.maximum(temps - threshold, 0).sum(axis=0) * step
+        temps *= weights
+        block_series = np.add.reduceat(temps, bounds, axis=1)
+        group_series = block_series @ groups
+        block_stats.update(times, block_series)
+        group_stats.update(times, np.column_stack(
+            [group_series[:, :len(BLOCK_TYPE_NAMES)], group_series[:, -2] - group_series[:, -1]]))
+        if progress is not None:
+            progress(min(first + chunk, count), count)
+
+    block_degree_hours = np.add.reduceat(degree_hours * weights, bounds)
+    group_degree_hours = np.append(block_degree_hours @ groups[:, :len(BLOCK_TYPE_NAMES)], np.nan)
+    return {
+        'start': start, 'stop': stop, 'step': step, 'samples': count, 'threshold': threshold,
+        'block_number': thermal_map.block_numbers(),
+        'block_type': block_types,
+        'blocks': {**block_stats.result(), 'degree_hours': block_degree_hours},
+        'groups': {**group_stats.result(), 'degree_hours': group_degree_hours},
+    }
+
+
+# 22.3 code ref
+# Function 56: blocks.csv (one row per block) and summary.csv (one row per
+# block type plus the UHI index)
+def write_csv(results, directory):
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, 'blocks.csv'), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['block', 'type', *FIELDS])
+        columns = [results['blocks'][field] for field in FIELDS]
+        for index, (number, block_type) in enumerate(zip(results['block_number'].tolist(),
+                                                         results['block_type'].tolist())):
+            writer.writerow([number, block_type, *(f"{column[index]:.4f}" for column in columns)])
+    with open(os.path.join(directory, 'summary.csv'), 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['group', *FIELDS])
+        for index, group in enumerate(GROUPS):
+            writer.writerow([group, *(f"{results['groups'][field][index]:.4f}"
+                                      for field in FIELDS)])
+
+
+# 22.4 code ref
+# Function 57: Every result array in one .npz (block_* and group_* members)
+def write_npz(results, path):
+    np.savez(path,
+             meta=np.array([results['start'], results['stop'], results['step'],
+                            results['samples'], results['threshold']]),
+             block_number=results['block_number'],
+             block_type=results['block_type'].astype('U6'),
+             group=np.array(GROUPS),
+             **{f"block_{field}": results['blocks'][field] for field in FIELDS},
+             **{f"group_{field}": results['groups'][field] for field in FIELDS})
+
+
+# 22.5 code ref
+def main(argv=None):
+    from tabulate import tabulate
+
+    parser = argparse.ArgumentParser(
+        description="Stream thermal statistics and heat-island metrics over a time range.")
+    parser.add_argument('--input', default='input.txt', help="layout config file")
+    parser.add_argument('--layout', default=None, help="load a snapshot saved by snapshot.py")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--start', type=float, default=0.0, help="first hour")
+    parser.add_argument('--stop', type=float, default=24.0, help="last hour (exclusive)")
+    parser.add_argument('--step', type=float, default=STEP * 60, help="minutes between samples")
+    parser.add_argument('--threshold', type=float, default=THRESHOLD,
+                        help="°C above which degree-hours accumulate")
+    parser.add_argument('--output', default='./result/analytics',
+                        help="directory for blocks.csv, summary.csv and analytics.npz")
+    args = parser.parse_args(argv)
+
+    if args.layout:
+        from snapshot import load_layout
+        thermal_map = load_layout(args.layout)
+    else:
+        from extract import extract_values_from_file
+        from layout import build_map
+        from utils import calculate_block_size
+
+        num_blocks, num_rows, yards, grounds, rivers, houses, trees, _ = \
+            extract_values_from_file(args.input)
+        thermal_map = build_map(num_blocks, (num_rows, num_blocks // num_rows),
+                                (yards, grounds, rivers), houses, trees,
+                                calculate_block_size(num_blocks),
+                                np.random.default_rng(args.seed))
+
+    begin = time.perf_counter()
+    results = stream_statistics(thermal_map, args.start, args.stop, args.step / 60,
+                                args.threshold)
+    elapsed = time.perf_counter() - begin
+    write_csv(results, args.output)
+    write_npz(results, os.path.join(args.output, 'analytics.npz'))
+    groups = results['groups']
+    print(tabulate([[group, *(f"{groups[field][index]:.2f}" for field in FIELDS)]
+                    for index, group in enumerate(GROUPS)],
+                   headers=['Group', *FIELDS]))
+    print(f"{results['samples']} samples in {elapsed:.1f}s, results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from layout import build_map
+from profiling import PROFILER
+from snapshot import load_layout, save_layout
+
+# CONSTANTS
+OUTPUTS = ('thermal', 'rgb', 'figure', 'animation', 'summary', 'snapshot')
+SCENARIO_KEYS = {
+    'name': str,
+    'rows': int,
+    'cols': int,
+    'yards': int,
+    'grounds': int,
+    'rivers': int,
+    'houses': int,
+    'trees': int,
+    'times': list,
+    'outputs': list,
+    'seed': int,
+    'block_size': int,
+    'directory': str,
+    'frames': int,
+    'layout': str,
+}
+REQUIRED_KEYS = ('rows', 'cols', 'yards', 'grounds', 'rivers')
+DEFAULTS = {
+    'houses': 0,
+    'trees': 0,
+    'times': [14.0],
+    'outputs': ['thermal', 'summary'],
+    'seed': None,
+    'block_size': None,
+    'directory': './result/batch',
+    'frames': 240,
+    'layout': None,
+}
+
+
+# 16.1 code ref
+# Function 38: Read a JSON or TOML scenario file. Both hold an optional
+# `defaults` table and a `scenarios` list of tables.
+def load_config(path):
+    if path.endswith('.toml'):
+        import tomllib
+        with open(path, 'rb') as file:
+            return tomllib.load(file)
+    with open(path, 'r') as file:
+        return json.load(file)
+
+
+# 16.2 code ref
+# Function 39: Check one scenario and fill in defaults; returns (scenario, errors)
+def validate_scenario(raw, defaults, index):
+    where = f"scenario {index} ({raw.get('name', 'unnamed')})" if isinstance(raw, dict) \
+        else f"scenario {index}"
+    if not isinstance(raw, dict):
+        return None, [f"{where}: expected a table"]
+    scenario = {**DEFAULTS, 'name': f"scenario_{index}", **defaults, **raw}
+    errors = [f"{where}: unknown key '{key}'" for key in scenario if key not in SCENARIO_KEYS]
+    blocking = []
+    for key, expected in SCENARIO_KEYS.items():
+        value = scenario.get(key)
+        if key not in scenario and key in REQUIRED_KEYS and not scenario.get('layout'):
+            blocking.append(f"{where}: missing '{key}'")
+        elif value is not None and (not isinstance(value, expected) or isinstance(value, bool)):
+            blocking.append(f"{where}: '{key}' must be {expected.__name__}")
+    if blocking:
+        return None, errors + blocking
+
+    if scenario['layout']:
+        # The grid comes from the snapshot; rows/cols/yards/... are ignored
+        if not os.path.isfile(scenario['layout']):
+            errors.append(f"{where}: layout file {scenario['layout']!r} not found")
+    else:
+        for key in ('rows', 'cols'):
+            if scenario[key] <= 0:
+                errors.append(f"{where}: '{key}' must be positive")
+        for key in ('yards', 'grounds', 'rivers', 'houses', 'trees'):
+            if scenario[key] < 0:
+                errors.append(f"{where}: '{key}' must not be negative")
+        num_blocks = scenario['rows'] * scenario['cols']
+        if scenario['yards'] + scenario['grounds'] + scenario['rivers'] != num_blocks:
+            errors.append(
+                f"{where}: yards + grounds + rivers must equal rows * cols ({num_blocks})")
+    if scenario['frames'] <= 0:
+        errors.append(f"{where}: 'frames' must be positive")
+    if scenario['block_size'] is not None and scenario['block_size'] < 10:
+        errors.append(f"{where}: 'block_size' must be at least 10")
+    for t in scenario['times']:
+        if isinstance(t, bool) or not isinstance(t, (int, float)) or not 0 <= t <= 24:
+            errors.append(f"{where}: times must be numbers between 0 and 24, got {t!r}")
+    for output in scenario['outputs']:
+        if output not in OUTPUTS:
+            errors.append(f"{where}: unknown output {output!r} (choose from {', '.join(OUTPUTS)})")
+    scenario['times'] = [float(t) for t in scenario['times']
+                         if isinstance(t, (int, float)) and not isinstance(t, bool)]
+    return scenario, errors
+
+
+# 16.3 code ref
+# Function 40: Validate every scenario up front; raises ValueError listing all problems
+def validate_config(config):
+    if not isinstance(config, dict) or not isinstance(config.get('scenarios'), list):
+        raise ValueError("config must contain a 'scenarios' list")
+    defaults = config.get('defaults', {})
+    if not isinstance(defaults, dict):
+        raise ValueError("'defaults' must be a table")
+    scenarios, errors = [], []
+    for index, raw in enumerate(config['scenarios']):
+        scenario, scenario_errors = validate_scenario(raw, defaults, index)
+        scenarios.append(scenario)
+        errors.extend(scenario_errors)
+    names = [scenario['name'] for scenario in scenarios if scenario]
+    for name in sorted({name for name in names if names.count(name) > 1}):
+        errors.append(f"duplicate scenario name '{name}'")
+    if not scenarios:
+        errors.append("no scenarios")
+    if errors:
+        raise ValueError("invalid scenario config:\n  " + "\n  ".join(errors))
+    return scenarios
+
+
+# 16.4 code ref
+# Function 41: Build one scenario's map and write its outputs
+def run_scenario(scenario):
+    from utils import calculate_block_size
+
+    begin = time.perf_counter()
+    directory = os.path.join(scenario['directory'], scenario['name'])
+    os.makedirs(directory, exist_ok=True)
+    outputs = set(scenario['outputs'])
+
+    if scenario['layout']:
+        with PROFILER.stage('load_layout'):
+            thermal_map = load_layout(scenario['layout'])
+        map_shape, block_size = thermal_map.map_shape, thermal_map.block_size
+        num_blocks = len(thermal_map)
+    else:
+        num_blocks = scenario['rows'] * scenario['cols']
+        map_shape = (scenario['rows'], scenario['cols'])
+        block_size = scenario['block_size'] or calculate_block_size(num_blocks)
+        rng = np.random.default_rng(scenario['seed'])
+        with PROFILER.stage('build_map'):
+            thermal_map = build_map(num_blocks, map_shape,
+                                    (scenario['yards'], scenario['grounds'], scenario['rivers']),
+                                    scenario['houses'], scenario['trees'], block_size, rng)
+    if 'snapshot' in outputs:
+        save_layout(thermal_map, os.path.join(directory, 'layout.npz'))
+    if 'rgb' in outputs:
+        np.save(os.path.join(directory, 'rgb.npy'), thermal_map.rgb_image())
+
+    summary = []
+    for t in scenario['times']:
+        frame = thermal_map.frame_at(t)
+        if 'thermal' in outputs:
+            np.save(os.path.join(directory, f"thermal_{t:.2f}h.npy"), frame)
+        summary.append((t, float(frame.mean()), float(frame.min()), float(frame.max())))
+
+    if 'figure' in outputs:
+        # All hours composited onto one template (see stills.py)
+        from stills import export_snapshots
+        from visualization import SAVE_DPI
+        export_snapshots(thermal_map, scenario['times'], directory, dpi=SAVE_DPI, sheet=False)
+    if 'summary' in outputs:
+        with open(os.path.join(directory, 'summary.csv'), 'w') as file:
+            file.write("time,mean,min,max\n")
+            for row in summary:
+                file.write(",".join(f"{value:.4f}" for value in row) + "\n")
+    if 'animation' in outputs:
+        from export import export_animation
+        export_animation(thermal_map, os.path.join(directory, 'thermal.gif'),
+                         frames=scenario['frames'])
+
+    kinds = thermal_map.slot_kinds()
+    houses = int(np.count_nonzero(kinds == 'House'))
+    trees = int(np.count_nonzero(kinds == 'Tree'))
+    return {'name': scenario['name'], 'blocks': num_blocks, 'houses': houses, 'trees': trees,
+            'times': len(scenario['times']), 'seconds': time.perf_counter() - begin,
+            'directory': directory}
+
+
+# 16.5 code ref
+# Function 42: Run validated scenarios back-to-back in this process
+def run_batch(scenarios):
+    results = []
+    for scenario in scenarios:
+        result = run_scenario(scenario)
+        print(f"[{result['name']}] {result['blocks']} blocks, {result['houses']} houses, "
+              f"{result['trees']} trees, {result['times']} times in {result['seconds']:.2f}s "
+              f"-> {result['directory']}")
+        results.append(result)
+    return results
+
+
+# 16.6 code ref
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run every scenario of a JSON/TOML config without any prompt.")
+    parser.add_argument('config', help="scenario file (.json or .toml)")
+    parser.add_argument('--check', action='store_true', help="only validate the config")
+    parser.add_argument('--profile', metavar='REPORT.json', default=None,
+                        help="write a per-stage profiling report")
+    parser.add_argument('--cprofile', metavar='FILE.prof', default=None,
+                        help="also dump cProfile stats (requires --profile)")
+    args = parser.parse_args(argv)
+
+    try:
+        scenarios = validate_config(load_config(args.config))
+    except (OSError, ValueError) as error:
+        raise SystemExit(f"{args.config}: {error}")
+    if args.check:
+        print(f"{args.config}: {len(scenarios)} valid scenarios")
+        return
+    if args.profile:
+        PROFILER.enable(cprofile=args.cprofile is not None)
+    try:
+        run_batch(scenarios)
+    finally:
+        if args.profile:
+            PROFILER.disable()
+            PROFILER.write(args.profile, args.cprofile)
+            print(f"Profile report saved to {args.profile}")
+
+
+if __name__ == "__main__":
+    main()
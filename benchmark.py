@@ -0,0 +1,276 @@
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import matplotlib
+
+matplotlib.use('Agg')
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from layout import add_items_to_blocks, add_roads_to_blocks, create_blocks
+from utils import calculate_block_size, calculate_max_items
+from visualization import generate_rgb_image, generate_thermal_image, update_temperatures
+
+# CONSTANTS
+SIZES = (20, 400, 2500, 20000)
+DENSITIES = (0.25, 1.0)
+BLOCK_MIX = (0.3, 0.3, 0.4)     # share of Yard, Ground, River blocks
+REPEAT = 5
+THRESHOLD = 1.25                # flag stages slower than this ratio to the baseline
+MIN_TIME = 1e-3                 # ignore differences below this many seconds
+STAGES = ('blocks', 'roads', 'items', 'update', 'thermal_image', 'rgb_image', 'frame')
+STARTUP_MODULES = ('engine', 'cano', 'layout', 'utils', 'batch', 'visualization', 'main')
+PRESENTATION = ('matplotlib', 'tabulate', 'colorama')   # must stay out of the compute path
+
+
+# 18.1 code ref
+# Function 46: Most square map shape (rows, cols) with rows * cols == num_blocks
+def square_shape(num_blocks):
+    rows = int(math.isqrt(num_blocks))
+    while num_blocks % rows:
+        rows -= 1
+    return rows, num_blocks // rows
+
+
+# 18.2 code ref
+def _timed(fn, *args):
+    begin = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - begin, result
+
+
+# 18.3 code ref
+# Function 47: Time every stage of one case. Layout stages run on a fresh,
+# identically seeded map each repeat; the per-frame stages reuse the last map.
+def run_case(num_blocks, density, repeat=REPEAT, seed=0):
+    map_shape = square_shape(num_blocks)
+    block_size = calculate_block_size(num_blocks)
+    yards = int(round(BLOCK_MIX[0] * num_blocks))
+    grounds = int(round(BLOCK_MIX[1] * num_blocks))
+    distribution = (yards, grounds, num_blocks - yards - grounds)
+    samples = {stage: [] for stage in STAGES}
+
+    for _ in range(repeat):
+        rng = np.random.default_rng(seed)
+        elapsed, blocks = _timed(create_blocks, num_blocks, map_shape, distribution,
+                                 block_size, rng)
+        samples['blocks'].append(elapsed)
+        samples['roads'].append(_timed(add_roads_to_blocks, blocks, map_shape)[0])
+        max_houses, max_trees = calculate_max_items(blocks)
+        houses, trees = int(density * max_houses), int(density * max_trees)
+        elapsed, added = _timed(add_items_to_blocks, blocks, houses, trees, rng)
+        samples['items'].append(elapsed)
+
+    fig, ax = plt.subplots(figsize=(6, 6))
+    image = ax.imshow(generate_thermal_image(blocks, block_size, map_shape),
+                      cmap='Spectral_r', vmin=5, vmax=40)
+    for index in range(repeat):
+        t = 24 * index / repeat
+        samples['update'].append(_timed(update_temperatures, blocks, t)[0])
+        samples['thermal_image'].append(
+            _timed(generate_thermal_image, blocks, block_size, map_shape)[0])
+        blocks.invalidate()
+        samples['rgb_image'].append(_timed(generate_rgb_image, blocks, block_size, map_shape)[0])
+        begin = time.perf_counter()
+        update_temperatures(blocks, t)
+        image.set_data(generate_thermal_image(blocks, block_size, map_shape))
+        fig.canvas.draw()
+        samples['frame'].append(time.perf_counter() - begin)
+    plt.close(fig)
+
+    return {
+        'blocks': num_blocks,
+        'density': density,
+        'map_shape': list(map_shape),
+        'block_size': block_size,
+        'pixels': map_shape[0] * map_shape[1] * block_size ** 2,
+        'houses': added[0],
+        'trees': added[1],
+        'stages': {stage: {'min': min(values), 'median': float(np.median(values))}
+                   for stage, values in samples.items()},
+    }
+
+
+# 18.3.1 code ref
+# Function 52: Traced bytes held per placed item: everything allocated while
+# items are added to a fresh map (engine columns, block slot arrays, packed
+# occupancy), once the engine has dropped its spare capacity
+def measure_item_memory(num_blocks, density=1.0, seed=0):
+    map_shape = square_shape(num_blocks)
+    block_size = calculate_block_size(num_blocks)
+    yards = int(round(BLOCK_MIX[0] * num_blocks))
+    grounds = int(round(BLOCK_MIX[1] * num_blocks))
+    rng = np.random.default_rng(seed)
+    blocks = create_blocks(num_blocks, map_shape,
+                           (yards, grounds, num_blocks - yards - grounds), block_size, rng)
+    add_roads_to_blocks(blocks, map_shape)
+    blocks.engine.trim()
+    max_houses, max_trees = calculate_max_items(blocks)
+
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    gc.collect()
+    begin = tracemalloc.get_traced_memory()[0]
+    houses, trees = add_items_to_blocks(blocks, int(density * max_houses),
+                                        int(density * max_trees), rng)
+    blocks.engine.trim()
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - begin
+    if not tracing:
+        tracemalloc.stop()
+    items = houses + trees
+    return {'blocks': num_blocks, 'density': density, 'items': items, 'bytes': held,
+            'bytes_per_item': held / items if items else 0.0}
+
+
+# 18.4 code ref
+# Function 48: Run every size x density case and collect a JSON-ready report
+def run_suite(sizes=SIZES, densities=DENSITIES, repeat=REPEAT, seed=0, log=print):
+    cases = []
+    for num_blocks in sizes:
+        for density in densities:
+            case = run_case(num_blocks, density, repeat, seed)
+            case['bytes_per_item'] = measure_item_memory(num_blocks, density,
+                                                         seed)['bytes_per_item']
+            log(f"{num_blocks:>6} blocks, density {density:<5}: " + ", ".join(
+                f"{stage} {timing['median'] * 1e3:.1f}ms"
+                for stage, timing in case['stages'].items())
+                + f", {case['bytes_per_item']:.0f} B/item")
+            cases.append(case)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'matplotlib': matplotlib.__version__,
+            'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat,
+            'seed': seed,
+        },
+        'cases': cases,
+    }
+
+
+# 18.7 code ref
+# Function 60: Cold import time of each module, measured in a fresh
+# interpreter per repeat (best of `repeat`), and which presentation
+# packages the import dragged in
+def measure_startup(modules=STARTUP_MODULES, repeat=REPEAT):
+    script = ("import sys, time; begin = time.perf_counter(); import {module}; "
+              "print(time.perf_counter() - begin); "
+              f"print(','.join(name for name in {PRESENTATION!r} if name in sys.modules))")
+    rows = []
+    for module in modules:
+        timings = []
+        for _ in range(repeat):
+            output = subprocess.run([sys.executable, '-c', script.format(module=module)],
+                                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                                    capture_output=True, text=True, check=True).stdout.split('\n')
+            timings.append(float(output[0]))
+        rows.append({'module': module, 'min': min(timings), 'median': float(np.median(timings)),
+                     'loaded': [name for name in output[1].split(',') if name]})
+    return rows
+
+
+# 18.5 code ref
+# Function 49: Per-stage ratios of `current` to `baseline` for the cases both
+# contain. A stage regresses when it is `threshold` times slower and the
+# difference exceeds `min_time` seconds.
+def compare_reports(baseline, current, threshold=THRESHOLD, min_time=MIN_TIME):
+    reference = {(case['blocks'], case['density']): case for case in baseline['cases']}
+    rows = []
+    for case in current['cases']:
+        base = reference.get((case['blocks'], case['density']))
+        if base is None:
+            continue
+        for stage, timing in case['stages'].items():
+            if stage not in base['stages']:
+                continue
+            old, new = base['stages'][stage]['min'], timing['min']
+            ratio = new / old if old > 0 else float('inf')
+            regressed = ratio > threshold and new - old > min_time
+            rows.append([case['blocks'], case['density'], stage, old, new, ratio, regressed])
+    return rows
+
+
+# 18.6 code ref
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the layout, placement, thermal and render stages.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    run = commands.add_parser('run', help="run the suite and write a JSON report")
+    run.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    run.add_argument('--densities', type=float, nargs='+', default=list(DENSITIES),
+                     help="fraction of the maximum number of houses/trees")
+    run.add_argument('--repeat', type=int, default=REPEAT)
+    run.add_argument('--seed', type=int, default=0)
+    run.add_argument('--output', default='./result/benchmark.json')
+
+    memory = commands.add_parser('memory', help="report memory held per placed item")
+    memory.add_argument('--sizes', type=int, nargs='+', default=list(SIZES))
+    memory.add_argument('--density', type=float, default=1.0)
+    memory.add_argument('--seed', type=int, default=0)
+
+    startup = commands.add_parser('startup', help="time cold imports of the core modules")
+    startup.add_argument('--modules', nargs='+', default=list(STARTUP_MODULES))
+    startup.add_argument('--repeat', type=int, default=REPEAT)
+
+    compare = commands.add_parser('compare', help="flag slowdowns against a baseline report")
+    compare.add_argument('baseline')
+    compare.add_argument('current')
+    compare.add_argument('--threshold', type=float, default=THRESHOLD)
+    compare.add_argument('--min-time', type=float, default=MIN_TIME)
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = run_suite(args.sizes, args.densities, args.repeat, args.seed)
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+        print(f"Saved benchmark report to {args.output}")
+        return 0
+
+    from tabulate import tabulate
+
+    if args.command == 'memory':
+        rows = [measure_item_memory(num_blocks, args.density, args.seed)
+                for num_blocks in args.sizes]
+        print(tabulate([[row['blocks'], row['items'], f"{row['bytes'] / 2**20:.2f}",
+                         f"{row['bytes_per_item']:.0f}"] for row in rows],
+                       headers=['Blocks', 'Items', 'Held MiB', 'Bytes/item']))
+        return 0
+
+    if args.command == 'startup':
+        rows = measure_startup(args.modules, args.repeat)
+        print(tabulate([[row['module'], f"{row['min'] * 1e3:.1f}", f"{row['median'] * 1e3:.1f}",
+                         ', '.join(row['loaded']) or '-'] for row in rows],
+                       headers=['Module', 'Min ms', 'Median ms', 'Presentation loaded']))
+        return 0
+
+    with open(args.baseline) as file:
+        baseline = json.load(file)
+    with open(args.current) as file:
+        current = json.load(file)
+    rows = compare_reports(baseline, current, args.threshold, args.min_time)
+    print(tabulate([[blocks, density, stage, f"{old * 1e3:.2f}", f"{new * 1e3:.2f}",
+                     f"{ratio:.2f}x", "SLOWER" if regressed else ""]
+                    for blocks, density, stage, old, new, ratio, regressed in rows],
+                   headers=['Blocks', 'Density', 'Stage', 'Baseline ms', 'Current ms',
+                            'Ratio', '']))
+    regressions = sum(row[-1] for row in rows)
+    print(f"{regressions} regressions (threshold {args.threshold:.2f}x)")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,11 @@
-import math
 import random
-from typing import List, Union
 
 import numpy as np
 
+from engine import ThermalEngine
+from placement import FreeSpaceIndex, place_items
+from profiling import PROFILER
+
 # 1.0 code ref
 # CONSTANTS
 TREE_INITIAL_TEMP = 16
@@ -21,140 +23,340 @@ GREEN = [0, 255, 0]
 YELLOW = [255, 255, 0]
 BLACK = [0, 0, 0]
 
-ATTEMPTS = 100
+
+# 1.0.1 code ref
+# Thermal state and geometry live in ThermalEngine columns; blocks and items
+# are views onto one slot.
+class ThermalView:
+    __slots__ = ('engine', 'slot')
+
+    def _bind(self, engine, t_mean, t_amp, t_peak, current, slot=None):
+        self.engine = engine if engine is not None else ThermalEngine(capacity=1)
+        if slot is None:
+            slot = self.engine.register(t_mean, t_amp, t_peak, current)
+        self.slot = slot
+
+    @property
+    def current_temp(self):
+        return self.engine._current[self.slot]
+
+    @current_temp.setter
+    def current_temp(self, value):
+        self.engine._current[self.slot] = value
+
+    @property
+    def t_mean(self):
+        return self.engine._t_mean[self.slot]
+
+    @t_mean.setter
+    def t_mean(self, value):
+        self.engine.set_params(self.slot, value, self.t_amp, self.t_peak)
+
+    @property
+    def t_amp(self):
+        return self.engine._t_amp[self.slot]
+
+    @t_amp.setter
+    def t_amp(self, value):
+        self.engine.set_params(self.slot, self.t_mean, value, self.t_peak)
+
+    @property
+    def t_peak(self):
+        return self.engine._t_peak[self.slot]
+
+    @t_peak.setter
+    def t_peak(self, value):
+        self.engine.set_params(self.slot, self.t_mean, self.t_amp, value)
 
 
 # 1.1 code ref
-class ThermalItem:
-    def __init__(self, initial_temp, ambient_temp):
-        self.initial_temp = initial_temp
-        self.current_temp = initial_temp
-        self.t_mean = (initial_temp + ambient_temp)/2
-        self.t_amp = EFFECT_RATE * self.t_mean
-        self.t_peak = T_PEAK
+# Items are __slots__ proxies of (engine, slot): position and extent are read
+# from the engine's geometry columns, and the colour is shared by the class.
+class ThermalItem(ThermalView):
+    __slots__ = ()
+    KIND = 0
+    rgb = None
+
+    def __init__(self, initial_temp, ambient_temp, engine=None, slot=None):
+        t_mean = (initial_temp + ambient_temp)/2
+        self._bind(engine, t_mean, EFFECT_RATE * t_mean, T_PEAK, initial_temp, slot)
 
     # 1.1.1 code ref
     def update_temperature(self, t):
-        self.current_temp = self.t_mean + self.t_amp * \
-            math.cos(2 * math.pi / 24 * (t - self.t_peak))
+        self.engine.update(t, self.slot)
 
-# 1.2 code ref
-class Tree(ThermalItem):
-    def __init__(self, pos, size, ambient_temp):
-        super().__init__(initial_temp=TREE_INITIAL_TEMP, ambient_temp=ambient_temp)
-        self.pos = pos
-        self.size = size
-        self.rgb = np.array(GREEN)
+    # 1.1.2 code ref
+    # Proxy onto an existing slot, without touching the engine
+    @classmethod
+    def _view(cls, engine, slot):
+        item = object.__new__(cls)
+        item.engine = engine
+        item.slot = slot
+        return item
 
-    # 1.2.1 code ref
-    def get_image(self):
-        return np.ones((self.size, self.size, 3), dtype=np.uint8) * self.rgb
+    # 1.1.3 code ref
+    def _set_geometry(self, pos, width, height, owner=-1):
+        self.engine.set_geometry(self.slot, self.KIND, owner, pos[0], pos[1], width, height)
+
+    @property
+    def pos(self):
+        return int(self.engine._x[self.slot]), int(self.engine._y[self.slot])
 
-    # 1.2.2 code ref
     def get_topleft(self):
         return self.pos
 
+    def get_extent(self):
+        return int(self.engine._width[self.slot]), int(self.engine._height[self.slot])
+
+    def get_image(self):
+        width, height = self.get_extent()
+        return np.full((height, width, 3), self.rgb, dtype=np.uint8)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other.engine is self.engine \
+            and other.slot == self.slot
+
+    def __hash__(self):
+        return hash((id(self.engine), self.slot))
+
+
+# 1.1.4 code ref
+def _shared_colour(colour):
+    rgb = np.array(colour)
+    rgb.flags.writeable = False
+    return rgb
+
+
+# 1.2 code ref
+class Tree(ThermalItem):
+    __slots__ = ()
+    KIND = 1
+    initial_temp = TREE_INITIAL_TEMP
+    rgb = _shared_colour(GREEN)
+
+    def __init__(self, pos, size, ambient_temp, engine=None, slot=None):
+        super().__init__(initial_temp=TREE_INITIAL_TEMP, ambient_temp=ambient_temp,
+                         engine=engine, slot=slot)
+        self._set_geometry(pos, size, size)
+
+    # 1.2.1 code ref
+    @property
+    def size(self):
+        return int(self.engine._width[self.slot])
+
 # 1.3 code ref
 class House(ThermalItem):
-    def __init__(self, pos, size, ambient_temp):
-        super().__init__(initial_temp=HOUSE_INITIAL_TEMP, ambient_temp=ambient_temp)
-        self.pos = pos
-        self.size = size
-        self.rgb = np.array(YELLOW)  # Yellow
+    __slots__ = ()
+    KIND = 2
+    initial_temp = HOUSE_INITIAL_TEMP
+    rgb = _shared_colour(YELLOW)  # Yellow
 
-    # 1.3.1 code ref
-    def get_image(self):
-        return np.ones((self.size, self.size, 3), dtype=np.uint8) * self.rgb
+    def __init__(self, pos, size, ambient_temp, engine=None, slot=None):
+        super().__init__(initial_temp=HOUSE_INITIAL_TEMP, ambient_temp=ambient_temp,
+                         engine=engine, slot=slot)
+        self._set_geometry(pos, size, size)
 
-    # 1.3.2 code ref
-    def get_topleft(self):
-        return self.pos
+    # 1.3.1 code ref
+    @property
+    def size(self):
+        return int(self.engine._width[self.slot])
 
 # 1.4 code ref
 class Road(ThermalItem):
-    def __init__(self, pos, length, orientation, ambient_temp):
-        super().__init__(initial_temp=ROAD_INITIAL_TEMP, ambient_temp=ambient_temp)
-        self.pos = pos
-        self.length = length
-        self.orientation = orientation
-        self.rgb = np.array(BLACK)
-        self.width = 5 if orientation == 'vertical' else length
-        self.height = 5 if orientation == 'horizontal' else length
+    __slots__ = ()
+    KIND = 3
+    initial_temp = ROAD_INITIAL_TEMP
+    rgb = _shared_colour(BLACK)
+
+    def __init__(self, pos, length, orientation, ambient_temp, engine=None, slot=None):
+        super().__init__(initial_temp=ROAD_INITIAL_TEMP, ambient_temp=ambient_temp,
+                         engine=engine, slot=slot)
+        width = 5 if orientation == 'vertical' else length
+        height = 5 if orientation == 'horizontal' else length
+        self._set_geometry(pos, width, height)
 
     # 1.4.1 code ref
-    def get_image(self):
-        return np.ones((self.height, self.width, 3), dtype=np.uint8) * self.rgb
+    @property
+    def width(self):
+        return int(self.engine._width[self.slot])
 
-    # 1.4.2 code ref
-    def get_topleft(self):
-        return self.pos
+    @property
+    def height(self):
+        return int(self.engine._height[self.slot])
+
+    @property
+    def orientation(self):
+        return 'vertical' if self.width == 5 and self.height != 5 else 'horizontal'
+
+    @property
+    def length(self):
+        return max(self.width, self.height)
+
+
+# 1.5 code ref
+ITEM_CLASSES = {cls.KIND: cls for cls in (Tree, House, Road)}
 
 # 2.0 code ref
-class Block:
+class Block(ThermalView):
     # 2.1 code ref
     BLOCK_TYPES = {
         'Yard': (np.array(GREY), YARD_INITIAL_TEMP),
         'Ground': (np.array(BROWN), GROUND_INITIAL_TEMP),
         'River': (np.array(BLUE), RIVER_INITIAL_TEMP)
     }
+    ITEM_BLOCK_TYPES = {'Tree': 'Ground', 'House': 'Yard'}
+    __slots__ = ('size', 'topleft', 'block_type', 'block_number', 'layout', 'rgb',
+                 'initial_temp', 'item_counts', 'house_size', 'tree_size', 'max_houses',
+                 'max_trees', '_occupancy', '_free_index', '_item_slots', '_item_count')
 
     # 2.2 code ref
-    def __init__(self, size, topleft, block_type, block_number):
+    # Items are kept as an int32 array of engine slots and occupancy is
+    # bit-packed along y, so a block costs a few hundred bytes plus 4 per item.
+    def __init__(self, size, topleft, block_type, block_number, engine=None, slot=None):
         self.size = size
         self.topleft = topleft
-        self.items: List[Union[Tree, House, Road]] = []
         self.block_type = block_type
         self.block_number = block_number
-        self.occupied_spaces = np.zeros((size, size), dtype=bool)
+        self.layout = None
+        self._occupancy = np.zeros((size, -(-size // 8)), dtype=np.uint8)
+        self._free_index = None
+        self._item_slots = np.empty(4, dtype=np.int32)
+        self._item_count = 0
         self.rgb, self.initial_temp = self.BLOCK_TYPES[block_type]
-        self.current_temp = self.initial_temp
-        self.t_mean = self.initial_temp
-        self.t_amp = EFFECT_RATE * self.t_mean
-        self.t_peak = T_PEAK
+        self._bind(engine, self.initial_temp, EFFECT_RATE * self.initial_temp,
+                   T_PEAK, self.initial_temp, slot)
+        self.engine.set_geometry(self.slot, 0, self.slot, 0, 0, size, size)
+        self.item_counts = {'Tree': 0, 'House': 0, 'Road': 0}
         self.house_size = int(size * 0.3)
         self.tree_size = int(size * 0.1)   
         self.max_houses = (size // self.house_size) ** 2
         self.max_trees = (size // self.tree_size) ** 2
 
+    # 2.2.1 code ref
+    # Proxies of the block's items, in insertion order
+    @property
+    def items(self):
+        slots = self.item_slots
+        kinds = self.engine._kind[slots]
+        return [ITEM_CLASSES[kind]._view(self.engine, slot)
+                for kind, slot in zip(kinds.tolist(), slots.tolist())]
+
+    @property
+    def item_slots(self):
+        return self._item_slots[:self._item_count]
+
+    # Engine slots of the block and all its items
+    @property
+    def slots(self):
+        return np.concatenate(([self.slot], self.item_slots))
+
+    # 2.2.2 code ref
+    def _attach_slots(self, slots):
+        slots = np.atleast_1d(slots)
+        needed = self._item_count + len(slots)
+        if needed > len(self._item_slots):
+            grown = np.empty(max(needed, 2 * len(self._item_slots)), dtype=np.int32)
+            grown[:self._item_count] = self.item_slots
+            self._item_slots = grown
+        self._item_slots[self._item_count:needed] = slots
+        self._item_count = needed
+        self.engine._owner[slots] = self.slot
+
+    # 2.2.3 code ref
+    # Unpacked read-only copy of the occupancy grid, indexed [x, y]. Assign the
+    # whole grid, or use mark_occupied, to change it.
+    @property
+    def occupied_spaces(self):
+        occupied = np.unpackbits(self._occupancy, axis=1, count=self.size).view(bool)
+        occupied.setflags(write=False)
+        return occupied
+
+    @occupied_spaces.setter
+    def occupied_spaces(self, value):
+        self._occupancy = np.packbits(np.asarray(value, dtype=bool), axis=1)
+
+    # 2.2.4 code ref
+    def _occupied_rows(self, x, width):
+        return np.unpackbits(self._occupancy[x:x+width], axis=1, count=self.size).view(bool)
+
+    def _fill_occupied(self, x, y, width, height):
+        rows = self._occupied_rows(x, width)
+        rows[:, y:y+height] = True
+        self._occupancy[x:x+width] = np.packbits(rows, axis=1)
+
     # 2.3 code ref
-    def add_item(self, item_type, pos=None):
-        if item_type == 'Tree' and self.block_type == 'Ground':
-            if len([item for item in self.items if isinstance(item, Tree)]) >= self.max_trees:
-                return False
-            return self._add_house_or_tree('Tree', self.tree_size, pos)
-        elif item_type == 'House' and self.block_type == 'Yard':
-            if len([item for item in self.items if isinstance(item, House)]) >= self.max_houses:
-                return False
-            return self._add_house_or_tree('House', self.house_size, pos)
-        else:
+    def add_item(self, item_type, pos=None, rng=None):
+        if self.item_capacity(item_type) <= 0:
             return False
+        return self._add_house_or_tree(item_type, self.item_size(item_type), pos, rng)
+
+    # 2.3.1 code ref
+    def item_size(self, item_type):
+        return self.tree_size if item_type == 'Tree' else self.house_size
+
+    # 2.3.2 code ref
+    # How many more items of the type the block accepts (0 if not allowed here)
+    def item_capacity(self, item_type):
+        if self.ITEM_BLOCK_TYPES.get(item_type) != self.block_type:
+            return 0
+        limit = self.max_trees if item_type == 'Tree' else self.max_houses
+        return limit - self.item_counts[item_type]
+
+    # 2.3.3 code ref
+    def add_items_bulk(self, item_type, n, strategy='random', min_distance=None, rng=None):
+        return place_items([self], item_type, n, strategy, min_distance, rng)
+
+    # 2.3.4 code ref
+    # Append already-placed items (positions is an (n, 2) array of free (x, y))
+    def _append_items(self, item_type, positions):
+        item_class = Tree if item_type == 'Tree' else House
+        size = self.item_size(item_type)
+        initial_temp = item_class.initial_temp
+        t_mean = (initial_temp + self.initial_temp)/2
+        slots = self.engine.register_many(t_mean, EFFECT_RATE * t_mean, T_PEAK,
+                                          np.full(len(positions), initial_temp))
+        self.engine.set_geometry(slots, item_class.KIND, self.slot,
+                                 positions[:, 0], positions[:, 1], size, size)
+        self._attach_slots(slots)
+        occupied = self.occupied_spaces.copy()
+        for x, y in positions.tolist():
+            occupied[x:x+size, y:y+size] = True
+        self.occupied_spaces = occupied
+        self.item_counts[item_type] += len(positions)
+        self._free_index = None
+        self._layout_changed()
 
     # 2.4 code ref
-    def _add_house_or_tree(self, item_type, size, pos=None):
+    def _add_house_or_tree(self, item_type, size, pos=None, rng=None):
         if pos is None:
-            pos = self._find_random_free_space(size)
+            pos = self._find_random_free_space(size, rng)
 
-        if pos and self._is_space_free(pos, (size, size)):
+        placed = bool(pos) and self._is_space_free(pos, (size, size))
+        PROFILER.record_placement(self, item_type, 1, int(placed))
+        if placed:
             if item_type == 'Tree':
-                self.items.append(Tree(pos, size, self.initial_temp))
+                item = Tree(pos, size, self.initial_temp, self.engine)
             else:
-                self.items.append(House(pos, size, self.initial_temp))
+                item = House(pos, size, self.initial_temp, self.engine)
+            self._attach_slots(item.slot)
+            self.item_counts[item_type] += 1
             self._mark_occupied(pos, (size, size))
+            self._layout_changed(item)
             return True
         return False
 
     # 2.5 code ref
-    def _find_random_free_space(self, size, attempts=ATTEMPTS):
-        if attempts <= 0:
-            return None
-
-        x = random.randint(0, self.size - size)
-        y = random.randint(0, self.size - size)
-
-        if self._is_space_free((x, y), (size, size)):
-            return (x, y)
-
-        return self._find_random_free_space(size, attempts - 1)
+    # Uniform over all free positions; None only when the item cannot fit.
+    # Draws from the numpy Generator `rng` if given, else the global `random`.
+    def _find_random_free_space(self, size, rng=None):
+        draw = random.randrange if rng is None else rng.integers
+        return self.free_space_index().sample(size, size, draw)
+
+    # 2.15 code ref
+    def free_space_index(self):
+        if self._free_index is None:
+            self._free_index = FreeSpaceIndex(self.occupied_spaces)
+        return self._free_index
 
     # 2.6 code ref
     def _is_space_free(self, pos, size):
@@ -162,13 +364,24 @@ class Block:
         width, height = size
         if x + width > self.size or y + height > self.size:
             return False
-        return not np.any(self.occupied_spaces[x:x+width, y:y+height])
+        return not np.any(self._occupied_rows(x, width)[:, y:y+height])
 
     # 2.7 code ref
     def _mark_occupied(self, pos, size):
         x, y = pos
         width, height = size
-        self.occupied_spaces[x:x+width, y:y+height] = True
+        if self._free_index is not None:
+            self._free_index.add(pos, ~self._occupied_rows(x, width)[:, y:y+height])
+        self._fill_occupied(x, y, width, height)
+
+    # 2.7.1 code ref
+    # Mark a rectangle as occupied (clipped to the block), keeping the packed
+    # grid and the free-space index in step
+    def mark_occupied(self, x, y, width, height):
+        x0, y0 = max(x, 0), max(y, 0)
+        width, height = min(x + width, self.size) - x0, min(y + height, self.size) - y0
+        if width > 0 and height > 0:
+            self._mark_occupied((x0, y0), (width, height))
 
     # 2.8 code ref
     def add_road(self, position):
@@ -187,46 +400,51 @@ class Block:
             raise ValueError(
                 "Invalid position. Choose 'top', 'bottom', 'left', or 'right'.")
 
-        road = Road(pos, length, orientation, self.initial_temp)
-        self.items.append(road)
+        road = Road(pos, length, orientation, self.initial_temp, self.engine)
+        self._attach_slots(road.slot)
+        self.item_counts['Road'] += 1
         self._mark_occupied(pos, (road.width, road.height))
+        self._layout_changed(road)
         return True
 
     # 2.9 code ref
     def generate_rgb_view(self):
-        grid = np.ones((self.size, self.size, 3), dtype=np.uint8) * self.rgb
-        for item in self.items:
-            topleft = item.get_topleft()
-            img = item.get_image()
-            cx_start, ry_start = topleft
-            cx_stop = cx_start + img.shape[1]
-            ry_stop = ry_start + img.shape[0]
-            grid[ry_start:ry_stop, cx_start:cx_stop] = img
+        grid = np.full((self.size, self.size, 3), self.rgb, dtype=np.uint8)
+        for kind, cx_start, ry_start, width, height in self._item_rects():
+            grid[ry_start:ry_start+height, cx_start:cx_start+width] = ITEM_CLASSES[kind].rgb
         return grid
 
+    # 2.9.1 code ref
+    # (kind, x, y, width, height) of every item, straight from the engine columns
+    def _item_rects(self):
+        engine = self.engine
+        slots = self.item_slots
+        return zip(engine._kind[slots].tolist(), engine._x[slots].tolist(),
+                   engine._y[slots].tolist(), engine._width[slots].tolist(),
+                   engine._height[slots].tolist())
+
     # 2.10 code ref
     def generate_thermal_view(self):
-        grid = np.full((self.size, self.size), self.current_temp)
-        for item in self.items:
-            topleft = item.get_topleft()
-            cx_start, ry_start = topleft
-            if isinstance(item, (Tree, House)):
-                cx_stop = cx_start + item.size
-                ry_stop = ry_start + item.size
-                grid[ry_start:ry_stop, cx_start:cx_stop] = item.current_temp
-            elif isinstance(item, Road):
-                cx_stop = cx_start + item.width
-                ry_stop = ry_start + item.height
-                grid[ry_start:ry_stop, cx_start:cx_stop] = item.current_temp
-        return grid
+        return self.engine.current[self.generate_label_view()]
 
     # 2.11 code ref
     def update_temperatures(self, t):
-        self.current_temp = self.t_mean + self.t_amp * \
-            math.cos(2 * math.pi / 24 * (t - self.t_peak))
-        for item in self.items:
-            item.update_temperature(t)
+        self.engine.update(t, self.slots)
+
+    # 2.13 code ref
+    # Engine slot of the thermal source behind every pixel of the block
+    def generate_label_view(self):
+        grid = np.full((self.size, self.size), self.slot, dtype=np.int32)
+        for slot, (_, cx_start, ry_start, width, height) in zip(self.item_slots.tolist(),
+                                                                 self._item_rects()):
+            grid[ry_start:ry_start+height, cx_start:cx_start+width] = slot
+        return grid
+
+    # 2.14 code ref
+    def _layout_changed(self, item=None):
+        if self.layout is not None:
+            self.layout.invalidate(self, item)
 
     # 2.12 code ref
     def __str__(self):
-        return f"{self.block_type} Block {self.block_number}: topleft={self.topleft}, items={len(self.items)}, temp={self.current_temp:.1f}°C"
+        return f"{self.block_type} Block {self.block_number}: topleft={self.topleft}, items={self._item_count}, temp={self.current_temp:.1f}°C"
@@ -0,0 +1,82 @@
+import argparse
+import os
+
+import numpy as np
+
+from extract import extract_values_from_file
+from layout import build_map
+
+# CONSTANT
+CHUNK_BYTES = 64 * 1024 * 1024
+CUBE_DTYPES = {'float32': np.float32, 'float16': np.float16}
+
+
+# 9.1 code ref
+# Function 17: Times of a cube at a given resolution (hours)
+def cube_times(resolution, start=0.0, stop=24.0):
+    count = int(round((stop - start) / resolution))
+    return start + resolution * np.arange(count)
+
+
+# 9.2 code ref
+# Function 18: Compute the (time x height x width) thermal cube into a .npy file.
+# Frames are produced chunk by chunk and written straight into the memory-mapped
+# output, so peak memory is bounded by the chunk, not by the cube.
+def compute_thermal_cube(thermal_map, path, times, dtype=np.float32, chunk_frames=None):
+    times = np.asarray(times, dtype=float)
+    dtype = np.dtype(dtype)
+    label = thermal_map.label_raster
+    frame_shape = label.shape
+    if chunk_frames is None:
+        chunk_frames = max(1, CHUNK_BYTES // (label.size * 8))
+
+    cube = np.lib.format.open_memmap(
+        path, mode='w+', dtype=dtype, shape=(len(times),) + frame_shape)
+    for start in range(0, len(times), chunk_frames):
+        stop = min(start + chunk_frames, len(times))
+        temps = thermal_map.engine.temperatures(times[start:stop]).astype(dtype)
+        np.take(temps, label, axis=1, out=cube[start:stop], mode='clip')
+        cube.flush()
+    del cube
+
+    np.save(times_path(path), times)
+    return np.load(path, mmap_mode='r')
+
+
+# 9.3 code ref
+# Function 19: Sidecar file holding the time (hours) of every cube frame
+def times_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}_times{ext or '.npy'}"
+
+
+# 9.4 code ref
+def main(argv=None):
+    from utils import calculate_block_size
+
+    parser = argparse.ArgumentParser(
+        description="Compute a whole-day thermal cube as a memory-mapped .npy file.")
+    parser.add_argument('--input', default='input.txt', help="layout config file")
+    parser.add_argument('--output', default='./result/thermal_cube.npy')
+    parser.add_argument('--resolution', type=float, default=6.0,
+                        help="time resolution in minutes")
+    parser.add_argument('--start', type=float, default=0.0, help="first hour")
+    parser.add_argument('--stop', type=float, default=24.0, help="last hour (exclusive)")
+    parser.add_argument('--dtype', choices=sorted(CUBE_DTYPES), default='float32')
+    parser.add_argument('--chunk-frames', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    num_blocks, num_rows, num_yards, num_grounds, num_rivers, num_houses, num_trees, _ = \
+        extract_values_from_file(args.input)
+    map_shape = (num_rows, num_blocks // num_rows)
+    thermal_map = build_map(num_blocks, map_shape, (num_yards, num_grounds, num_rivers),
+                            num_houses, num_trees, calculate_block_size(num_blocks))
+
+    times = cube_times(args.resolution / 60, args.start, args.stop)
+    cube = compute_thermal_cube(thermal_map, args.output, times,
+                                CUBE_DTYPES[args.dtype], args.chunk_frames)
+    print(f"Saved thermal cube {cube.shape} ({cube.dtype}) to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from extract import extract_values_from_file
+from layout import build_map
+
+# CONSTANTS
+# Effective lateral diffusivity per material, m^2/h with PIXEL_SIZE metres per pixel
+CONDUCTIVITY = {
+    'Yard': 1.0,
+    'Ground': 1.0,
+    'River': 4.0,
+    'Tree': 0.5,
+    'House': 0.5,
+    'Road': 1.5,
+}
+RELAXATION_TIME = 1.0   # hours for a pixel to relax towards its diurnal forcing
+PIXEL_SIZE = 1.0
+SAFETY = 0.9
+BAND_ROWS = 128
+
+
+# 13.0 code ref
+# Explicit finite-volume heat diffusion over the full canvas:
+#   dT/dt = div(k grad T) / dx^2 + (F(t) - T) / tau
+# k comes from the material of every pixel (label raster -> slot kind), and the
+# forcing F is the existing per-slot diurnal cosine. Zero-flux borders are
+# ghost cells replicating the edge. The state lives in a padded array so a
+# step is pure slicing, computed per band of rows on a thread pool.
+class DiffusionSolver:
+    # 13.1 code ref
+    def __init__(self, thermal_map, t0=0.0, conductivity=None, relaxation_time=RELAXATION_TIME,
+                 pixel_size=PIXEL_SIZE, workers=None, band_rows=BAND_ROWS):
+        conductivity = {**CONDUCTIVITY, **(conductivity or {})}
+        self.thermal_map = thermal_map
+        self.label = thermal_map.label_raster
+        self.height, self.width = self.label.shape
+        self.relaxation_time = relaxation_time
+        self.inv_dx2 = 1.0 / pixel_size**2
+
+        kinds = thermal_map.slot_kinds()
+        slot_k = np.array([conductivity[kind] for kind in kinds])
+        k = slot_k[self.label]
+        # Face conductivities (harmonic mean); border faces carry no flux
+        self.kx = np.zeros((self.height, self.width + 1))
+        self.kx[:, 1:-1] = harmonic_mean(k[:, :-1], k[:, 1:])
+        self.ky = np.zeros((self.height + 1, self.width))
+        self.ky[1:-1] = harmonic_mean(k[:-1], k[1:])
+
+        # Forward Euler is stable while dt * (8 k_max / dx^2 + 1 / tau) <= 2
+        self.dt = SAFETY * 2 / (8 * k.max() * self.inv_dx2 + 1 / relaxation_time)
+
+        self.bands = [(start, min(start + band_rows, self.height))
+                      for start in range(0, self.height, band_rows)]
+        self.workers = workers or os.cpu_count()
+        self._pool = ThreadPoolExecutor(self.workers) if self.workers > 1 else None
+
+        self._state = np.empty((self.height + 2, self.width + 2))
+        self._next = np.empty_like(self._state)
+        self.time = t0
+        self._temps = thermal_map.engine.temperatures(t0)
+        self.field[...] = self._temps[self.label]
+        self._fill_ghosts(self._state)
+
+        self.steps = 0
+        self.elapsed = 0.0
+
+    # 13.2 code ref
+    @property
+    def field(self):
+        return self._state[1:-1, 1:-1]
+
+    # 13.3 code ref
+    @property
+    def cells_per_second(self):
+        if self.elapsed == 0:
+            return 0.0
+        return self.steps * self.height * self.width / self.elapsed
+
+    # 13.4 code ref
+    def _fill_ghosts(self, state):
+        state[0, 1:-1] = state[1, 1:-1]
+        state[-1, 1:-1] = state[-2, 1:-1]
+        state[:, 0] = state[:, 1]
+        state[:, -1] = state[:, -2]
+
+    # 13.5 code ref
+    def _step_band(self, band, dt):
+        start, stop = band
+        state = self._state
+        center = state[start+1:stop+1, 1:-1]
+        flux_x = self.kx[start:stop] * np.diff(state[start+1:stop+1], axis=1)
+        flux_y = self.ky[start:stop+1] * np.diff(state[start:stop+2, 1:-1], axis=0)
+        divergence = (flux_x[:, 1:] - flux_x[:, :-1] + flux_y[1:] - flux_y[:-1]) * self.inv_dx2
+        forcing = np.take(self._temps, self.label[start:stop])
+        forcing -= center
+        forcing /= self.relaxation_time
+        divergence += forcing
+        divergence *= dt
+        np.add(center, divergence, out=self._next[start+1:stop+1, 1:-1])
+
+    # 13.6 code ref
+    def step(self, dt=None):
+        dt = min(dt or self.dt, self.dt)
+        self._temps = self.thermal_map.engine.temperatures(self.time)
+        begin = time.perf_counter()
+        if self._pool is None:
+            for band in self.bands:
+                self._step_band(band, dt)
+        else:
+            list(self._pool.map(lambda band: self._step_band(band, dt), self.bands))
+        self._fill_ghosts(self._next)
+        self._state, self._next = self._next, self._state
+        self.elapsed += time.perf_counter() - begin
+        self.steps += 1
+        self.time += dt
+        return self.field
+
+    # 13.7 code ref
+    # Step forward to t_end; the solver cannot go back in time
+    def advance(self, t_end):
+        if t_end < self.time - 1e-9:
+            raise ValueError(f"cannot advance back to t={t_end:.4f}h from t={self.time:.4f}h")
+        while self.time < t_end - 1e-9:
+            self.step(t_end - self.time)
+        return self.field
+
+    # 13.8 code ref
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+
+# 13.9 code ref
+# Function 32: Element-wise harmonic mean, 0 where both sides are 0
+def harmonic_mean(a, b):
+    total = a + b
+    return np.divide(2 * a * b, total, out=np.zeros_like(total), where=total > 0)
+
+
+# 13.9.1 code ref
+# Function 69: Spin the solver up for one day from its start time, then save
+# the field at every clock hour in `times` as diffusion_<hour>h.npy. Hours
+# are visited in the order they come after the start, wrapping past
+# midnight, so the solver only ever moves forward. Yields (hour, path).
+def save_fields(solver, times, directory):
+    os.makedirs(directory, exist_ok=True)
+    start = solver.time
+    solver.advance(start + 24)
+    for hour in sorted(times, key=lambda hour: (hour - start) % 24):
+        solver.advance(start + 24 + (hour - start) % 24)
+        path = os.path.join(directory, f"diffusion_{hour:.2f}h.npy")
+        np.save(path, solver.field.astype(np.float32))
+        yield hour, path
+
+
+# 13.10 code ref
+def main(argv=None):
+    from utils import calculate_block_size
+
+    parser = argparse.ArgumentParser(
+        description="Run the heat-diffusion physics mode and save the field at given hours.")
+    parser.add_argument('--input', default='input.txt', help="layout config file")
+    parser.add_argument('--start', type=float, default=0.0, help="start hour")
+    parser.add_argument('--times', type=float, nargs='+', default=[14.0],
+                        help="hours at which to save the field")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--directory', default='./result')
+    args = parser.parse_args(argv)
+
+    num_blocks, num_rows, num_yards, num_grounds, num_rivers, num_houses, num_trees, _ = \
+        extract_values_from_file(args.input)
+    map_shape = (num_rows, num_blocks // num_rows)
+    thermal_map = build_map(num_blocks, map_shape, (num_yards, num_grounds, num_rivers),
+                            num_houses, num_trees, calculate_block_size(num_blocks))
+
+    solver = DiffusionSolver(thermal_map, args.start, workers=args.workers)
+    for hour, path in save_fields(solver, args.times, args.directory):
+        print(f"Saved diffusion field at {hour:.2f}h to {path}")
+    solver.close()
+    print(f"dt = {solver.dt * 60:.2f} min, {solver.steps} steps, "
+          f"{solver.cells_per_second / 1e6:.1f} M cells/s")
+
+
+if __name__ == "__main__":
+    main()
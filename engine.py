@@ -0,0 +1,156 @@
+import math
+
+import numpy as np
+
+# CONSTANTS
+OMEGA = 2 * math.pi / 24
+INITIAL_CAPACITY = 1024
+# Column name -> dtype. Thermal parameters, then the geometry of the block or
+# item behind each slot: a kind code, the owning block's slot, and the
+# position/extent in pixels relative to the owning block.
+COLUMNS = {
+    '_t_mean': np.float64,
+    '_t_amp': np.float64,
+    '_t_peak': np.float64,
+    '_a': np.float64,
+    '_b': np.float64,
+    '_current': np.float64,
+    '_kind': np.uint8,
+    '_owner': np.int32,
+    '_x': np.int16,
+    '_y': np.int16,
+    '_width': np.int16,
+    '_height': np.int16,
+}
+
+
+# 7.0 code ref
+# Struct-of-arrays store for the diurnal model and geometry of every block and
+# item. T(t) = t_mean + t_amp * cos(OMEGA * (t - t_peak)) is expanded to
+# t_mean + a * cos(OMEGA * t) + b * sin(OMEGA * t), so a whole layout is
+# evaluated with two multiply-adds per slot and no per-slot trigonometry.
+class ThermalEngine:
+    # 7.1 code ref
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        capacity = max(1, int(capacity))
+        self.size = 0
+        for name, dtype in COLUMNS.items():
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    # 7.2 code ref
+    @property
+    def t_mean(self):
+        return self._t_mean[:self.size]
+
+    @property
+    def t_amp(self):
+        return self._t_amp[:self.size]
+
+    @property
+    def t_peak(self):
+        return self._t_peak[:self.size]
+
+    @property
+    def current(self):
+        return self._current[:self.size]
+
+    # 7.3 code ref
+    def _grow(self, needed):
+        capacity = len(self._t_mean)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name, dtype in COLUMNS.items():
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    # 7.3.1 code ref
+    # Drop the spare capacity left by doubling (e.g. once a layout is built)
+    def trim(self):
+        for name in COLUMNS:
+            setattr(self, name, getattr(self, name)[:max(1, self.size)].copy())
+
+    # 7.4 code ref
+    def register(self, t_mean, t_amp, t_peak, current):
+        slot = self.size
+        self._grow(slot + 1)
+        self.size = slot + 1
+        self._current[slot] = current
+        self.set_params(slot, t_mean, t_amp, t_peak)
+        return slot
+
+    # 7.5 code ref
+    def register_many(self, t_mean, t_amp, t_peak, current):
+        t_mean, t_amp, t_peak, current = np.broadcast_arrays(
+            np.asarray(t_mean, dtype=float), np.asarray(t_amp, dtype=float),
+            np.asarray(t_peak, dtype=float), np.asarray(current, dtype=float))
+        count = t_mean.size
+        start = self.size
+        self._grow(start + count)
+        self.size = start + count
+        self._current[start:self.size] = current
+        self.set_params(slice(start, self.size), t_mean, t_amp, t_peak)
+        return np.arange(start, self.size)
+
+    # 7.6 code ref
+    def set_params(self, slots, t_mean, t_amp, t_peak):
+        self._t_mean[slots] = t_mean
+        self._t_amp[slots] = t_amp
+        self._t_peak[slots] = t_peak
+        phase = OMEGA * self._t_peak[slots]
+        self._a[slots] = self._t_amp[slots] * np.cos(phase)
+        self._b[slots] = self._t_amp[slots] * np.sin(phase)
+
+    # 7.6.1 code ref
+    def set_geometry(self, slots, kind, owner, x, y, width, height):
+        self._kind[slots] = kind
+        self._owner[slots] = owner
+        self._x[slots] = x
+        self._y[slots] = y
+        self._width[slots] = width
+        self._height[slots] = height
+
+    # 7.6.2 code ref
+    @property
+    def kind(self):
+        return self._kind[:self.size]
+
+    @property
+    def owner(self):
+        return self._owner[:self.size]
+
+    # 7.7 code ref
+    # Scalar t returns shape (n,), a vector of times returns (len(t), n).
+    def temperatures(self, t, slots=None, out=None):
+        if slots is None:
+            slots = slice(0, self.size)
+        t_mean = self._t_mean[slots]
+        a = self._a[slots]
+        b = self._b[slots]
+        if np.ndim(t) == 0:
+            result = np.multiply(a, math.cos(OMEGA * t), out=out)
+            result += b * math.sin(OMEGA * t)
+            result += t_mean
+            return result
+        times = np.asarray(t, dtype=float)
+        basis = np.stack([np.cos(OMEGA * times), np.sin(OMEGA * times)], axis=1)
+        result = np.matmul(basis, np.stack([a, b]), out=out)
+        result += t_mean
+        return result
+
+    # 7.8 code ref
+    def update(self, t, slots=None):
+        if slots is None:
+            self.temperatures(t, out=self._current[:self.size])
+        else:
+            self._current[slots] = self.temperatures(t, slots)
+        return self.current
+
+    # 7.9 code ref
+    # Slots whose current temperature moved more than epsilon away from
+    # `reference` (e.g. the temperatures last drawn on screen)
+    def changed_slots(self, reference, epsilon):
+        return np.flatnonzero(np.abs(self.current - reference[:self.size]) > epsilon)
@@ -0,0 +1,138 @@
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from cube import cube_times
+from extract import extract_values_from_file
+from layout import build_map
+
+# CONSTANTS
+BLOCK_TYPE_NAMES = ('Yard', 'Ground', 'River')
+RESOLUTION = 0.25       # hours between evaluated times
+STATISTICS = ('mean', 'std', 'min', 'max')
+
+
+# 15.1 code ref
+# Function 35: Build and simulate one layout and return its metrics. The layout
+# only depends on `seed` (a SeedSequence), never on the worker running it.
+def run_replicate(config, seed, times):
+    rng = np.random.default_rng(seed)
+    thermal_map = build_map(config['num_blocks'], config['map_shape'],
+                            config['block_distribution'], config['num_houses'],
+                            config['num_trees'], config['block_size'], rng)
+    engine = thermal_map.engine
+    pixels = np.bincount(thermal_map.label_raster.ravel(), minlength=engine.size)
+    visible = pixels > 0
+    temps = engine.temperatures(times)
+
+    map_mean = temps @ pixels / pixels.sum()
+    peak_frame = int(np.argmax(temps[:, visible].max(axis=1)))
+    metrics = {
+        'houses': sum(block.item_counts['House'] for block in thermal_map),
+        'trees': sum(block.item_counts['Tree'] for block in thermal_map),
+        'mean_temp': float(map_mean.mean()),
+        'peak_temp': float(temps[peak_frame, visible].max()),
+        'peak_time': float(times[peak_frame]),
+        'peak_mean_temp': float(map_mean.max()),
+    }
+
+    # Every slot (block or item) counts towards the type of the block owning it
+    owner = np.empty(engine.size, dtype='<U6')
+    for block in thermal_map:
+        owner[block.slots] = block.block_type
+    daily = temps.mean(axis=0)
+    for block_type in BLOCK_TYPE_NAMES:
+        weights = np.where(owner == block_type, pixels, 0)
+        total = weights.sum()
+        metrics[f'{block_type.lower()}_mean_temp'] = \
+            float(daily @ weights / total) if total else float('nan')
+    return metrics
+
+
+# 15.2 code ref
+def _run_replicate(task):
+    index, config, seed, times = task
+    return {'replicate': index, **run_replicate(config, seed, times)}
+
+
+# 15.3 code ref
+# Function 36: Run `replicates` seeded layouts of one configuration on a
+# process pool. Replicate i always gets the i-th child of SeedSequence(seed),
+# so results are identical for any number of workers.
+def run_ensemble(config, replicates, seed=None, workers=None, resolution=RESOLUTION):
+    times = cube_times(resolution)
+    seeds = np.random.SeedSequence(seed).spawn(replicates)
+    tasks = [(index, config, child, times) for index, child in enumerate(seeds)]
+    workers = workers or os.cpu_count()
+    if workers <= 1:
+        return [_run_replicate(task) for task in tasks]
+    with ProcessPoolExecutor(workers) as pool:
+        chunksize = max(1, replicates // (4 * workers))
+        return list(pool.map(_run_replicate, tasks, chunksize=chunksize))
+
+
+# 15.4 code ref
+# Function 37: One row per metric with its statistics across replicates
+def summarize(results):
+    rows = []
+    for metric in results[0]:
+        if metric == 'replicate':
+            continue
+        values = np.array([result[metric] for result in results], dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            continue
+        rows.append([metric, values.mean(), values.std(), values.min(), values.max()])
+    return rows
+
+
+# 15.5 code ref
+def write_results(results, path):
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+# 15.6 code ref
+def main(argv=None):
+    from tabulate import tabulate
+
+    from utils import calculate_block_size
+
+    parser = argparse.ArgumentParser(
+        description="Run a Monte Carlo ensemble of seeded layouts for one configuration.")
+    parser.add_argument('--input', default='input.txt', help="layout config file")
+    parser.add_argument('--replicates', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=None, help="base seed of the ensemble")
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--resolution', type=float, default=RESOLUTION * 60,
+                        help="time resolution in minutes")
+    parser.add_argument('--output', default='./result/ensemble.csv',
+                        help="per-replicate metrics (CSV)")
+    args = parser.parse_args(argv)
+
+    num_blocks, num_rows, num_yards, num_grounds, num_rivers, num_houses, num_trees, _ = \
+        extract_values_from_file(args.input)
+    config = {
+        'num_blocks': num_blocks,
+        'map_shape': (num_rows, num_blocks // num_rows),
+        'block_distribution': (num_yards, num_grounds, num_rivers),
+        'num_houses': num_houses,
+        'num_trees': num_trees,
+        'block_size': calculate_block_size(num_blocks),
+    }
+    seed = np.random.SeedSequence(args.seed)
+    results = run_ensemble(config, args.replicates, seed.entropy, args.workers,
+                           args.resolution / 60)
+    write_results(results, args.output)
+    print(tabulate(summarize(results), headers=['Metric', *STATISTICS],
+                   tablefmt='fancy_grid', floatfmt='.3f'))
+    print(f"Ensemble seed {seed.entropy}; per-replicate metrics saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
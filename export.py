@@ -0,0 +1,276 @@
+import argparse
+import os
+import shutil
+import struct
+import subprocess
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from extract import extract_values_from_file
+from layout import build_map
+from profiling import PROFILER
+from shading import DAY_OF_YEAR, LATITUDE, ShadingModel
+
+# CONSTANTS
+VMIN = 5
+VMAX = 40
+CMAP = 'Spectral_r'
+LUT_SIZE = 256
+CHUNK_FRAMES = 8
+
+_WORKER = {}
+
+
+# 10.1 code ref
+# Function 20: Colormap lookup table, (LUT_SIZE, 3) uint8
+def colormap_lut(cmap=CMAP, size=LUT_SIZE):
+    from matplotlib import colormaps
+
+    colors = colormaps[cmap].resampled(size)(np.arange(size))[:, :3]
+    return (colors * 255 + 0.5).astype(np.uint8)
+
+
+# 10.2 code ref
+# Function 21: Quantize temperatures to LUT indices (same binning as imshow)
+def temperature_indices(temps, vmin=VMIN, vmax=VMAX):
+    scaled = (np.asarray(temps) - vmin) * (LUT_SIZE / (vmax - vmin))
+    return np.clip(scaled, 0, LUT_SIZE - 1).astype(np.uint8)
+
+
+# 10.3 code ref
+# Function 22: Nearest-neighbour resample of a raster to (width, height)
+def resample_raster(raster, size):
+    width, height = size
+    rows = np.arange(height) * raster.shape[0] // height
+    cols = np.arange(width) * raster.shape[1] // width
+    return raster[np.ix_(rows, cols)]
+
+
+# 10.4 code ref
+# Function 23: Index frames for a chunk of times. Temperatures are quantized
+# per engine slot, so the per-pixel work is a single uint8 gather. `label`
+# may instead be a (PyramidLevel, size) pair: frames are then averaged at
+# that level and resampled to `size`. `shades` (see shading_terms) lowers
+# shaded pixels before quantizing.
+def render_index_frames(engine, label, times, vmin=VMIN, vmax=VMAX, shades=None):
+    if isinstance(label, tuple):
+        level, size = label
+        frames = level.frames(engine.temperatures(times))
+        width, height = size
+        rows = np.arange(height) * frames.shape[1] // height
+        cols = np.arange(width) * frames.shape[2] // width
+        frames = frames[:, rows[:, None], cols]
+    elif shades is None or not any(shades):
+        indices = temperature_indices(engine.temperatures(times), vmin, vmax)
+        return np.take(indices, label, axis=1)
+    else:
+        frames = np.take(engine.temperatures(times).astype(np.float32), label, axis=1)
+    for frame, shade in zip(frames, shades or ()):
+        if shade is not None:
+            coverage, cooling = shade
+            if coverage.dtype == bool:
+                np.subtract(frame, cooling, out=frame, where=coverage)
+            else:
+                frame -= cooling * coverage
+    return temperature_indices(frames, vmin, vmax)
+
+
+# 10.4.1 code ref
+# Function 68: Per-time (coverage, cooling) of a ShadingModel for frames
+# rendered at pyramid `level` and resampled to `size` (width, height), None
+# for times with the sun down
+def shading_terms(shading, times, level=0, size=None):
+    terms = []
+    for t in times:
+        coverage = shading.coverage(t, level)
+        if coverage is not None and size is not None:
+            coverage = resample_raster(coverage, size)
+        terms.append(None if coverage is None else (coverage, shading.cooling_at(t)))
+    return terms
+
+
+# 10.5 code ref
+def _init_worker(engine, label, lut, fmt, duration, vmin, vmax):
+    _WORKER.update(engine=engine, label=label, lut=lut, fmt=fmt,
+                   duration=duration, vmin=vmin, vmax=vmax)
+
+
+# 10.6 code ref
+# Frames are encoded in the worker so only compact payloads cross processes
+def _encode_chunk(chunk):
+    times, shades = chunk
+    frames = render_index_frames(_WORKER['engine'], _WORKER['label'], times,
+                                 _WORKER['vmin'], _WORKER['vmax'], shades)
+    if _WORKER['fmt'] == 'gif':
+        from PIL import GifImagePlugin, Image
+
+        payloads = []
+        for frame in frames:
+            image = Image.fromarray(frame, mode='L')
+            payloads.append(b''.join(GifImagePlugin.getdata(
+                image, duration=_WORKER['duration'])))
+        return payloads
+    return [_WORKER['lut'][frame].tobytes() for frame in frames]
+
+
+# 10.7 code ref
+# Streaming GIF writer: global palette is the colormap LUT, so index frames
+# decode to the same colours as lut[index]
+class GifWriter:
+    def __init__(self, path, size, lut, loop=0):
+        width, height = size
+        self.file = open(path, 'wb')
+        palette = np.zeros((LUT_SIZE, 3), dtype=np.uint8)
+        palette[:len(lut)] = lut
+        self.file.write(b'GIF89a' + width.to_bytes(2, 'little') +
+                        height.to_bytes(2, 'little') + bytes([0xF7, 0, 0]))
+        self.file.write(palette.tobytes())
+        self.file.write(b'!\xff\x0bNETSCAPE2.0\x03\x01' +
+                        loop.to_bytes(2, 'little') + b'\x00')
+
+    def write(self, payload):
+        self.file.write(payload)
+
+    def close(self):
+        self.file.write(b';')
+        self.file.close()
+
+
+# 10.8 code ref
+# Streaming MP4 writer piping raw rgb24 frames into ffmpeg
+class FFmpegWriter:
+    def __init__(self, path, size, fps):
+        ffmpeg = shutil.which('ffmpeg')
+        if ffmpeg is None:
+            raise RuntimeError("ffmpeg is required to write video files.")
+        width, height = size
+        self.process = subprocess.Popen(
+            [ffmpeg, '-y', '-loglevel', 'error', '-f', 'rawvideo', '-pix_fmt', 'rgb24',
+             '-s', f'{width}x{height}', '-r', str(fps), '-i', '-',
+             '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2', '-pix_fmt', 'yuv420p', path],
+            stdin=subprocess.PIPE)
+
+    def write(self, payload):
+        self.process.stdin.write(payload)
+
+    def close(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError("ffmpeg failed to encode the animation.")
+
+
+# 10.9 code ref
+# Function 24: Results of fn over items in order, with at most `window` in flight
+def _bounded_map(pool, fn, items, window):
+    pending = deque()
+    for item in items:
+        pending.append(pool.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+# 10.10 code ref
+# Function 25: Headless thermal animation export (GIF or MP4)
+def export_animation(thermal_map, path, frames=240, fps=30, size=None, start=0.0,
+                     stop=24.0, workers=None, chunk_frames=CHUNK_FRAMES,
+                     vmin=VMIN, vmax=VMAX, cmap=CMAP, shading=None):
+    times = start + (stop - start) * np.arange(frames) / frames
+    label = thermal_map.label_raster
+    level, shade_size = 0, size
+    if size is not None:
+        # Shrinking past 2x averages the frames at the matching pyramid level
+        level = thermal_map.pyramid().level_for((size[1], size[0]))
+        label = (thermal_map.pyramid().level(level), tuple(size)) if level \
+            else resample_raster(label, size)
+    else:
+        size = (label.shape[1], label.shape[0])
+    lut = colormap_lut(cmap)
+    fmt = 'gif' if path.lower().endswith('.gif') else 'video'
+    writer = GifWriter(path, size, lut) if fmt == 'gif' else FFmpegWriter(path, size, fps)
+
+    initargs = (thermal_map.engine, label, lut, fmt, 1000 / fps, vmin, vmax)
+    # Shading terms are built chunk by chunk as the pool asks for work
+    chunks = ((chunk, None if shading is None else
+               shading_terms(shading, chunk, level, shade_size))
+              for chunk in (times[i:i+chunk_frames] for i in range(0, frames, chunk_frames)))
+    workers = os.cpu_count() if workers is None else workers
+    PROFILER.count('export_frames', frames)
+    try:
+        with PROFILER.stage('export'):
+            if workers <= 1:
+                _init_worker(*initargs)
+                results = map(_encode_chunk, chunks)
+                for payloads in results:
+                    for payload in payloads:
+                        writer.write(payload)
+            else:
+                with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                         initargs=initargs) as pool:
+                    for payloads in _bounded_map(pool, _encode_chunk, chunks, 2 * workers):
+                        for payload in payloads:
+                            writer.write(payload)
+    finally:
+        writer.close()
+    return path
+
+
+# 10.12 code ref
+# Function 58: Encode a uint8 (height, width) image as a PNG. With a
+# (n, 3) palette the pixels are palette indices, otherwise grey levels;
+# (height, width, 3) images are written as RGB.
+def encode_png(image, palette=None, level=6):
+    height, width = image.shape[:2]
+    colour = 2 if image.ndim == 3 else 3 if palette is not None else 0
+    rows = np.zeros((height, 1 + image[0].size), dtype=np.uint8)   # filter byte 0 per row
+    rows[:, 1:] = image.reshape(height, -1)
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + \
+            struct.pack('>I', zlib.crc32(kind + data))
+
+    header = chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, colour, 0, 0, 0))
+    plte = chunk(b'PLTE', np.asarray(palette, dtype=np.uint8).tobytes()) if colour == 3 else b''
+    return b'\x89PNG\r\n\x1a\n' + header + plte + \
+        chunk(b'IDAT', zlib.compress(rows.tobytes(), level)) + chunk(b'IEND', b'')
+
+
+# 10.11 code ref
+def main(argv=None):
+    from utils import calculate_block_size
+
+    parser = argparse.ArgumentParser(
+        description="Export the thermal animation headlessly (GIF, or MP4 via ffmpeg).")
+    parser.add_argument('--input', default='input.txt', help="layout config file")
+    parser.add_argument('--output', default='./result/thermal_view_animation.gif')
+    parser.add_argument('--frames', type=int, default=240)
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--size', default=None, help="output resolution, e.g. 640x480")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: all cores, 1 = in-process)")
+    parser.add_argument('--shading', action='store_true',
+                        help="cool pixels shaded by houses and trees (see shading.py)")
+    parser.add_argument('--latitude', type=float, default=LATITUDE)
+    parser.add_argument('--day-of-year', type=int, default=DAY_OF_YEAR)
+    args = parser.parse_args(argv)
+
+    num_blocks, num_rows, num_yards, num_grounds, num_rivers, num_houses, num_trees, _ = \
+        extract_values_from_file(args.input)
+    map_shape = (num_rows, num_blocks // num_rows)
+    thermal_map = build_map(num_blocks, map_shape, (num_yards, num_grounds, num_rivers),
+                            num_houses, num_trees, calculate_block_size(num_blocks))
+
+    shading = ShadingModel(thermal_map, args.latitude, args.day_of_year) \
+        if args.shading else None
+    size = tuple(int(v) for v in args.size.split('x')) if args.size else None
+    export_animation(thermal_map, args.output, args.frames, args.fps, size,
+                     workers=args.workers, shading=shading)
+    print(f"Saved animation to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,36 @@
+# CONSTANT
+# Config key -> (position in the returned tuple, parser)
+CONFIG_KEYS = {
+    "Num Blocks": (0, int),
+    "Num Rows": (1, int),
+    "Num Block Yards": (2, int),
+    "Num Block Ground": (3, int),
+    "Num Block River": (4, int),
+    "Num houses of each Block Yard": (5, int),
+    "Num trees of each Block Ground": (6, int),
+    "The time (0-24) to view Thermal Map": (7, float),
+}
+
+
 # 5.0 code ref
 def extract_values_from_file(file_path='input.txt'):
+    values = [None] * len(CONFIG_KEYS)
     with open(file_path, 'r') as file:
-        for line in file:
+        for line_number, line in enumerate(file, 1):
             if ':' in line:
                 key, value = line.split(':', 1)
                 key = key.strip()
                 value = value.strip()
 
-                if key == "Num Blocks":
-                    num_blocks = int(value)
-                elif key == "Num Rows":
-                    num_rows = int(value)
-                elif key == "Num Block Yards":
-                    num_yards = int(value)
-                elif key == "Num Block Ground":
-                    num_grounds = int(value)
-                elif key == "Num Block River":
-                    num_rivers = int(value)
-                elif key == "Num houses of each Block Yard":
-                    num_houses = int(value)
-                elif key == "Num trees of each Block Ground":
-                    num_trees = int(value)
-                elif key == "The time (0-24) to view Thermal Map":
-                    specific_time = int(value)
-    return (num_blocks, num_rows, num_yards, num_grounds, num_rivers, num_houses, num_trees, specific_time)
+                if key in CONFIG_KEYS:
+                    index, parse = CONFIG_KEYS[key]
+                    try:
+                        values[index] = parse(value)
+                    except ValueError:
+                        raise ValueError(
+                            f"{file_path}:{line_number}: invalid value for '{key}': {value!r}") from None
+
+    missing = [key for key, (index, _) in CONFIG_KEYS.items() if values[index] is None]
+    if missing:
+        raise ValueError(f"{file_path}: missing keys: {', '.join(missing)}")
+    return tuple(values)
@@ -0,0 +1,386 @@
+from collections import OrderedDict
+
+import numpy as np
+
+from cano import ITEM_CLASSES, Block
+from engine import ThermalEngine
+from placement import place_items
+
+# CONSTANTS
+EPSILON = 0.05                  # °C a slot may drift before its pixels are redrawn
+FULL_REDRAW_FRACTION = 0.2      # redraw the whole frame past this dirty fraction
+FRAME_CACHE_BYTES = 256 * 2**20 # frames kept by ThermalMap.frame_at
+TIME_QUANTUM = 1 / 60           # hours; frame_at times are rounded to this step
+
+
+# 8.17 code ref
+# LRU cache of read-only thermal frames keyed by (layout version, quantized
+# time, variant), bounded by a byte budget. Frames of an older layout version are
+# dropped as soon as a newer version is asked for.
+class FrameCache:
+    # 8.17.1 code ref
+    def __init__(self, max_bytes=FRAME_CACHE_BYTES, quantum=TIME_QUANTUM):
+        self.max_bytes = max_bytes
+        self.quantum = quantum
+        self._frames = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # 8.17.2 code ref
+    # Cached frame for time t, or render(quantized t) stored as read-only.
+    # `variant` tells apart frames of one time rendered differently (shading).
+    def get(self, version, t, render, variant=None):
+        key = (version, round(t / self.quantum), variant)
+        frame = self._frames.get(key)
+        if frame is not None:
+            self._frames.move_to_end(key)
+            self.hits += 1
+            return frame
+        self.misses += 1
+        if self._frames and next(iter(self._frames))[0] != version:
+            self.evictions += len(self._frames)
+            self.clear()
+        frame = render(key[1] * self.quantum)
+        frame.flags.writeable = False
+        if frame.nbytes <= self.max_bytes:
+            self._frames[key] = frame
+            self.bytes += frame.nbytes
+            while self.bytes > self.max_bytes:
+                _, evicted = self._frames.popitem(last=False)
+                self.bytes -= evicted.nbytes
+                self.evictions += 1
+        return frame
+
+    # 8.17.3 code ref
+    def clear(self):
+        self._frames.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'frames': len(self._frames), 'bytes': self.bytes, 'max_bytes': self.max_bytes}
+
+
+# 8.0 code ref
+# A map of blocks sharing one ThermalEngine. Behaves like the list of blocks
+# it wraps, and owns the rasters derived from the (static) layout geometry.
+class ThermalMap:
+    # 8.1 code ref
+    def __init__(self, blocks, block_size, map_shape, engine=None):
+        self.blocks = list(blocks)
+        self.block_size = block_size
+        self.map_shape = tuple(map_shape)
+        self.height = self.map_shape[0] * block_size
+        self.width = self.map_shape[1] * block_size
+        if engine is None:
+            engine = self.blocks[0].engine if self.blocks else ThermalEngine()
+        if any(block.engine is not engine for block in self.blocks):
+            raise ValueError("All blocks of a ThermalMap must share one ThermalEngine.")
+        self.engine = engine
+        self._init_caches()
+        for block in self.blocks:
+            block.layout = self
+
+    # 8.1.1 code ref
+    # Layout version and the rasters, frames and caches derived from it;
+    # shared with subclasses that build their blocks and engine differently
+    def _init_caches(self):
+        self.version = 0
+        self._label_raster = None
+        self._rgb_image = None
+        self._thermal_buffer = None
+        self._frame = None
+        self._geometry = None
+        self._pyramid = None
+        self.frame_cache = FrameCache()
+        self.dirty_rects = np.empty((0, 4), dtype=np.intp)
+
+    # 8.2 code ref
+    def __len__(self):
+        return len(self.blocks)
+
+    def __iter__(self):
+        return iter(self.blocks)
+
+    def __getitem__(self, index):
+        return self.blocks[index]
+
+    # 8.3 code ref
+    # Called by Block whenever add_item/add_road changes its geometry. Items are
+    # always painted over what is already in the block, so a new item only
+    # needs its own rectangle repainted in the cached rasters.
+    def invalidate(self, block=None, item=None):
+        self.version += 1
+        if block is None:
+            self._label_raster = None
+            self._rgb_image = None
+            return
+        cx_start, ry_start = block.topleft
+        if item is not None:
+            dx, dy = item.get_topleft()
+            width, height = item.get_extent()
+            region = (slice(ry_start+dy, ry_start+dy+height),
+                      slice(cx_start+dx, cx_start+dx+width))
+            if self._label_raster is not None:
+                self._label_raster[region] = item.slot
+            if self._rgb_image is not None:
+                self._rgb_image[region] = item.rgb
+        else:
+            region = (slice(ry_start, ry_start+self.block_size),
+                      slice(cx_start, cx_start+self.block_size))
+            if self._label_raster is not None:
+                self._label_raster[region] = block.generate_label_view()
+            if self._rgb_image is not None:
+                self._rgb_image[region] = block.generate_rgb_view()
+
+    # 8.4 code ref
+    @property
+    def label_raster(self):
+        if self._label_raster is None:
+            self._label_raster = self._build_label_raster()
+        return self._label_raster
+
+    # 8.5 code ref
+    def _build_label_raster(self):
+        raster = np.zeros((self.height, self.width), dtype=np.int32)
+        size = self.block_size
+        for block in self.blocks:
+            cx_start, ry_start = block.topleft
+            raster[ry_start:ry_start+size,
+                   cx_start:cx_start+size] = block.generate_label_view()
+        return raster
+
+    # 8.10 code ref
+    # Static uint8 composite, built once and patched by invalidate()
+    def rgb_image(self):
+        if self._rgb_image is None:
+            self._rgb_image = self._build_rgb_image()
+        return self._rgb_image
+
+    # 8.11 code ref
+    def _build_rgb_image(self):
+        grid = np.zeros((self.height, self.width, 3), dtype=np.uint8)
+        size = self.block_size
+        for block in self.blocks:
+            cx_start, ry_start = block.topleft
+            grid[ry_start:ry_start+size,
+                 cx_start:cx_start+size] = block.generate_rgb_view()
+        return grid
+
+    # 8.12 code ref
+    def add_items_bulk(self, item_type, n, strategy='random', min_distance=None, rng=None):
+        return place_items(self.blocks, item_type, n, strategy, min_distance, rng)
+
+    # 8.13 code ref
+    # Material of every engine slot: the block type, or the item class name
+    def slot_kinds(self):
+        block_slots, _, block_types = self._block_table()
+        names = np.array([''] + [ITEM_CLASSES[kind].__name__ for kind in sorted(ITEM_CLASSES)],
+                         dtype='<U6')
+        kinds = names[self.engine.kind]
+        kinds[block_slots] = block_types
+        return kinds
+
+    # 8.13.1 code ref
+    # (slot, topleft, type) of every block as arrays, in map order
+    def _block_table(self):
+        return (np.array([block.slot for block in self.blocks], dtype=np.intp),
+                np.array([block.topleft for block in self.blocks], dtype=np.intp).reshape(-1, 2),
+                np.array([block.block_type for block in self.blocks]))
+
+    def block_numbers(self):
+        return np.array([block.block_number for block in self.blocks], dtype=np.int32)
+
+    # 8.6 code ref
+    def update_temperatures(self, t):
+        return self.engine.update(t)
+
+    # 8.7 code ref
+    # One gather per frame. Without `out` the map's own buffer is reused, so
+    # the returned array is overwritten by the next call.
+    def thermal_image(self, out=None):
+        if out is None:
+            if self._thermal_buffer is None:
+                self._thermal_buffer = np.empty(
+                    (self.height, self.width), dtype=np.float32)
+            out = self._thermal_buffer
+        temps = self.engine.current.astype(out.dtype, copy=False)
+        return np.take(temps, self.label_raster, out=out, mode='clip')
+
+    # 8.7.1 code ref
+    # Read-only frame at time t (rounded to frame_cache.quantum), served from
+    # the frame cache. Unlike thermal_image it leaves engine.current untouched.
+    # With a ShadingModel the frame is shaded and cached separately.
+    def frame_at(self, t, shading=None):
+        if shading is None:
+            return self.frame_cache.get(self.version, t, self._render_frame)
+        return self.frame_cache.get(self.version, t,
+                                    lambda t: shading.apply(self._render_frame(t), t), shading)
+
+    def _render_frame(self, t):
+        temps = self.engine.temperatures(t).astype(np.float32)
+        return np.take(temps, self.label_raster, mode='clip')
+
+    # 8.14 code ref
+    # Canvas rectangle (row0, row1, col0, col1) of every slot and the index of
+    # the block owning it; rebuilt whenever the layout version changes
+    def slot_geometry(self):
+        if self._geometry is not None and self._geometry[0] == self.version:
+            return self._geometry[1:]
+        engine = self.engine
+        block_slots, topleft, _ = self._block_table()
+        block_index = np.zeros(engine.size, dtype=np.intp)
+        block_index[block_slots] = np.arange(len(block_slots))
+        owner = block_index[engine.owner]
+        x = topleft[owner, 0] + engine._x[:engine.size]
+        y = topleft[owner, 1] + engine._y[:engine.size]
+        rects = np.stack([y, y + engine._height[:engine.size],
+                          x, x + engine._width[:engine.size]], axis=1)
+        is_block = engine.kind == 0
+        self._geometry = (self.version, rects, owner, is_block)
+        return rects, owner, is_block
+
+    # 8.16 code ref
+    # Mipmap pyramid of the thermal and RGB rasters (see mipmap.py)
+    def pyramid(self):
+        if self._pyramid is None:
+            from mipmap import MipmapPyramid
+            self._pyramid = MipmapPyramid(self)
+        return self._pyramid
+
+    # 8.15 code ref
+    # Persistent frame redrawn only where a slot drifted more than epsilon
+    # since it was last drawn. The frame always equals `shown[label]`, so the
+    # error on screen stays below epsilon. The rewritten regions are kept in
+    # `dirty_rects`, a (k, 4) array of (row0, row1, col0, col1), for viewers
+    # that blit. With a ShadingModel, `t` is the time engine.current was
+    # updated to; shaded pixels are lowered, and the whole frame is redrawn
+    # when the shadows move or their cooling drifts more than epsilon.
+    def incremental_frame(self, epsilon=EPSILON, shading=None, t=None):
+        full = np.array([[0, self.height, 0, self.width]], dtype=np.intp)
+        if shading is not None and t is None:
+            raise ValueError("incremental_frame needs t with shading")
+        shade = (shading, shading.quantized_sun(t), shading.cooling_at(t)) \
+            if shading is not None else None
+        if self._frame is None or self._frame[0] != self.version or \
+                not _same_shade(self._frame[3], shade, epsilon):
+            shown = self.engine.current.astype(np.float32)
+            frame = np.take(shown, self.label_raster, mode='clip')
+            if shading is not None:
+                shading.apply(frame, t)
+            self._frame = (self.version, frame, shown, shade)
+            self.dirty_rects = full
+            return frame
+        _, frame, shown, shade = self._frame
+        changed = self.engine.changed_slots(shown, epsilon)
+        shown[changed] = self.engine.current[changed]
+        if len(changed) == 0:
+            self.dirty_rects = full[:0]
+            return frame
+
+        rects, owner, is_block = self.slot_geometry()
+        # Items inside a block that is redrawn anyway need no rectangle of their own
+        changed_blocks = changed[is_block[changed]]
+        covered = np.zeros(len(self), dtype=bool)
+        covered[owner[changed_blocks]] = True
+        changed = changed[is_block[changed] | ~covered[owner[changed]]]
+        dirty = rects[changed]
+        area = ((dirty[:, 1] - dirty[:, 0]) * (dirty[:, 3] - dirty[:, 2])).sum()
+        if area > FULL_REDRAW_FRACTION * self.height * self.width:
+            np.take(shown, self.label_raster, out=frame, mode='clip')
+            if shade is not None:
+                shading.apply(frame, t)
+            self.dirty_rects = full
+            return frame
+
+        # One gather per distinct rectangle shape (blocks, roads, houses, trees)
+        label = self.label_raster
+        heights = dirty[:, 1] - dirty[:, 0]
+        widths = dirty[:, 3] - dirty[:, 2]
+        keys = heights * (self.width + 1) + widths
+        order = np.argsort(keys, kind='stable')
+        bounds = np.flatnonzero(np.diff(keys[order], prepend=-1, append=-1))
+        for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            members = dirty[order[start:stop]]
+            height, width = heights[order[start]], widths[order[start]]
+            offsets = (np.arange(height)[:, None] * self.width + np.arange(width)).ravel()
+            pixels = (members[:, 0] * self.width + members[:, 2])[:, None] + offsets
+            values = shown.take(label.take(pixels))
+            if shade is not None:
+                mask = shading.mask(t)
+                if mask is not None:
+                    values -= shade[2] * mask.take(pixels)
+            np.put(frame, pixels, values)
+        self.dirty_rects = dirty
+        return frame
+
+
+# 8.15.1 code ref
+# Whether frames drawn under two shading states (model, quantized sun,
+# cooling) differ by at most epsilon
+def _same_shade(drawn, shade, epsilon):
+    if drawn is None or shade is None:
+        return drawn is shade
+    return drawn[0] is shade[0] and drawn[1] == shade[1] and abs(drawn[2] - shade[2]) <= epsilon
+
+
+# 8.8 code ref
+# Function 15: Create the blocks of a map (shuffled block types, shared engine).
+# `rng` is a numpy Generator; pass a seeded one for a reproducible layout.
+def create_blocks(num_blocks, map_shape, block_distribution, block_size, rng=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    engine = ThermalEngine()
+    blocks = []
+    block_types = ['Yard'] * block_distribution[0] + ['Ground'] * \
+        block_distribution[1] + ['River'] * block_distribution[2]
+    block_types = [block_types[i] for i in rng.permutation(len(block_types))]
+
+    for i in range(num_blocks):
+        row = i // map_shape[1]
+        col = i % map_shape[1]
+        topleft = (col * block_size, row * block_size)
+        block = Block(block_size, topleft, block_types[i], i, engine)
+        blocks.append(block)
+    return ThermalMap(blocks, block_size, map_shape, engine)
+
+
+# 6.1 code ref
+# Function 6: Add items to blocks
+
+
+def add_items_to_blocks(blocks, num_houses, num_trees, rng=None):
+    houses_added = place_items(blocks, 'House', num_houses, rng=rng)
+    trees_added = place_items(blocks, 'Tree', num_trees, rng=rng)
+    return houses_added, trees_added
+
+# 6.2 code ref
+# Function 7: Add roads to blocks
+
+
+def add_roads_to_blocks(blocks, map_shape):
+    rows, cols = map_shape
+    for i, block in enumerate(blocks):
+        if block.block_type != 'River':
+            if i < cols or (i >= cols and blocks[i - cols].block_type != 'River'):
+                block.add_road('top')
+            if i >= cols * (rows - 1) or (i < cols * (rows - 1) and blocks[i + cols].block_type != 'River'):
+                block.add_road('bottom')
+            if i % cols == 0 or (i % cols != 0 and blocks[i - 1].block_type != 'River'):
+                block.add_road('left')
+            if (i + 1) % cols == 0 or ((i + 1) % cols != 0 and blocks[i + 1].block_type != 'River'):
+                block.add_road('right')
+
+
+# 8.9 code ref
+# Function 16: Build a complete map without any prompt
+def build_map(num_blocks, map_shape, block_distribution, num_houses, num_trees, block_size,
+              rng=None):
+    if rng is None:
+        rng = np.random.default_rng()
+    thermal_map = create_blocks(num_blocks, map_shape, block_distribution, block_size, rng)
+    add_roads_to_blocks(thermal_map, map_shape)
+    add_items_to_blocks(thermal_map, num_houses, num_trees, rng)
+    return thermal_map
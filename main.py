@@ -1,76 +1,17 @@
-import random
+import argparse
 
 from colorama import Fore, Style, init
-from tabulate import tabulate
-from utils import *
-from visualization import *
 
-from cano import *
 from extract import extract_values_from_file
+from layout import add_items_to_blocks, add_roads_to_blocks, create_blocks
+from profiling import PROFILER, stage_rows
+from prompts import ATTEMPS, get_block_distribution, get_map_shape, get_mode_choice, get_valid_input
+from utils import calculate_block_size, calculate_max_items
+from visualization import animate_thermal_view_func, generate_and_display_views, update_temperatures
 
-# CONSTANT
-TOTAL_PIXELS = 300 * 300
-ATTEMPS = 3
-
-# Initialize colorama
-init(autoreset=True)
-
-# 6.1 code ref
-# Function 6: Add items to blocks
-
-
-def add_items_to_blocks(blocks, num_houses, num_trees):
-    yard_blocks = [block for block in blocks if block.block_type == 'Yard']
-    ground_blocks = [block for block in blocks if block.block_type == 'Ground']
-
-    houses_added = 0
-    trees_added = 0
-
-    # Add houses
-    while houses_added < num_houses and yard_blocks:
-        block = random.choice(yard_blocks)
-        house_size = block.house_size
-        free_space = block._find_random_free_space(house_size)
-        if free_space:
-            block.add_item('House', free_space)
-            houses_added += 1
-        else:
-            yard_blocks.remove(block)
-
-    # Add trees
-    while trees_added < num_trees and ground_blocks:
-        block = random.choice(ground_blocks)
-        tree_size = block.tree_size
-        free_space = block._find_random_free_space(tree_size)
-        if free_space:
-            block.add_item('Tree', free_space)
-            trees_added += 1
-        else:
-            ground_blocks.remove(block)
-
-    return houses_added, trees_added
-
-# 6.2 code ref
-# Function 7: Add roads to blocks
-
-
-def add_roads_to_blocks(blocks, map_shape):
-    rows, cols = map_shape
-    for i, block in enumerate(blocks):
-        if block.block_type != 'River':
-            if i < cols or (i >= cols and blocks[i - cols].block_type != 'River'):
-                block.add_road('top')
-            if i >= cols * (rows - 1) or (i < cols * (rows - 1) and blocks[i + cols].block_type != 'River'):
-                block.add_road('bottom')
-            if i % cols == 0 or (i % cols != 0 and blocks[i - 1].block_type != 'River'):
-                block.add_road('left')
-            if (i + 1) % cols == 0 or ((i + 1) % cols != 0 and blocks[i + 1].block_type != 'River'):
-                block.add_road('right')
 
 # 6.3 code ref
 # Function 12: Ask for simulation
-
-
 def ask_for_simulation():
     print(Fore.GREEN + "┌" + "─" * 56 + "┐")
     print(Fore.GREEN + "│ Do you want to simulate the thermal view over time?    │")
@@ -86,8 +27,38 @@ def ask_for_simulation():
         return ask_for_simulation()
 
 
+# 6.5 code ref
+# Function 51: Command-line flags (profiling only; everything else is prompted)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Canopy thermal simulation.")
+    parser.add_argument('--profile', metavar='REPORT.json', default=None,
+                        help="record per-stage timings, counters and memory peaks")
+    parser.add_argument('--cprofile', metavar='FILE.prof', default=None,
+                        help="also dump cProfile stats (requires --profile)")
+    return parser.parse_args(argv)
+
+
 # 6.4 code ref
-def main():
+def main(argv=None):
+    args = parse_args(argv)
+    init(autoreset=True)
+    if args.profile:
+        PROFILER.enable(cprofile=args.cprofile is not None)
+    try:
+        run()
+    finally:
+        if args.profile:
+            PROFILER.disable()
+            PROFILER.write(args.profile, args.cprofile)
+            from tabulate import tabulate
+            print(tabulate(stage_rows(PROFILER.report()),
+                           headers=['Stage', 'Calls', 'Total ms', 'Mean ms', 'Peak MiB'],
+                           tablefmt="fancy_grid"))
+            print(f"Profile report saved to {args.profile}")
+
+
+# 6.6 code ref
+def run():
     # 6.4.1 code ref
     mode = get_mode_choice()
 
@@ -110,20 +81,12 @@ def main():
         block_size = calculate_block_size(num_blocks)
 
     # 6.4.4 code ref
-    blocks = []
-    block_types = ['Yard'] * block_distribution[0] + ['Ground'] * \
-        block_distribution[1] + ['River'] * block_distribution[2]
-    random.shuffle(block_types)
-
-    for i in range(num_blocks):
-        row = i // map_shape[1]
-        col = i % map_shape[1]
-        topleft = (col * block_size, row * block_size)
-        block = Block(block_size, topleft, block_types[i], i)
-        blocks.append(block)
+    with PROFILER.stage('layout'):
+        blocks = create_blocks(num_blocks, map_shape, block_distribution, block_size)
 
     # 6.4.5 code ref
-    add_roads_to_blocks(blocks, map_shape)
+    with PROFILER.stage('roads'):
+        add_roads_to_blocks(blocks, map_shape)
 
     # 6.4.6 code ref
     max_houses, max_trees = calculate_max_items(blocks)
@@ -145,8 +108,9 @@ def main():
         num_trees = min(num_trees, max_trees)
 
     # 6.4.8 code ref
-    houses_added, trees_added = add_items_to_blocks(
-        blocks, num_houses, num_trees)
+    with PROFILER.stage('items'):
+        houses_added, trees_added = add_items_to_blocks(
+            blocks, num_houses, num_trees)
 
     # 6.4.9 code ref
     print()
@@ -164,6 +128,7 @@ def main():
         ["Requested trees", f"{num_trees}"]
     ]
 
+    from tabulate import tabulate
     print(tabulate(table_data, headers="firstrow", tablefmt="fancy_grid"))
 
     # 6.4.10 code ref
@@ -193,11 +158,13 @@ def main():
     update_temperatures(blocks, time)
 
     # 6.4.13 code ref
-    generate_and_display_views(blocks, block_size, map_shape, num_blocks, time)
+    with PROFILER.stage('views'):
+        generate_and_display_views(blocks, block_size, map_shape, num_blocks, time)
 
     # 6.4.14 code ref
     if ask_for_simulation():
-        animate_thermal_view_func(blocks, block_size, map_shape, num_blocks)
+        with PROFILER.stage('animation'):
+            animate_thermal_view_func(blocks, block_size, map_shape, num_blocks)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,225 @@
+import numpy as np
+
+from layout import EPSILON, FULL_REDRAW_FRACTION
+
+# CONSTANTS
+MIN_SIZE = 64                   # stop halving once the longer side is this small
+
+
+# 21.1 code ref
+# Function 53: Halve a raster by 2x2 block averaging (float32). An odd last
+# row/column is edge-padded, i.e. averaged on its own.
+def downsample(image):
+    height, width = image.shape[:2]
+    if height % 2 or width % 2:
+        pad = ((0, height % 2), (0, width % 2)) + ((0, 0),) * (image.ndim - 2)
+        image = np.pad(image, pad, mode='edge')
+    return image.reshape(image.shape[0] // 2, 2, image.shape[1] // 2, 2,
+                         *image.shape[2:]).mean(axis=(1, 3), dtype=np.float32)
+
+
+# 21.2 code ref
+# One downsampled level of the label raster as weighted (pixel, slot) entries,
+# sorted by slot: a level pixel is the weighted sum of the temperatures of the
+# slots under it, so a thermal level is a single bincount over the entries and
+# depends on nothing but the temperatures.
+class PyramidLevel:
+    __slots__ = ('shape', 'pixel', 'slot', 'weight')
+
+    def __init__(self, shape, pixel, slot, weight):
+        order = np.argsort(slot, kind='stable')
+        self.shape = shape
+        self.pixel = pixel[order]
+        self.slot = slot[order]
+        self.weight = weight[order].astype(np.float32)
+
+    # 21.2.1 code ref
+    # Level 1 straight from the label raster: a 2x2 cell covered by one slot
+    # is one entry, any other cell four entries of weight 1/4
+    @classmethod
+    def from_label(cls, label):
+        height, width = label.shape
+        if height % 2 or width % 2:
+            label = np.pad(label, ((0, height % 2), (0, width % 2)), mode='edge')
+        quads = [label[0::2, 0::2].ravel(), label[0::2, 1::2].ravel(),
+                 label[1::2, 0::2].ravel(), label[1::2, 1::2].ravel()]
+        uniform = (quads[0] == quads[1]) & (quads[0] == quads[2]) & (quads[0] == quads[3])
+        whole = np.flatnonzero(uniform)
+        mixed = np.flatnonzero(~uniform)
+        pixel = np.concatenate([whole, np.repeat(mixed, 4)])
+        slot = np.concatenate([quads[0][whole], np.stack([quad[mixed] for quad in quads],
+                                                         axis=1).ravel()])
+        weight = np.concatenate([np.ones(len(whole)), np.full(4 * len(mixed), 0.25)])
+        return cls((label.shape[0] // 2, label.shape[1] // 2), pixel, slot, weight)
+
+    # 21.2.2 code ref
+    # Next level: every entry moves to its parent pixel with a quarter of its
+    # weight (half, or all, on an odd last row/column), and duplicates merge
+    def halve(self):
+        height, width = self.shape
+        rows, cols = np.divmod(self.pixel, width)
+        weight = self.weight / np.float32(4)
+        if height % 2:
+            weight[rows == height - 1] *= 2
+        if width % 2:
+            weight[cols == width - 1] *= 2
+        shape = ((height + 1) // 2, (width + 1) // 2)
+        parent = (rows // 2) * shape[1] + cols // 2
+        slots = int(self.slot.max()) + 1
+        unique, inverse = np.unique(parent.astype(np.int64) * slots + self.slot,
+                                    return_inverse=True)
+        pixel, slot = np.divmod(unique, slots)
+        return PyramidLevel(shape, pixel, slot, np.bincount(inverse, weight))
+
+    # 21.2.3 code ref
+    # Level frame(s) for temperatures of shape (n,) or (times, n)
+    def frames(self, temps):
+        temps = np.asarray(temps)
+        size = self.shape[0] * self.shape[1]
+        if temps.ndim == 1:
+            return np.bincount(self.pixel, self.weight * temps[self.slot],
+                               minlength=size).astype(np.float32).reshape(self.shape)
+        count = len(temps)
+        pixel = (self.pixel + size * np.arange(count)[:, None]).ravel()
+        return np.bincount(pixel, (self.weight * temps[:, self.slot]).ravel(),
+                           minlength=count * size).astype(np.float32).reshape(
+                               count, *self.shape)
+
+    # 21.2.4 code ref
+    # Entry indices of the given (sorted) slots
+    def entries_of(self, slots):
+        starts = np.searchsorted(self.slot, slots, side='left')
+        counts = np.searchsorted(self.slot, slots, side='right') - starts
+        return np.repeat(starts - np.cumsum(counts) + counts, counts) + \
+            np.arange(counts.sum()), counts
+
+
+# 21.3 code ref
+# Progressively halved thermal and RGB rasters of a ThermalMap. Level 0 is
+# full resolution, level L averages 2^L x 2^L pixels. Levels are built on
+# first use and dropped when the layout changes; the live thermal levels are
+# patched only where slot temperatures drifted more than epsilon. Windows are
+# (row0, row1, col0, col1) in full-resolution pixels.
+class MipmapPyramid:
+    # 21.3.1 code ref
+    def __init__(self, thermal_map, min_size=MIN_SIZE):
+        self.map = thermal_map
+        self.shapes = [(thermal_map.height, thermal_map.width)]
+        while max(self.shapes[-1]) > min_size:
+            height, width = self.shapes[-1]
+            self.shapes.append(((height + 1) // 2, (width + 1) // 2))
+        self._version = None
+        self._sync()
+
+    def _sync(self):
+        if self._version != self.map.version:
+            self._version = self.map.version
+            self._levels = [None] * len(self.shapes)
+            self._rgb = [None] * len(self.shapes)
+            self._frames = [None] * len(self.shapes)
+
+    @property
+    def levels(self):
+        return len(self.shapes)
+
+    # 21.3.2 code ref
+    def level(self, level):
+        self._sync()
+        if self._levels[level] is None:
+            self._levels[level] = PyramidLevel.from_label(self.map.label_raster) \
+                if level == 1 else self.level(level - 1).halve()
+        return self._levels[level]
+
+    # 21.3.3 code ref
+    # Coarsest level that still has at least one source pixel per output pixel
+    def level_for(self, out_shape, window=None):
+        row0, row1, col0, col1 = self._window(window)
+        scale = min((row1 - row0) / max(out_shape[0], 1), (col1 - col0) / max(out_shape[1], 1))
+        if scale < 2:
+            return 0
+        return min(int(np.log2(scale)), self.levels - 1)
+
+    def _window(self, window):
+        return (0, self.map.height, 0, self.map.width) if window is None else window
+
+    # 21.3.4 code ref
+    # Level pixels covering a window, and their imshow extent in full-resolution
+    # pixel coordinates
+    def _cells(self, level, window):
+        row0, row1, col0, col1 = self._window(window)
+        scale = 2 ** level
+        return row0 // scale, -(-row1 // scale), col0 // scale, -(-col1 // scale)
+
+    def view_shape(self, level, window=None):
+        row0, row1, col0, col1 = self._cells(level, window)
+        return row1 - row0, col1 - col0
+
+    def extent(self, level, window=None):
+        scale = 2 ** level
+        row0, row1, col0, col1 = self._cells(level, window)
+        return (col0 * scale - 0.5, min(col1 * scale, self.map.width) - 0.5,
+                min(row1 * scale, self.map.height) - 0.5, row0 * scale - 0.5)
+
+    # 21.3.5 code ref
+    # Thermal raster of a window at a level, for `temps` (n,) or, without
+    # them, for the engine's current temperatures. Level 0 gathers only the
+    # window's pixels.
+    def thermal_view(self, level, window=None, temps=None, out=None):
+        row0, row1, col0, col1 = self._cells(level, window)
+        if level == 0:
+            temps = self.map.engine.current if temps is None else temps
+            return np.take(np.asarray(temps, dtype=np.float32),
+                           self.map.label_raster[row0:row1, col0:col1], out=out, mode='clip')
+        frame = self.thermal(level) if temps is None else self.level(level).frames(temps)
+        if out is None:
+            return frame[row0:row1, col0:col1]
+        out[...] = frame[row0:row1, col0:col1]
+        return out
+
+    # 21.3.6 code ref
+    def rgb_view(self, level, window=None):
+        row0, row1, col0, col1 = self._cells(level, window)
+        return self.rgb(level)[row0:row1, col0:col1]
+
+    def rgb(self, level):
+        self._sync()
+        if level == 0:
+            return self.map.rgb_image()
+        self._rgb_average(level)
+        return self._rgb[level][1]
+
+    def _rgb_average(self, level):
+        if level == 0:
+            return self.map.rgb_image()
+        if self._rgb[level] is None:
+            averaged = downsample(self._rgb_average(level - 1))
+            self._rgb[level] = (averaged, (averaged + 0.5).astype(np.uint8))
+        return self._rgb[level][0]
+
+    # 21.3.7 code ref
+    # Live thermal level: entries of the slots that drifted more than epsilon
+    # are added as deltas; past FULL_REDRAW_FRACTION of the entries the level
+    # is recomputed in one bincount
+    def thermal(self, level, epsilon=EPSILON):
+        if level == 0:
+            return self.map.incremental_frame(epsilon)
+        pyramid_level = self.level(level)
+        current = self.map.engine.current
+        if self._frames[level] is None:
+            shown = current.astype(np.float32)
+            self._frames[level] = (pyramid_level.frames(shown), shown)
+            return self._frames[level][0]
+        frame, shown = self._frames[level]
+        changed = self.map.engine.changed_slots(shown, epsilon)
+        if len(changed) == 0:
+            return frame
+        entries, counts = pyramid_level.entries_of(changed)
+        if len(entries) > FULL_REDRAW_FRACTION * len(pyramid_level.slot):
+            shown[changed] = current[changed]
+            frame[...] = pyramid_level.frames(shown)
+            return frame
+        delta = np.repeat(current[changed] - shown[changed], counts)
+        np.add.at(frame.reshape(-1), pyramid_level.pixel[entries],
+                  pyramid_level.weight[entries] * delta)
+        shown[changed] = current[changed]
+        return frame
@@ -0,0 +1,259 @@
+import numpy as np
+
+from profiling import PROFILER
+
+
+# 11.0 code ref
+# Summed-area table over a block's occupancy grid (indexed [x, y] like
+# Block.occupied_spaces). table[i, j] is the number of occupied cells in
+# occupied[:i, :j], so any window is checked with four lookups.
+class FreeSpaceIndex:
+    # 11.1 code ref
+    def __init__(self, occupied):
+        self.shape = occupied.shape
+        self.table = np.zeros((self.shape[0] + 1, self.shape[1] + 1), dtype=np.int32)
+        np.cumsum(occupied, axis=0, out=self.table[1:, 1:])
+        np.cumsum(self.table[1:, 1:], axis=1, out=self.table[1:, 1:])
+
+    # 11.2 code ref
+    # Occupied-cell count of every width x height window, indexed by top-left
+    def window_sums(self, width, height):
+        table = self.table
+        return (table[width:, height:] - table[:-width, height:]
+                - table[width:, :-height] + table[:-width, :-height])
+
+    # 11.3 code ref
+    # Every valid top-left position for the size, as a (k, 2) array of (x, y)
+    def free_positions(self, width, height):
+        if width > self.shape[0] or height > self.shape[1]:
+            return np.empty((0, 2), dtype=np.intp)
+        return np.argwhere(self.window_sums(width, height) == 0)
+
+    # 11.4 code ref
+    def sample(self, width, height, rng):
+        if width > self.shape[0] or height > self.shape[1]:
+            return None
+        free = np.flatnonzero(self.window_sums(width, height) == 0)
+        if len(free) == 0:
+            return None
+        x, y = divmod(int(free[rng(len(free))]), self.shape[1] - height + 1)
+        return x, y
+
+    # 11.5 code ref
+    # Incremental update for cells newly marked at pos; `added` is the bool
+    # mask of cells that went from free to occupied inside the rectangle.
+    def add(self, pos, added):
+        x, y = pos
+        width, height = added.shape
+        partial = added.cumsum(axis=0, dtype=np.int32).cumsum(axis=1)
+        table = self.table
+        table[x+1:x+width+1, y+1:y+height+1] += partial
+        table[x+width+1:, y+1:y+height+1] += partial[-1, :]
+        table[x+1:x+width+1, y+height+1:] += partial[:, -1:]
+        table[x+width+1:, y+height+1:] += partial[-1, -1]
+
+
+# 11.6 code ref
+# Function 26: Conflict footprint between two top-left positions, as rows of
+# (dx, half_width in y). Squares of `size` conflict when they overlap; with
+# min_distance, positions closer than it conflict as well (Poisson-disk).
+def conflict_footprint(size, min_distance=None):
+    reach = size
+    if min_distance is not None:
+        reach = max(reach, int(np.ceil(min_distance)))
+    rows = []
+    for dx in range(-reach + 1, reach):
+        half_width = size - 1 if abs(dx) < size else -1
+        if min_distance is not None and abs(dx) < min_distance:
+            half_width = max(half_width, int(np.ceil(np.sqrt(min_distance**2 - dx**2))) - 1)
+        if half_width >= 0:
+            rows.append((dx, half_width))
+    return rows
+
+
+# 11.6.1 code ref
+# Runs of consecutive footprint rows sharing a half_width, as
+# [half_width, first dx, last dx]
+def footprint_runs(footprint):
+    runs = []
+    for dx, half_width in footprint:
+        if runs and runs[-1][0] == half_width and runs[-1][2] == dx - 1:
+            runs[-1][2] = dx
+        else:
+            runs.append([half_width, dx, dx])
+    return runs
+
+
+# 11.7 code ref
+# Function 27: Reduce over every run of `width` consecutive cells along
+# `axis` with an idempotent op (min, or), in O(log width) passes. `span` is
+# the run length `values` is already reduced over.
+def sliding_reduce(values, width, op, axis=-1, span=1):
+    values = np.moveaxis(values, axis, -1)
+    while span * 2 <= width:
+        values = op(values[..., :-span], values[..., span:])
+        span *= 2
+    if span < width:
+        values = op(values[..., :values.shape[-1] - (width - span)], values[..., width - span:])
+    return np.moveaxis(values, -1, axis)
+
+
+# 11.7.1 code ref
+# Reduce `values` (B, X, Y) over the footprint of every cell as separable box
+# filters: a y window per distinct half_width, grown from the narrowest to the
+# widest one pass at a time, then an x window per run of rows sharing it.
+def neighbourhood_reduce(values, footprint, op, fill):
+    runs = footprint_runs(footprint)
+    widest = max(run[0] for run in runs)
+    reach = max(max(-run[1], run[2]) for run in runs)
+    width, height = values.shape[1:]
+    window = np.pad(values, ((0, 0), (reach, reach), (widest, widest)), constant_values=fill)
+    out = np.full(values.shape, fill, dtype=values.dtype)
+    span = 1
+    for half_width in sorted({run[0] for run in runs}):
+        window = sliding_reduce(window, 2 * half_width + 1, op, span=span)
+        span = 2 * half_width + 1
+        offset = widest - half_width
+        for _, first, last in (run for run in runs if run[0] == half_width):
+            box = window[:, reach + first:reach + last + width, offset:offset + height]
+            op(out, sliding_reduce(box, last - first + 1, op, axis=1), out=out)
+    return out
+
+
+# 11.8 code ref
+# Function 28: Greedy independent set in priority order, computed in parallel
+# rounds: a candidate wins once it has the lowest priority among the live
+# candidates it conflicts with. The result equals accepting candidates one by
+# one in priority order, so random priorities give uniform sequential placement.
+# Conflicts never cross blocks, so rounds run on per-block ranks (uint16 up to
+# 255 x 255 candidate positions) and only on blocks with live candidates.
+# With `caps` (per block) and `n` (in total) the rounds stop once the lowest
+# caps / n priorities of the full result are known; higher winners may be
+# missing from the returned set.
+def greedy_independent_set(candidates, priority, footprint, caps=None, n=None):
+    blocks = len(candidates)
+    cells = candidates[0].size
+    dtype = np.uint16 if cells < np.iinfo(np.uint16).max else np.uint32
+    fill = np.iinfo(dtype).max
+    flat_priority = priority.reshape(blocks, -1)
+    order = np.argsort(flat_priority, axis=1)
+    rank = np.empty(order.shape, dtype=dtype)
+    np.put_along_axis(rank, order, np.arange(cells, dtype=dtype)[None, :], axis=1)
+    if caps is None:
+        caps = np.full(blocks, cells)
+
+    index = np.flatnonzero((caps > 0) & candidates.any(axis=(1, 2)))
+    alive = candidates[index]
+    rank = rank.reshape(candidates.shape)[index]
+    chosen = np.zeros_like(candidates)
+    found_block, found_priority = [], []
+    live = np.where(alive, rank, fill)
+    while len(index):
+        winners = alive & (live == neighbourhood_reduce(live, footprint, np.minimum, fill))
+        member, x, y = np.nonzero(winners)
+        chosen[index[member], x, y] = True
+        found_block.append(index[member])
+        found_priority.append(priority[index[member], x, y])
+        alive &= ~neighbourhood_reduce(winners, footprint, np.logical_or, False)
+
+        # A winner is final in its block's top caps once it ranks below every
+        # live candidate of the block
+        live = np.where(alive, rank, fill)
+        floor = live.reshape(len(index), -1).min(axis=1)
+        floor_priority = np.full(blocks, np.inf)
+        live_blocks = floor < fill
+        floor_priority[index[live_blocks]] = flat_priority[
+            index[live_blocks], order[index[live_blocks], floor[live_blocks]]]
+        block, value = np.concatenate(found_block), np.concatenate(found_priority)
+        settled = np.bincount(block, value < floor_priority[block], minlength=blocks)
+        if n is not None:
+            below = np.bincount(block, value < floor_priority.min(), minlength=blocks)
+            if np.minimum(below, caps).sum() >= n:
+                break
+        keep = live_blocks & (settled[index] < caps[index])
+        if not keep.all():
+            index, alive, rank, live = index[keep], alive[keep], rank[keep], live[keep]
+    return chosen
+
+
+# 11.9 code ref
+# Function 29: Tight packing on a lattice anchored at the first free row/column
+def grid_positions(candidates, size):
+    blocks, width, height = candidates.shape
+    x_any = candidates.any(axis=2)
+    y_any = candidates.any(axis=1)
+    x0 = np.where(x_any.any(axis=1), x_any.argmax(axis=1), 0)[:, None]
+    y0 = np.where(y_any.any(axis=1), y_any.argmax(axis=1), 0)[:, None]
+    xs = np.arange(width)[None, :] - x0
+    ys = np.arange(height)[None, :] - y0
+    on_x = (xs >= 0) & (xs % size == 0)
+    on_y = (ys >= 0) & (ys % size == 0)
+    return candidates & on_x[:, :, None] & on_y[:, None, :]
+
+
+# 11.10 code ref
+# Function 30: Place up to n items of `kind` across blocks in one pass.
+# strategy is 'random' (uniform), 'poisson' (uniform with min_distance between
+# items of this pass) or 'grid' (tight lattice packing). `limits` optionally
+# caps the number of new items per block.
+def place_items(blocks, kind, n, strategy='random', min_distance=None, rng=None, limits=None):
+    if strategy not in ('random', 'poisson', 'grid'):
+        raise ValueError("Invalid strategy. Choose 'random', 'poisson', or 'grid'.")
+    if rng is None:
+        rng = np.random.default_rng()
+    if limits is not None:
+        limits = {id(block): limit for block, limit in zip(blocks, limits)}
+    blocks = [block for block in blocks if block.item_capacity(kind) > 0]
+    if n <= 0 or not blocks:
+        return 0
+    if strategy == 'poisson' and min_distance is None:
+        min_distance = 1.5 * blocks[0].item_size(kind)
+
+    capacity = np.array([block.item_capacity(kind) for block in blocks])
+    if limits is not None:
+        capacity = np.minimum(capacity, [limits[id(block)] for block in blocks])
+
+    groups = {}
+    for index, block in enumerate(blocks):
+        groups.setdefault((block.size, block.item_size(kind)), []).append(index)
+
+    PROFILER.count(f'place_items.{kind}')
+    found = []
+    for (block_size, size), members in groups.items():
+        occupied = np.stack([blocks[i].occupied_spaces for i in members])
+        table = np.zeros((len(members), block_size + 1, block_size + 1), dtype=np.int32)
+        np.cumsum(occupied, axis=1, out=table[:, 1:, 1:])
+        np.cumsum(table[:, 1:, 1:], axis=2, out=table[:, 1:, 1:])
+        candidates = (table[:, size:, size:] - table[:, :-size, size:]
+                      - table[:, size:, :-size] + table[:, :-size, :-size]) == 0
+
+        if strategy == 'grid':
+            chosen = grid_positions(candidates, size)
+            rank = np.cumsum(chosen.reshape(len(members), -1), axis=1).reshape(chosen.shape)
+            priority = rank * len(blocks) + np.asarray(members)[:, None, None]
+        else:
+            priority = rng.random(candidates.shape)
+            radius = min_distance if strategy == 'poisson' else None
+            chosen = greedy_independent_set(
+                candidates, priority, conflict_footprint(size, radius),
+                caps=capacity[members], n=n)
+        member, x, y = np.nonzero(chosen)
+        found.append((np.asarray(members)[member], x, y, priority[member, x, y]))
+
+    block_index, x, y, priority = (np.concatenate(column) for column in zip(*found))
+    order = np.lexsort((priority, block_index))
+    block_index, x, y, priority = block_index[order], x[order], y[order], priority[order]
+    starts = np.searchsorted(block_index, np.arange(len(blocks)))
+    rank = np.arange(len(block_index)) - starts[block_index]
+    keep = np.flatnonzero(rank < capacity[block_index])
+    keep = keep[np.argsort(priority[keep], kind='stable')[:n]]
+    keep.sort()
+
+    block_index, x, y = block_index[keep], x[keep], y[keep]
+    bounds = np.searchsorted(block_index, np.arange(len(blocks) + 1))
+    for index, block in enumerate(blocks):
+        start, stop = bounds[index], bounds[index + 1]
+        PROFILER.record_placement(block, kind, int(capacity[index]), int(stop - start))
+        if stop > start:
+            block._append_items(kind, np.stack([x[start:stop], y[start:stop]], axis=1))
+    return len(keep)
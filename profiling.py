@@ -0,0 +1,132 @@
+import contextlib
+import json
+import time
+import tracemalloc
+
+# CONSTANT
+_DISABLED = contextlib.nullcontext()
+
+
+# 19.0 code ref
+# Process-wide instrumentation. Call sites wrap their work in
+# `with PROFILER.stage(name):` and report counts with PROFILER.count(); while
+# the profiler is disabled stage() hands back one shared null context and the
+# counters return at once, so the hooks cost a method call and nothing else.
+class Profiler:
+    # 19.1 code ref
+    def __init__(self):
+        self.enabled = False
+        self.trace_memory = False
+        self._cprofile = None
+        self.reset()
+
+    # 19.2 code ref
+    def reset(self):
+        self.stages = {}
+        self.counters = {}
+        self.placement = {}
+        self._stack = []
+
+    # 19.3 code ref
+    def enable(self, trace_memory=True, cprofile=False):
+        self.enabled = True
+        self.trace_memory = trace_memory
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if cprofile:
+            import cProfile
+            self._cprofile = cProfile.Profile()
+            self._cprofile.enable()
+
+    # 19.4 code ref
+    def disable(self):
+        self.enabled = False
+        if self._cprofile is not None:
+            self._cprofile.disable()
+        if self.trace_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    # 19.5 code ref
+    def stage(self, name):
+        if not self.enabled:
+            return _DISABLED
+        return self._stage(name)
+
+    # 19.5.1 code ref
+    # Wall time per call, and the peak of traced memory above what was
+    # allocated when the stage started (nested stages share the peak counter,
+    # so every open stage takes the peak in before it is reset)
+    @contextlib.contextmanager
+    def _stage(self, name):
+        frame = {'peak': 0, 'start': 0}
+        if self.trace_memory:
+            current, peak = tracemalloc.get_traced_memory()
+            self._note_peak(peak)
+            tracemalloc.reset_peak()
+            frame['start'] = frame['peak'] = current
+        self._stack.append(frame)
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - begin
+            if self.trace_memory:
+                self._note_peak(tracemalloc.get_traced_memory()[1])
+            self._stack.pop()
+            record = self.stages.setdefault(
+                name, {'calls': 0, 'total': 0.0, 'max': 0.0, 'peak_bytes': 0})
+            record['calls'] += 1
+            record['total'] += elapsed
+            record['max'] = max(record['max'], elapsed)
+            record['peak_bytes'] = max(record['peak_bytes'], frame['peak'] - frame['start'])
+
+    # 19.5.2 code ref
+    def _note_peak(self, peak):
+        for frame in self._stack:
+            frame['peak'] = max(frame['peak'], peak)
+
+    # 19.6 code ref
+    def count(self, name, n=1):
+        if self.enabled:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    # 19.7 code ref
+    # Placement attempts (positions requested) vs successes (items placed) per block
+    def record_placement(self, block, kind, attempts, successes):
+        if not self.enabled:
+            return
+        record = self.placement.setdefault((block.block_number, kind), [0, 0])
+        record[0] += attempts
+        record[1] += successes
+
+    # 19.8 code ref
+    def report(self):
+        return {
+            'stages': {name: dict(record, mean=record['total'] / record['calls'])
+                       for name, record in self.stages.items()},
+            'counters': dict(self.counters),
+            'placement': [{'block': block, 'kind': kind, 'attempts': attempts,
+                           'successes': successes}
+                          for (block, kind), (attempts, successes)
+                          in sorted(self.placement.items())],
+            'memory_traced': self.trace_memory,
+        }
+
+    # 19.9 code ref
+    def write(self, path, cprofile_path=None):
+        with open(path, 'w') as file:
+            json.dump(self.report(), file, indent=2)
+        if cprofile_path is not None and self._cprofile is not None:
+            self._cprofile.dump_stats(cprofile_path)
+
+
+PROFILER = Profiler()
+
+
+# 19.10 code ref
+# Function 50: Stage table (slowest first) for printing
+def stage_rows(report):
+    return [[name, record['calls'], f"{record['total'] * 1e3:.1f}",
+             f"{record['mean'] * 1e3:.2f}", f"{record['peak_bytes'] / 2**20:.1f}"]
+            for name, record in sorted(report['stages'].items(),
+                                       key=lambda entry: -entry[1]['total'])]
@@ -0,0 +1,276 @@
+import argparse
+import asyncio
+import io
+import json
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from analytics import BLOCK_TYPE_NAMES, BUILT_UP, NATURAL
+from export import colormap_lut, encode_png, temperature_indices
+
+# CONSTANTS
+HOST = '127.0.0.1'
+PORT = 8765
+LATENCY_SAMPLES = 1024          # latest latencies kept per route for percentiles
+MAX_LINE = 8192                 # longest request or header line accepted
+ROUTES = ('health', 'metrics', 'layouts', 'layouts/frame', 'layouts/blocks', 'layouts/stats')
+STATUS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+          500: 'Internal Server Error'}
+
+
+# 23.2 code ref
+# Function 59: Serialize an array as .npy bytes
+def encode_npy(array):
+    buffer = io.BytesIO()
+    np.save(buffer, array)
+    return buffer.getvalue()
+
+
+# 23.3 code ref
+# Request count, mean and max latency per route, plus p50/p95 over the
+# latest LATENCY_SAMPLES requests
+class LatencyMetrics:
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.samples = samples
+        self.routes = {}
+
+    def record(self, route, seconds, status):
+        entry = self.routes.setdefault(route, {'count': 0, 'errors': 0, 'total': 0.0,
+                                               'max': 0.0, 'recent': deque(maxlen=self.samples)})
+        entry['count'] += 1
+        entry['errors'] += status >= 400
+        entry['total'] += seconds
+        entry['max'] = max(entry['max'], seconds)
+        entry['recent'].append(seconds)
+
+    def report(self):
+        report = {}
+        for route, entry in self.routes.items():
+            recent = np.array(entry['recent']) * 1e3
+            report[route] = {'count': entry['count'], 'errors': entry['errors'],
+                             'mean_ms': entry['total'] * 1e3 / entry['count'],
+                             'p50_ms': float(np.percentile(recent, 50)),
+                             'p95_ms': float(np.percentile(recent, 95)),
+                             'max_ms': entry['max'] * 1e3}
+        return report
+
+
+# 23.4 code ref
+# In-memory layouts served over HTTP/1.1 (keep-alive) on asyncio streams.
+# Rendering runs on a thread pool; each layout has a lock around its frame
+# cache, and everything else the handlers read is built when the service
+# starts. Times are rounded to the frame cache quantum on every route. Routes:
+#   GET /health, /metrics, /layouts
+#   GET /layouts/<name>/frame?t=<hour>&format=npy|png
+#   GET /layouts/<name>/blocks?t=<hour>
+#   GET /layouts/<name>/stats?t=<hour>
+class ThermalService:
+    # 23.4.1 code ref
+    def __init__(self, layouts, workers=None):
+        self.layouts = dict(layouts)
+        self._locks = {name: threading.Lock() for name in self.layouts}
+        self._tables = {name: self._table(thermal_map)
+                        for name, thermal_map in self.layouts.items()}
+        self.pool = ThreadPoolExecutor(workers)
+        self.metrics = LatencyMetrics()
+        self.lut = colormap_lut()
+
+    # 23.4.1.1 code ref
+    # Per-layout lookups the handlers share across threads: block slots,
+    # numbers and types, and pixel counts, visible slots and block type of
+    # every slot for the area-weighted statistics. Builds the label raster.
+    @staticmethod
+    def _table(thermal_map):
+        engine = thermal_map.engine
+        slots, _, types = thermal_map._block_table()
+        pixels = np.bincount(thermal_map.label_raster.ravel(), minlength=engine.size)
+        block_index = np.zeros(engine.size, dtype=np.intp)
+        block_index[slots] = np.arange(len(slots))
+        return {'slots': slots, 'numbers': thermal_map.block_numbers().tolist(),
+                'types': types.tolist(), 'pixels': pixels, 'visible': np.flatnonzero(pixels),
+                'slot_types': np.asarray(types)[block_index[engine.owner]]}
+
+    # 23.4.2 code ref
+    async def serve(self, host=HOST, port=PORT):
+        return await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                headers = {}
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = header.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip().lower()
+                begin = time.perf_counter()
+                parts = line.decode('latin-1').split()
+                route, status, content_type, body = await self.dispatch(*parts[:2]) \
+                    if len(parts) == 3 else ('other', 400, 'text/plain', b'malformed request\n')
+                keep_alive = len(parts) == 3 and parts[2] == 'HTTP/1.1' and \
+                    headers.get('connection') != 'close'
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS[status]}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(body)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                    .encode('latin-1') + body)
+                await writer.drain()
+                self.metrics.record(route, time.perf_counter() - begin, status)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    # 23.4.3 code ref
+    # (route, status, content type, body) of one request
+    async def dispatch(self, method, target):
+        url = urlsplit(target)
+        parts = [part for part in url.path.split('/') if part]
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        route = '/'.join(parts[:1] + parts[2:3])
+        if route not in ROUTES:
+            route = 'other'      # keeps the metrics keys bounded
+        if method != 'GET':
+            return route, 405, 'text/plain', b'only GET is supported\n'
+        try:
+            if parts == ['health']:
+                return route, 200, 'application/json', b'{"status": "ok"}\n'
+            if parts == ['metrics']:
+                return route, 200, 'application/json', self._json(self._metrics())
+            if parts == ['layouts']:
+                return route, 200, 'application/json', self._json(self._describe())
+            if len(parts) == 3 and parts[0] == 'layouts' and \
+                    parts[2] in ('frame', 'blocks', 'stats'):
+                if parts[1] not in self.layouts:
+                    return route, 404, 'text/plain', f"unknown layout {parts[1]!r}\n".encode()
+                if 't' not in query:
+                    raise ValueError("missing t (hours)")
+                t = float(query['t'])
+                if not np.isfinite(t):
+                    raise ValueError("t must be finite")
+                quantum = self.layouts[parts[1]].frame_cache.quantum
+                t = round(t / quantum) * quantum
+                handler = {'frame': self._frame, 'blocks': self._blocks,
+                           'stats': self._stats}[parts[2]]
+                content_type, body = await asyncio.get_running_loop().run_in_executor(
+                    self.pool, handler, parts[1], t, query)
+                return route, 200, content_type, body
+            return route, 404, 'text/plain', b'not found\n'
+        except (KeyError, ValueError) as error:
+            return route, 400, 'text/plain', f"bad request: {error}\n".encode()
+        except Exception as error:
+            return route, 500, 'text/plain', f"{type(error).__name__}: {error}\n".encode()
+
+    @staticmethod
+    def _json(payload):
+        return (json.dumps(payload) + '\n').encode()
+
+    def _metrics(self):
+        return {'latency': self.metrics.report(),
+                'frame_cache': {name: thermal_map.frame_cache.stats()
+                                for name, thermal_map in self.layouts.items()}}
+
+    def _describe(self):
+        return {name: {'blocks': len(thermal_map), 'map_shape': list(thermal_map.map_shape),
+                       'block_size': thermal_map.block_size,
+                       'pixels': [thermal_map.height, thermal_map.width]}
+                for name, thermal_map in self.layouts.items()}
+
+    # 23.5 code ref
+    # Handlers below run on the worker pool
+    def _frame(self, name, t, query):
+        fmt = query.get('format', 'npy')
+        if fmt not in ('npy', 'png'):
+            raise ValueError("format must be npy or png")
+        with self._locks[name]:
+            frame = self.layouts[name].frame_at(t)
+        if fmt == 'npy':
+            return 'application/octet-stream', encode_npy(frame)
+        return 'image/png', encode_png(temperature_indices(frame), palette=self.lut)
+
+    def _blocks(self, name, t, query):
+        table = self._tables[name]
+        temps = self.layouts[name].engine.temperatures(t, table['slots'])
+        return 'application/json', self._json({
+            't': t, 'block': table['numbers'], 'type': table['types'],
+            'temp': np.round(temps, 4).tolist()})
+
+    # 23.5.1 code ref
+    # Area-weighted statistics straight from slot temperatures (no frame)
+    def _stats(self, name, t, query):
+        table = self._tables[name]
+        pixels, visible, slot_types = table['pixels'], table['visible'], table['slot_types']
+        temps = self.layouts[name].engine.temperatures(t)
+
+        def area_mean(names):
+            weights = np.where(np.isin(slot_types, names), pixels, 0)
+            return float(temps @ weights / weights.sum()) if weights.any() else None
+
+        stats = {'t': t, 'mean': area_mean(BLOCK_TYPE_NAMES),
+                 'min': float(temps[visible].min()), 'max': float(temps[visible].max()),
+                 'types': {block_type: area_mean((block_type,)) for block_type in BLOCK_TYPE_NAMES}}
+        built, natural = area_mean(BUILT_UP), area_mean(NATURAL)
+        stats['uhi'] = built - natural if built is not None and natural is not None else None
+        return 'application/json', self._json(stats)
+
+
+# 23.6 code ref
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve thermal frames, block temperatures and statistics over local HTTP.")
+    parser.add_argument('--input', default='input.txt',
+                        help="config used to generate the 'default' layout")
+    parser.add_argument('--layout', action='append', default=[], metavar='NAME=PATH',
+                        help="serve a snapshot saved by snapshot.py (repeatable)")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT, help="0 picks a free port")
+    parser.add_argument('--workers', type=int, default=None, help="render threads")
+    args = parser.parse_args(argv)
+
+    layouts = {}
+    for entry in args.layout:
+        from snapshot import load_layout
+        name, _, path = entry.partition('=')
+        if not path:
+            parser.error(f"--layout expects NAME=PATH, got {entry!r}")
+        layouts[name] = load_layout(path)
+    if not layouts:
+        from extract import extract_values_from_file
+        from layout import build_map
+        from utils import calculate_block_size
+
+        num_blocks, num_rows, yards, grounds, rivers, houses, trees, _ = \
+            extract_values_from_file(args.input)
+        layouts['default'] = build_map(num_blocks, (num_rows, num_blocks // num_rows),
+                                       (yards, grounds, rivers), houses, trees,
+                                       calculate_block_size(num_blocks),
+                                       np.random.default_rng(args.seed))
+
+    async def run():
+        service = ThermalService(layouts, args.workers)
+        server = await service.serve(args.host, args.port)
+        host, port = server.sockets[0].getsockname()[:2]
+        print(f"Serving {', '.join(layouts)} on http://{host}:{port}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from mipmap import downsample
+
+# CONSTANTS
+# Heights in pixels (one pixel is roughly one metre)
+ITEM_HEIGHTS = {'House': 6.0, 'Tree': 8.0}
+SHADE_COOLING = 6.0     # °C drop of a shaded pixel with the sun at the zenith
+LATITUDE = 10.8
+DAY_OF_YEAR = 80
+ANGLE_STEP = 5.0        # degrees; sun angles are quantized to this step
+CACHE_SIZE = 64
+MAX_SHADOW = 64         # longest shadow traced, in pixels
+
+
+# 14.1 code ref
+# Function 33: Sun azimuth (degrees clockwise from north) and elevation
+# (degrees) at solar hour t
+def sun_position(t, latitude=LATITUDE, day_of_year=DAY_OF_YEAR):
+    declination = math.radians(23.44) * math.sin(2 * math.pi * (284 + day_of_year) / 365)
+    hour_angle = math.radians(15 * ((t % 24) - 12))
+    phi = math.radians(latitude)
+    elevation = math.asin(math.sin(phi) * math.sin(declination) +
+                          math.cos(phi) * math.cos(declination) * math.cos(hour_angle))
+    azimuth = math.atan2(-math.cos(declination) * math.sin(hour_angle),
+                         math.sin(declination) * math.cos(phi) -
+                         math.cos(declination) * math.cos(hour_angle) * math.sin(phi))
+    return math.degrees(azimuth) % 360, math.degrees(elevation)
+
+
+# 14.2 code ref
+# Function 34: Pixels shaded by taller pixels between them and the sun.
+# A pixel is shaded when some pixel s steps towards the sun is higher than the
+# ray from it, i.e. height[p + s*d] > height[p] + s * tan(elevation).
+def shadow_mask(heights, azimuth, elevation, max_shadow=MAX_SHADOW):
+    rows, cols = heights.shape
+    shaded = np.zeros((rows, cols), dtype=bool)
+    if elevation <= 0:
+        return shaded
+    slope = math.tan(math.radians(elevation))
+    dx = math.sin(math.radians(azimuth))
+    dy = -math.cos(math.radians(azimuth))
+    reach = min(max_shadow, int(math.ceil(heights.max() / slope)))
+    for step in range(1, reach + 1):
+        oy, ox = int(round(step * dy)), int(round(step * dx))
+        if abs(oy) >= rows or abs(ox) >= cols:
+            break
+        target = (slice(max(0, -oy), rows - max(0, oy)), slice(max(0, -ox), cols - max(0, ox)))
+        source = (slice(max(0, oy), rows + min(0, oy)), slice(max(0, ox), cols + min(0, ox)))
+        shaded[target] |= heights[source] - step * slope > heights[target]
+    return shaded
+
+
+# 14.3 code ref
+# Shading stage for a ThermalMap: shadow masks cached per quantized sun angle
+# (LRU) and keyed to the layout version, so a day of frames only needs as many
+# masks as there are distinct quantized sun positions. Pass it as `shading=`
+# to ThermalMap.frame_at / incremental_frame, export_animation,
+# export_snapshots or ThermalViewer.
+class ShadingModel:
+    # 14.3.1 code ref
+    def __init__(self, thermal_map, latitude=LATITUDE, day_of_year=DAY_OF_YEAR,
+                 angle_step=ANGLE_STEP, cache_size=CACHE_SIZE, heights=None,
+                 cooling=SHADE_COOLING):
+        self.thermal_map = thermal_map
+        self.latitude = latitude
+        self.day_of_year = day_of_year
+        self.angle_step = angle_step
+        self.cache_size = cache_size
+        self.item_heights = {**ITEM_HEIGHTS, **(heights or {})}
+        self.cooling = cooling
+        self._masks = OrderedDict()
+        self._lock = threading.RLock()     # viewers render from a second thread
+        self._heights = None
+        self.hits = 0
+        self.misses = 0
+
+    # 14.3.2 code ref
+    def height_raster(self):
+        version = self.thermal_map.version
+        if self._heights is None or self._heights[0] != version:
+            kinds = self.thermal_map.slot_kinds()
+            slot_heights = np.array([self.item_heights.get(kind, 0.0) for kind in kinds])
+            self._heights = (version, slot_heights[self.thermal_map.label_raster])
+        return self._heights[1]
+
+    # 14.3.3 code ref
+    def quantized_sun(self, t):
+        azimuth, elevation = sun_position(t, self.latitude, self.day_of_year)
+        step = self.angle_step
+        return (round(azimuth / step) * step) % 360, round(elevation / step) * step
+
+    # 14.3.4 code ref
+    # Shadow mask at time t, or None when the sun is (quantized) below the horizon
+    def mask(self, t):
+        return self.coverage(t)
+
+    # 14.3.5 code ref
+    # Shaded fraction of every pixel of pyramid `level` at time t: the boolean
+    # mask at level 0, box-averaged like the thermal levels above it
+    def coverage(self, t, level=0):
+        azimuth, elevation = self.quantized_sun(t)
+        if elevation <= 0:
+            return None
+        key = (self.thermal_map.version, azimuth, elevation, level)
+        with self._lock:
+            if key in self._masks:
+                self.hits += 1
+                self._masks.move_to_end(key)
+                return self._masks[key]
+            if level == 0:
+                self.misses += 1
+                coverage = shadow_mask(self.height_raster(), azimuth, elevation)
+            else:
+                coverage = downsample(self.coverage(t, level - 1))
+            self._masks[key] = coverage
+            while len(self._masks) > self.cache_size:
+                self._masks.popitem(last=False)
+            return coverage
+
+    # 14.3.6 code ref
+    # °C a fully shaded pixel loses at time t, scaled by sun elevation
+    def cooling_at(self, t):
+        _, elevation = sun_position(t, self.latitude, self.day_of_year)
+        return self.cooling * math.sin(math.radians(max(elevation, 0.0)))
+
+    # 14.3.7 code ref
+    # Lower shaded pixels of a thermal frame in place. `level` and `window`
+    # describe the frame as for MipmapPyramid.thermal_view.
+    def apply(self, frame, t, level=0, window=None):
+        coverage = self.coverage(t, level)
+        if coverage is None:
+            return frame
+        if window is not None:
+            row0, row1, col0, col1 = self.thermal_map.pyramid()._cells(level, window)
+            coverage = coverage[row0:row1, col0:col1]
+        if level == 0:
+            np.subtract(frame, self.cooling_at(t), out=frame, where=coverage)
+        else:
+            frame -= self.cooling_at(t) * coverage
+        return frame
+
+    # 14.3.8 code ref
+    def render(self, t, out=None):
+        self.thermal_map.update_temperatures(t)
+        return self.apply(self.thermal_map.thermal_image(out), t)
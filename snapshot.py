@@ -0,0 +1,242 @@
+import struct
+import zipfile
+
+import numpy as np
+
+from cano import BLACK, GREEN, YELLOW, Block
+from engine import ThermalEngine
+from layout import ThermalMap
+
+# CONSTANTS
+SNAPSHOT_VERSION = 1
+BLOCK_TYPE_NAMES = ('Yard', 'Ground', 'River')
+ITEM_KINDS = ('Tree', 'House', 'Road')
+ITEM_COLOURS = (GREEN, YELLOW, BLACK)
+ZIP_LOCAL_HEADER = struct.Struct('<4s22xHH')
+
+
+# 17.1 code ref
+# Function 43: Save a ThermalMap to one uncompressed .npz: block and item
+# arrays, the engine parameters of every slot, and the occupancy masks
+# bit-packed per block
+def save_layout(thermal_map, path):
+    blocks = list(thermal_map)
+    size = thermal_map.block_size
+    item_offsets = np.zeros(len(blocks) + 1, dtype=np.int64)
+    np.cumsum([len(block.item_slots) for block in blocks], out=item_offsets[1:])
+    item_slot = np.concatenate([block.item_slots for block in blocks] +
+                               [np.empty(0, dtype=np.int32)])
+    engine = thermal_map.engine
+    occupancy = np.array([block.occupied_spaces.ravel() for block in blocks],
+                         dtype=bool).reshape(len(blocks), size * size)
+
+    np.savez(
+        path,
+        meta=np.array([SNAPSHOT_VERSION, size, *thermal_map.map_shape], dtype=np.int64),
+        block_type=np.array([BLOCK_TYPE_NAMES.index(block.block_type) for block in blocks],
+                            dtype=np.uint8),
+        block_number=np.array([block.block_number for block in blocks], dtype=np.int32),
+        block_topleft=np.array([block.topleft for block in blocks],
+                               dtype=np.int32).reshape(-1, 2),
+        block_slot=np.array([block.slot for block in blocks], dtype=np.int32),
+        item_offsets=item_offsets,
+        item_kind=(engine._kind[item_slot] - 1).astype(np.uint8),
+        item_pos=np.stack([engine._x[item_slot], engine._y[item_slot]],
+                          axis=1).astype(np.int32),
+        item_extent=np.stack([engine._width[item_slot], engine._height[item_slot]],
+                             axis=1).astype(np.int32),
+        item_slot=item_slot,
+        t_mean=engine.t_mean,
+        t_amp=engine.t_amp,
+        t_peak=engine.t_peak,
+        current=engine.current,
+        occupancy=np.packbits(occupancy, axis=1),
+    )
+
+
+# 17.2 code ref
+# Function 44: Members of an uncompressed .npz as read-only memory maps.
+# np.load cannot map .npz members, so the offset of every .npy payload is
+# taken from its zip local header and its npy header.
+def map_npz(path):
+    arrays = {}
+    with zipfile.ZipFile(path) as archive, open(path, 'rb') as file:
+        for info in archive.infolist():
+            name = info.filename[:-4] if info.filename.endswith('.npy') else info.filename
+            if info.compress_type != zipfile.ZIP_STORED:
+                with archive.open(info) as member:
+                    arrays[name] = np.lib.format.read_array(member)
+                continue
+            file.seek(info.header_offset)
+            signature, name_length, extra_length = ZIP_LOCAL_HEADER.unpack(
+                file.read(ZIP_LOCAL_HEADER.size))
+            if signature != b'PK\x03\x04':
+                raise ValueError(f"{path}: corrupt zip member {info.filename}")
+            file.seek(info.header_offset + ZIP_LOCAL_HEADER.size + name_length + extra_length)
+            version = np.lib.format.read_magic(file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+            if dtype.hasobject:
+                raise ValueError(f"{path}: object arrays are not supported")
+            if np.prod(shape) == 0:
+                arrays[name] = np.empty(shape, dtype=dtype)
+            else:
+                arrays[name] = np.memmap(file, dtype=dtype, mode='r', offset=file.tell(),
+                                         shape=shape, order='F' if fortran_order else 'C')
+    return arrays
+
+
+# 17.3 code ref
+# Function 45: Reload a layout saved by save_layout
+def load_layout(path, mmap=True):
+    if mmap:
+        arrays = map_npz(path)
+    else:
+        with np.load(path) as npz:
+            arrays = {name: npz[name] for name in npz.files}
+    version = int(arrays['meta'][0])
+    if version != SNAPSHOT_VERSION:
+        raise ValueError(f"{path}: unsupported snapshot version {version}")
+    return SnapshotMap(arrays)
+
+
+# 17.4 code ref
+# ThermalMap over snapshot arrays. The engine is restored in one call and the
+# layout rasters are painted straight from the item arrays; Block objects are
+# only reconstructed (and cached) when a block is accessed.
+class SnapshotMap(ThermalMap):
+    # 17.4.1 code ref
+    def __init__(self, arrays):
+        self.arrays = arrays
+        _, self.block_size, rows, cols = (int(value) for value in arrays['meta'])
+        self.map_shape = (rows, cols)
+        self.height = rows * self.block_size
+        self.width = cols * self.block_size
+        self.engine = ThermalEngine(capacity=len(arrays['t_mean']))
+        self.engine.register_many(arrays['t_mean'], arrays['t_amp'], arrays['t_peak'],
+                                  arrays['current'])
+        block_slot = np.asarray(arrays['block_slot'])
+        self.engine.set_geometry(block_slot, 0, block_slot, 0, 0, self.block_size,
+                                 self.block_size)
+        item_slot = np.asarray(arrays['item_slot'])
+        item_pos = np.asarray(arrays['item_pos'])
+        item_extent = np.asarray(arrays['item_extent'])
+        self.engine.set_geometry(item_slot, np.asarray(arrays['item_kind']) + 1,
+                                 np.repeat(block_slot, np.diff(arrays['item_offsets'])),
+                                 item_pos[:, 0], item_pos[:, 1],
+                                 item_extent[:, 0], item_extent[:, 1])
+        self._init_caches()
+        self._blocks = [None] * len(arrays['block_type'])
+
+    # 17.4.2 code ref
+    def __len__(self):
+        return len(self._blocks)
+
+    def __iter__(self):
+        return (self._block(index) for index in range(len(self._blocks)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._block(i) for i in range(*index.indices(len(self._blocks)))]
+        return self._block(range(len(self._blocks))[index])
+
+    @property
+    def blocks(self):
+        return list(self)
+
+    # 17.4.3 code ref
+    def _block(self, index):
+        block = self._blocks[index]
+        if block is not None:
+            return block
+        arrays = self.arrays
+        size = self.block_size
+        block = Block(size, tuple(arrays['block_topleft'][index].tolist()),
+                      BLOCK_TYPE_NAMES[arrays['block_type'][index]],
+                      int(arrays['block_number'][index]), self.engine,
+                      int(arrays['block_slot'][index]))
+        # The item geometry is already in the engine columns
+        start, stop = arrays['item_offsets'][index:index + 2]
+        block._attach_slots(np.asarray(arrays['item_slot'][start:stop]))
+        for kind, count in zip(ITEM_KINDS, np.bincount(arrays['item_kind'][start:stop],
+                                                       minlength=len(ITEM_KINDS)).tolist()):
+            block.item_counts[kind] = count
+        block.occupied_spaces = np.unpackbits(
+            arrays['occupancy'][index], count=size * size).reshape(size, size).astype(bool)
+        block.layout = self
+        self._blocks[index] = block
+        return block
+
+    # 17.4.4 code ref
+    # Items are painted in groups of equal extent and equal rank within their
+    # block, so every block keeps its insertion order and no group overlaps itself
+    def _build_label_raster(self):
+        arrays = self.arrays
+        size = self.block_size
+        raster = np.empty((self.height, self.width), dtype=np.int32)
+        grid = np.zeros(self.map_shape, dtype=np.int32)
+        topleft = np.asarray(arrays['block_topleft'])
+        grid[topleft[:, 1] // size, topleft[:, 0] // size] = arrays['block_slot']
+        raster.reshape(self.map_shape[0], size, self.map_shape[1], size)[...] = \
+            grid[:, None, :, None]
+
+        offsets = np.asarray(arrays['item_offsets'])
+        counts = np.diff(offsets)
+        rank = np.arange(offsets[-1]) - np.repeat(offsets[:-1], counts)
+        owner = np.repeat(np.arange(len(counts)), counts)
+        origin = topleft[owner] + arrays['item_pos']
+        extent = np.asarray(arrays['item_extent'])
+        slots = np.asarray(arrays['item_slot'])
+        keys = (rank * (size + 1) + extent[:, 0]) * (size + 1) + extent[:, 1]
+        order = np.argsort(keys, kind='stable')
+        bounds = np.flatnonzero(np.diff(keys[order], prepend=-1, append=-1))
+        for start, stop in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            members = order[start:stop]
+            width, height = extent[members[0]].tolist()
+            rows = origin[members, 1, None, None] + np.arange(height)[None, :, None]
+            cols = origin[members, 0, None, None] + np.arange(width)[None, None, :]
+            raster[rows, cols] = slots[members, None, None]
+        for block in self._changed_blocks():
+            raster[self._block_region(block)] = block.generate_label_view()
+        return raster
+
+    # 17.4.5 code ref
+    def _build_rgb_image(self):
+        grid = self.slot_colours()[self.label_raster]
+        for block in self._changed_blocks():
+            grid[self._block_region(block)] = block.generate_rgb_view()
+        return grid
+
+    # 17.4.8 code ref
+    # Materialized blocks that gained items since the snapshot was taken
+    def _changed_blocks(self):
+        counts = np.diff(self.arrays['item_offsets'])
+        return [block for index, block in enumerate(self._blocks)
+                if block is not None and len(block.item_slots) != counts[index]]
+
+    # 17.4.9 code ref
+    def _block_region(self, block):
+        cx_start, ry_start = block.topleft
+        return (slice(ry_start, ry_start + self.block_size),
+                slice(cx_start, cx_start + self.block_size))
+
+    # 17.4.6 code ref
+    def slot_colours(self):
+        arrays = self.arrays
+        colours = np.zeros((self.engine.size, 3), dtype=np.uint8)
+        block_colours = np.array([Block.BLOCK_TYPES[name][0] for name in BLOCK_TYPE_NAMES])
+        colours[arrays['block_slot']] = block_colours[arrays['block_type']]
+        colours[arrays['item_slot']] = np.array(ITEM_COLOURS)[arrays['item_kind']]
+        return colours
+
+    # 17.4.7 code ref
+    def _block_table(self):
+        arrays = self.arrays
+        return (np.asarray(arrays['block_slot'], dtype=np.intp),
+                np.asarray(arrays['block_topleft'], dtype=np.intp),
+                np.array(BLOCK_TYPE_NAMES)[arrays['block_type']])
+
+    def block_numbers(self):
+        return np.asarray(self.arrays['block_number'])
@@ -0,0 +1,245 @@
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from export import (CMAP, VMAX, VMIN, _bounded_map, colormap_lut, encode_png,
+                    render_index_frames, resample_raster, shading_terms)
+from profiling import PROFILER
+from shading import DAY_OF_YEAR, LATITUDE, ShadingModel
+from visualization import SAVE_DPI
+
+# CONSTANTS
+DPI = SAVE_DPI                  # same resolution as generate_and_display_views
+FIGSIZE = (12, 6)               # same figure as visualization.generate_and_display_views
+TITLE_SIZE = 12
+COMPRESS_LEVEL = 1              # zlib level of the snapshot PNGs (speed over size)
+SHEET_COLUMNS = 6
+THUMBNAIL_WIDTH = 320           # widest contact sheet thumbnail, in pixels
+
+_WORKER = {}
+
+
+# 24.1 code ref
+# Function 61: The static part of the snapshot figure, drawn once with
+# matplotlib: RGB panel, colour bar and figure title. The thermal panel is
+# drawn twice, filled with the first and with the last LUT colour; the
+# difference gives every pixel's coverage by the panel image (1 inside, 0
+# outside, fractional under the spines), so a frame composites as
+# template + coverage * (colour - first colour).
+def render_template(thermal_map, dpi=DPI, vmin=VMIN, vmax=VMAX, cmap=CMAP):
+    from matplotlib import gridspec
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    from visualization import imshow_level
+
+    fig = Figure(figsize=FIGSIZE, dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    gs = gridspec.GridSpec(1, 3, figure=fig, width_ratios=[1, 0.03, 1], wspace=0.3)
+    ax1 = fig.add_subplot(gs[0])
+    ax2 = fig.add_subplot(gs[2])
+    imshow_level(ax1, thermal_map, 'rgb', dpi)
+    ax1.set_title("RGB View", fontsize=12)
+    fill = np.full((thermal_map.height, thermal_map.width), vmin, dtype=np.float32)
+    image = ax2.imshow(fill, cmap=cmap, vmin=vmin, vmax=vmax, interpolation='nearest')
+    ax2.set_title("Thermal View at 00.00 hours", fontsize=TITLE_SIZE)
+
+    cbar = fig.colorbar(image, cax=fig.add_subplot(gs[1]), orientation='vertical',
+                        ticks=np.linspace(vmin, vmax, num=5))
+    cbar.set_label('Temperature (°C)', fontsize=12)
+    cbar.ax.yaxis.set_label_position('left')
+    cbar.ax.tick_params(labelsize=8)
+    fig.suptitle(f"Map with {len(thermal_map)} blocks", fontsize=14)
+
+    canvas.draw()
+    low = np.asarray(canvas.buffer_rgba())[..., :3].astype(np.float32)
+    image.set_data(np.full_like(fill, vmax))
+    canvas.draw()
+    high = np.asarray(canvas.buffer_rgba())[..., :3].astype(np.float32)
+
+    lut = colormap_lut(cmap).astype(np.float32)
+    channel = int(np.argmax(np.abs(lut[-1] - lut[0])))
+    coverage = np.clip((high - low)[..., channel] / (lut[-1, channel] - lut[0, channel]), 0, 1)
+    rows, cols = np.nonzero(coverage)
+    panel = (rows.min(), rows.max() + 1, cols.min(), cols.max() + 1)
+
+    # Title band: the axes' width, from the figure top down to the panel
+    height = low.shape[0]
+    x0, x1 = ax2.get_window_extent().intervalx
+    title = ax2.title.get_window_extent(canvas.get_renderer())
+    band = (max(0, int(height - title.y1) - 4), panel[0] - 2, int(x0), int(np.ceil(x1)))
+    template = low.astype(np.uint8)
+    template[band[0]:band[1], band[2]:band[3]] = 255
+    row0, row1, col0, col1 = panel
+    return {'template': template, 'panel': panel, 'coverage': coverage[row0:row1, col0:col1],
+            'title': band, 'title_y': (height - title.y0 - band[0]) / (band[1] - band[0])}
+
+
+# 24.2 code ref
+# Function 62: Title strips ("Thermal View at ... hours") for every time,
+# drawn on one small canvas the size of the title band
+def render_titles(times, band, title_y, dpi=DPI):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    row0, row1, col0, col1 = band
+    fig = Figure(figsize=((col1 - col0 + 1) / dpi, (row1 - row0 + 1) / dpi), dpi=dpi)
+    canvas = FigureCanvasAgg(fig)
+    text = fig.text(0.5, 1 - title_y, '', ha='center', va='bottom', fontsize=TITLE_SIZE)
+    strips = []
+    for t in times:
+        text.set_text(f"Thermal View at {t:.2f} hours")
+        canvas.draw()
+        strips.append(np.array(canvas.buffer_rgba())[:row1 - row0, :col1 - col0, :3])
+    return strips
+
+
+# 24.3 code ref
+def _init_worker(engine, label, lut, layout, compress_level, thumbnails, vmin, vmax):
+    coverage = layout['coverage']
+    full = coverage >= 1
+    rows = np.flatnonzero(full[:, full.shape[1] // 2])
+    cols = np.flatnonzero(full[full.shape[0] // 2])
+    inner = (rows[0], rows[-1] + 1, cols[0], cols[-1] + 1)
+    border = coverage > 0
+    border[inner[0]:inner[1], inner[2]:inner[3]] = False
+    edge = np.nonzero(border)
+    _WORKER.update(engine=engine, label=label, lut=lut, layout=layout, inner=inner,
+                   edge=edge, edge_coverage=coverage[edge][:, None],
+                   compress_level=compress_level, thumbnails=thumbnails, vmin=vmin, vmax=vmax)
+
+
+# 24.4 code ref
+# Composite and write one snapshot; returns its contact sheet thumbnail
+def _write_snapshot(task):
+    t, strip, path, shade = task
+    layout = _WORKER['layout']
+    lut = _WORKER['lut']
+    indices = render_index_frames(_WORKER['engine'], _WORKER['label'], np.array([t]),
+                                  _WORKER['vmin'], _WORKER['vmax'], [shade])[0]
+    image = layout['template'].copy()
+    row0, row1, col0, col1 = layout['panel']
+    panel = image[row0:row1, col0:col1]
+    inner_row0, inner_row1, inner_col0, inner_col1 = _WORKER['inner']
+    np.take(lut, indices[inner_row0:inner_row1, inner_col0:inner_col1], axis=0,
+            out=panel[inner_row0:inner_row1, inner_col0:inner_col1], mode='clip')
+    edge = _WORKER['edge']
+    blend = panel[edge] + _WORKER['edge_coverage'] * (lut[indices[edge]].astype(np.float32) - lut[0])
+    panel[edge] = np.clip(blend + 0.5, 0, 255).astype(np.uint8)
+    row0, row1, col0, col1 = layout['title']
+    image[row0:row1, col0:col1] = strip
+    with open(path, 'wb') as file:
+        file.write(encode_png(image, level=_WORKER['compress_level']))
+    if not _WORKER['thumbnails']:
+        return None
+    from PIL import Image
+
+    # Box-filtered by an integer factor in C; far cheaper than numpy on 300-dpi RGB
+    return np.asarray(Image.fromarray(image).reduce(-(-image.shape[1] // THUMBNAIL_WIDTH)))
+
+
+# 24.5 code ref
+# Function 63: Contact sheet of snapshot thumbnails, `columns` per row
+def contact_sheet(thumbnails, columns=SHEET_COLUMNS):
+    height, width = thumbnails[0].shape[:2]
+    rows = -(-len(thumbnails) // columns)
+    sheet = np.full((rows * height, min(columns, len(thumbnails)) * width, 3), 255,
+                    dtype=np.uint8)
+    for index, thumbnail in enumerate(thumbnails):
+        row, col = divmod(index, columns)
+        sheet[row * height:(row + 1) * height, col * width:(col + 1) * width] = thumbnail
+    return sheet
+
+
+# 24.6 code ref
+# Function 64: Headless snapshots map_<t>h.png for every time in `times`,
+# the same figure as generate_and_display_views without a savefig per hour.
+# The template and title strips are drawn here; compositing and PNG encoding
+# run on `workers` processes (1 = in-process). With a ShadingModel shaded
+# pixels are cooled. Returns the written paths, the contact sheet last.
+def export_snapshots(thermal_map, times, directory='./result', dpi=DPI, sheet=True,
+                     workers=None, compress_level=COMPRESS_LEVEL, vmin=VMIN, vmax=VMAX,
+                     cmap=CMAP, shading=None):
+    os.makedirs(directory, exist_ok=True)
+    times = [float(t) for t in times]
+    with PROFILER.stage('snapshot_template'):
+        layout = render_template(thermal_map, dpi, vmin, vmax, cmap)
+        strips = render_titles(times, layout['title'], layout['title_y'], dpi)
+    row0, row1, col0, col1 = layout['panel']
+    size = (col1 - col0, row1 - row0)
+    # Panels smaller than half the map are averaged at the matching pyramid level
+    level = thermal_map.pyramid().level_for((size[1], size[0]))
+    label = (thermal_map.pyramid().level(level), size) if level \
+        else resample_raster(thermal_map.label_raster, size)
+
+    paths = [os.path.join(directory, f"map_{t:.2f}h.png") for t in times]
+    shades = [None] * len(times) if shading is None else \
+        shading_terms(shading, times, level, size)
+    tasks = list(zip(times, strips, paths, shades))
+    initargs = (thermal_map.engine, label, colormap_lut(cmap), layout, compress_level,
+                sheet, vmin, vmax)
+    workers = min(os.cpu_count() if workers is None else workers, len(tasks))
+    PROFILER.count('snapshots', len(tasks))
+    with PROFILER.stage('snapshots'):
+        if workers <= 1:
+            _init_worker(*initargs)
+            thumbnails = [_write_snapshot(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                     initargs=initargs) as pool:
+                thumbnails = list(_bounded_map(pool, _write_snapshot, tasks, 2 * workers))
+    if sheet and tasks:
+        paths.append(os.path.join(directory, 'contact_sheet.png'))
+        with open(paths[-1], 'wb') as file:
+            file.write(encode_png(contact_sheet(thumbnails), level=compress_level))
+    return paths
+
+
+# 24.7 code ref
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Write thermal map snapshots for many times of day, headlessly.")
+    parser.add_argument('--input', default='input.txt', help="layout config file")
+    parser.add_argument('--layout', default=None, help="load a snapshot saved by snapshot.py")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--times', type=float, nargs='+', default=list(range(24)),
+                        help="hours to render (default: every hour)")
+    parser.add_argument('--dpi', type=int, default=DPI)
+    parser.add_argument('--output', default='./result/snapshots')
+    parser.add_argument('--no-sheet', action='store_true', help="skip the contact sheet")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: all cores, 1 = in-process)")
+    parser.add_argument('--shading', action='store_true',
+                        help="cool pixels shaded by houses and trees (see shading.py)")
+    parser.add_argument('--latitude', type=float, default=LATITUDE)
+    parser.add_argument('--day-of-year', type=int, default=DAY_OF_YEAR)
+    args = parser.parse_args(argv)
+
+    if args.layout:
+        from snapshot import load_layout
+        thermal_map = load_layout(args.layout)
+    else:
+        from extract import extract_values_from_file
+        from layout import build_map
+        from utils import calculate_block_size
+
+        num_blocks, num_rows, yards, grounds, rivers, houses, trees, _ = \
+            extract_values_from_file(args.input)
+        thermal_map = build_map(num_blocks, (num_rows, num_blocks // num_rows),
+                                (yards, grounds, rivers), houses, trees,
+                                calculate_block_size(num_blocks),
+                                np.random.default_rng(args.seed))
+
+    shading = ShadingModel(thermal_map, args.latitude, args.day_of_year) \
+        if args.shading else None
+    begin = time.perf_counter()
+    paths = export_snapshots(thermal_map, args.times, args.output, args.dpi,
+                             not args.no_sheet, args.workers, shading=shading)
+    print(f"Saved {len(paths)} images to {args.output} in {time.perf_counter() - begin:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from analytics import GROUPS, stream_statistics
+from layout import build_map
+
+
+@pytest.fixture
+def thermal_map():
+    return build_map(16, (4, 4), (6, 6, 4), 12, 40, 50, np.random.default_rng(7))
+
+
+def block_frames(thermal_map, times):
+    size = thermal_map.block_size
+    frames = []
+    for t in times:
+        thermal_map.update_temperatures(t)
+        frame = thermal_map.thermal_image().astype(float)
+        frames.append([frame[ry:ry+size, cx:cx+size] for cx, ry in
+                       (block.topleft for block in thermal_map.blocks)])
+    return np.array(frames)          # (time, block, row, col)
+
+
+def test_statistics_match_materialized_frames(thermal_map):
+    results = stream_statistics(thermal_map, 0.0, 24.0, 0.5, threshold=25.0)
+    times = np.arange(48) * 0.5
+    frames = block_frames(thermal_map, times)
+    series = frames.mean(axis=(2, 3))
+    blocks = results['blocks']
+    np.testing.assert_allclose(blocks['mean'], series.mean(axis=0), atol=1e-4)
+    np.testing.assert_allclose(blocks['max'], series.max(axis=0), atol=1e-4)
+    np.testing.assert_allclose(blocks['min'], series.min(axis=0), atol=1e-4)
+    assert np.array_equal(blocks['peak_time'], times[series.argmax(axis=0)])
+    degree_hours = (np.maximum(frames - 25.0, 0) * 0.5).sum(axis=0).mean(axis=(1, 2))
+    np.testing.assert_allclose(blocks['degree_hours'], degree_hours, atol=1e-3)
+
+    types = np.array([block.block_type for block in thermal_map.blocks])
+    group_series = {name: series[:, types == name].mean(axis=1) for name in GROUPS[:3]}
+    group_series['UHI'] = group_series['Yard'] - series[:, types != 'Yard'].mean(axis=1)
+    for column, name in enumerate(GROUPS):
+        assert results['groups']['mean'][column] == pytest.approx(group_series[name].mean(),
+                                                                   abs=1e-4)
+
+
+def test_chunking_does_not_change_results(thermal_map):
+    whole = stream_statistics(thermal_map, 6.0, 18.0, 0.25)
+    chunked = stream_statistics(thermal_map, 6.0, 18.0, 0.25, chunk_bytes=1)
+    for table in ('blocks', 'groups'):
+        for field, values in whole[table].items():
+            np.testing.assert_allclose(chunked[table][field], values, rtol=1e-12)
@@ -0,0 +1,54 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from batch import load_config, main, validate_config
+from layout import build_map
+
+SCENARIO = {'rows': 3, 'cols': 4, 'yards': 5, 'grounds': 5, 'rivers': 2,
+            'houses': 6, 'trees': 20, 'block_size': 20, 'seed': 4}
+
+
+def test_repo_scenarios_are_valid():
+    here = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    scenarios = validate_config(load_config(os.path.join(here, 'scenarios.toml')))
+    assert scenarios
+
+
+def test_every_problem_is_reported_up_front():
+    config = {'scenarios': [
+        {**SCENARIO, 'name': 'a', 'times': [9, 25, 'noon']},
+        {**SCENARIO, 'name': 'a', 'outputs': ['thermal', 'video']},
+        {'name': 'b', 'rows': 2, 'cols': 2, 'yards': 4, 'grounds': 0},
+        {**SCENARIO, 'name': 'c', 'rivers': 3, 'colour': 'red'},
+    ]}
+    with pytest.raises(ValueError) as error:
+        validate_config(config)
+    message = str(error.value)
+    for problem in ("got 25", "got 'noon'", "unknown output 'video'",
+                    "missing 'rivers'", "must equal rows * cols (12)",
+                    "unknown key 'colour'", "duplicate scenario name 'a'"):
+        assert problem in message
+
+
+def test_runs_scenarios_headless(tmp_path):
+    config = {'defaults': {'directory': str(tmp_path), 'times': [6, 14.5]},
+              'scenarios': [{**SCENARIO, 'name': 'small',
+                             'outputs': ['thermal', 'rgb', 'summary', 'snapshot']},
+                            {**SCENARIO, 'name': 'trees', 'trees': 40}]}
+    path = tmp_path / 'scenarios.json'
+    path.write_text(json.dumps(config))
+    main([str(path)])
+
+    small = tmp_path / 'small'
+    assert sorted(os.listdir(small)) == ['layout.npz', 'rgb.npy', 'summary.csv',
+                                         'thermal_14.50h.npy', 'thermal_6.00h.npy']
+    expected = build_map(12, (3, 4), (5, 5, 2), 6, 20, 20, np.random.default_rng(4))
+    assert np.array_equal(np.load(small / 'thermal_14.50h.npy'), expected.frame_at(14.5))
+    assert np.array_equal(np.load(small / 'rgb.npy'), expected.rgb_image())
+    rows = (small / 'summary.csv').read_text().splitlines()
+    assert rows[0] == 'time,mean,min,max' and len(rows) == 3
+    assert sorted(os.listdir(tmp_path / 'trees')) == ['summary.csv', 'thermal_14.50h.npy',
+                                                      'thermal_6.00h.npy']
@@ -0,0 +1,35 @@
+import numpy as np
+import pytest
+
+from cano import Block
+from placement import FreeSpaceIndex
+
+
+def test_occupied_spaces_is_read_only():
+    block = Block(20, (0, 0), 'Yard', 0)
+    with pytest.raises(ValueError):
+        block.occupied_spaces[0:4, 0:4] = True
+
+
+def test_mark_occupied_updates_grid_and_index():
+    block = Block(20, (0, 0), 'Yard', 0)
+    block.add_road('top')
+    index = block.free_space_index()
+    block.mark_occupied(3, 8, 6, 6)
+    block.mark_occupied(17, -2, 10, 5)          # clipped to the block
+    occupied = block.occupied_spaces
+    assert occupied[3:9, 8:14].all() and occupied[17:, :3].all()
+    assert occupied.sum() == 20 * 5 + 36      # road along the top, then the rectangle
+    assert block.free_space_index() is index
+    assert np.array_equal(index.table, FreeSpaceIndex(occupied).table)
+
+
+def test_items_avoid_marked_cells():
+    block = Block(20, (0, 0), 'Ground', 0)
+    block.mark_occupied(0, 0, 20, 10)
+    rng = np.random.default_rng(0)
+    while block.add_item('Tree', rng=rng):
+        pass
+    for tree in block.items:
+        x, y = tree.pos
+        assert y >= 10
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+from diffusion import DiffusionSolver, save_fields
+from layout import build_map
+
+
+@pytest.fixture
+def thermal_map():
+    return build_map(16, (4, 4), (6, 6, 4), 12, 40, 20, np.random.default_rng(7))
+
+
+def test_steady_state_under_constant_forcing(thermal_map):
+    engine = thermal_map.engine
+    slots = np.arange(engine.size)
+    engine.set_params(slots, engine.t_mean.copy(), 0.0, 14.0)
+    forcing = engine.t_mean[thermal_map.label_raster]
+    solver = DiffusionSolver(thermal_map, workers=1)
+    field = solver.advance(30.0).copy()
+    assert np.abs(solver.step() - field).max() < 1e-9
+    # Zero-flux borders: the steady field keeps the forcing's mean and range
+    assert field.mean() == pytest.approx(forcing.mean(), abs=1e-9)
+    assert forcing.min() - 1e-9 <= field.min() and field.max() <= forcing.max() + 1e-9
+    assert not np.allclose(field, forcing)
+
+
+def test_uniform_forcing_stays_uniform(thermal_map):
+    engine = thermal_map.engine
+    engine.set_params(np.arange(engine.size), 21.0, 0.0, 14.0)
+    solver = DiffusionSolver(thermal_map, workers=1)
+    assert np.allclose(solver.advance(5.0), 21.0)
+
+
+def test_saves_wrapped_hours_in_order(thermal_map, tmp_path):
+    solver = DiffusionSolver(thermal_map, 6.0, workers=1)
+    saved = list(save_fields(solver, [20.0, 2.0], str(tmp_path)))
+    assert [hour for hour, _ in saved] == [20.0, 2.0]
+
+    reference = DiffusionSolver(thermal_map, 6.0, workers=1)
+    reference.advance(30.0)
+    for hour, t in ((20.0, 44.0), (2.0, 50.0)):
+        expected = reference.advance(t).astype(np.float32)
+        assert np.array_equal(np.load(tmp_path / f"diffusion_{hour:.2f}h.npy"), expected)
+
+
+def test_advance_refuses_to_go_back(thermal_map):
+    solver = DiffusionSolver(thermal_map, workers=1)
+    solver.advance(2.0)
+    with pytest.raises(ValueError):
+        solver.advance(1.0)
@@ -0,0 +1,67 @@
+import math
+
+import numpy as np
+import pytest
+
+from cano import EFFECT_RATE, T_PEAK
+from layout import build_map
+from visualization import generate_rgb_image, generate_thermal_image
+
+
+@pytest.fixture
+def thermal_map():
+    return build_map(16, (4, 4), (6, 6, 4), 12, 40, 50, np.random.default_rng(7))
+
+
+def per_item_temperature(source, t):
+    return source.t_mean + source.t_amp * math.cos(2 * math.pi / 24 * (t - source.t_peak))
+
+
+# The per-object views the engine replaced: fill the block, then paint every
+# item over it in insertion order
+def per_item_views(block, t):
+    thermal = np.full((block.size, block.size), per_item_temperature(block, t))
+    rgb = np.ones((block.size, block.size, 3), dtype=np.uint8) * block.rgb
+    for item in block.items:
+        cx_start, ry_start = item.get_topleft()
+        width, height = item.get_extent()
+        thermal[ry_start:ry_start+height, cx_start:cx_start+width] = per_item_temperature(item, t)
+        rgb[ry_start:ry_start+height, cx_start:cx_start+width] = item.get_image()
+    return thermal, rgb
+
+
+def test_parameters_follow_the_per_item_model(thermal_map):
+    for block in thermal_map.blocks:
+        assert block.t_mean == block.initial_temp
+        for item in block.items:
+            assert item.t_mean == (item.initial_temp + block.initial_temp) / 2
+            assert item.t_amp == pytest.approx(EFFECT_RATE * item.t_mean)
+            assert item.t_peak == T_PEAK
+
+
+@pytest.mark.parametrize('t', [0.0, 9.25, 14.0, 23.5])
+def test_images_match_per_item_views(thermal_map, t):
+    thermal_map.update_temperatures(t)
+    thermal = thermal_map.thermal_image()
+    rgb = thermal_map.rgb_image()
+    size = thermal_map.block_size
+    for block in thermal_map.blocks:
+        cx_start, ry_start = block.topleft
+        expected_thermal, expected_rgb = per_item_views(block, t)
+        np.testing.assert_allclose(thermal[ry_start:ry_start+size, cx_start:cx_start+size],
+                                   expected_thermal, atol=1e-4)
+        assert np.array_equal(rgb[ry_start:ry_start+size, cx_start:cx_start+size], expected_rgb)
+        assert block.current_temp == pytest.approx(per_item_temperature(block, t))
+
+    blocks = list(thermal_map.blocks)
+    assert np.array_equal(generate_thermal_image(blocks, size, thermal_map.map_shape), thermal)
+    assert np.array_equal(generate_rgb_image(blocks, size, thermal_map.map_shape), rgb)
+
+
+def test_vector_of_times_matches_scalar_updates(thermal_map):
+    engine = thermal_map.engine
+    times = np.array([0.0, 6.5, 14.0, 30.0])
+    table = engine.temperatures(times)
+    assert table.shape == (len(times), engine.size)
+    for row, t in zip(table, times):
+        np.testing.assert_allclose(row, engine.update(t), atol=1e-12)
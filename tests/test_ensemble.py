@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from cube import cube_times
+from ensemble import run_ensemble, run_replicate, summarize
+from layout import build_map
+
+CONFIG = {'num_blocks': 16, 'map_shape': (4, 4), 'block_distribution': (6, 6, 4),
+          'num_houses': 10, 'num_trees': 30, 'block_size': 30}
+
+
+def test_results_do_not_depend_on_worker_count():
+    serial = run_ensemble(CONFIG, 4, seed=21, workers=1, resolution=1.0)
+    pooled = run_ensemble(CONFIG, 4, seed=21, workers=2, resolution=1.0)
+    assert serial == pooled
+    assert [result['replicate'] for result in serial] == [0, 1, 2, 3]
+    assert len({result['mean_temp'] for result in serial}) > 1
+
+
+def test_metrics_match_rendered_frames():
+    seed = np.random.SeedSequence(5)
+    times = cube_times(1.0)
+    metrics = run_replicate(CONFIG, seed, times)
+
+    thermal_map = build_map(CONFIG['num_blocks'], CONFIG['map_shape'],
+                            CONFIG['block_distribution'], CONFIG['num_houses'],
+                            CONFIG['num_trees'], CONFIG['block_size'],
+                            np.random.default_rng(seed))
+    frames = []
+    for t in times:
+        thermal_map.update_temperatures(t)
+        frames.append(thermal_map.thermal_image().astype(float))
+    frames = np.array(frames)
+    assert metrics['mean_temp'] == pytest.approx(frames.mean(), abs=1e-4)
+    assert metrics['peak_temp'] == pytest.approx(frames.max(), abs=1e-4)
+    assert metrics['peak_time'] == times[np.argmax(frames.max(axis=(1, 2)))]
+    assert metrics['trees'] == CONFIG['num_trees']
+
+
+def test_summary_has_one_row_per_metric():
+    results = [{'replicate': 0, 'mean_temp': 20.0, 'river_mean_temp': float('nan')},
+               {'replicate': 1, 'mean_temp': 24.0, 'river_mean_temp': float('nan')}]
+    assert summarize(results) == [['mean_temp', 22.0, 2.0, 20.0, 24.0]]
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+from cano import Block
+from placement import FreeSpaceIndex, conflict_footprint, greedy_independent_set, place_items
+
+
+def ground_blocks(count, size=30):
+    blocks = [Block(size, (i * size, 0), 'Ground', i) for i in range(count)]
+    for block in blocks[::2]:
+        block.add_road('top')
+    return blocks
+
+
+def test_free_space_index_updates_match_rebuild():
+    rng = np.random.default_rng(5)
+    occupied = rng.random((37, 29)) < 0.05
+    index = FreeSpaceIndex(occupied)
+    for _ in range(40):
+        width, height = rng.integers(1, 9, size=2)
+        x, y = rng.integers(0, 37 - width + 1), rng.integers(0, 29 - height + 1)
+        index.add((x, y), ~occupied[x:x+width, y:y+height])
+        occupied[x:x+width, y:y+height] = True
+        rebuilt = FreeSpaceIndex(occupied)
+        assert np.array_equal(index.table, rebuilt.table)
+        assert np.array_equal(index.free_positions(3, 4), rebuilt.free_positions(3, 4))
+
+
+def test_block_fills_exactly_through_the_index():
+    block = Block(30, (0, 0), 'Ground', 0)
+    block.add_road('left')
+    rng = np.random.default_rng(6)
+    while block.add_item('Tree', rng=rng):
+        pass
+    index = block.free_space_index()
+    assert np.array_equal(index.table, FreeSpaceIndex(block.occupied_spaces).table)
+    assert (block.item_counts['Tree'] == block.max_trees
+            or len(index.free_positions(block.tree_size, block.tree_size)) == 0)
+
+
+def sequential_set(candidates, priority, footprint):
+    conflicts = {(dx, dy) for dx, half_width in footprint
+                 for dy in range(-half_width, half_width + 1)}
+    chosen = np.zeros_like(candidates)
+    accepted = [[] for _ in candidates]
+    for flat in np.argsort(priority, axis=None):
+        block, x, y = np.unravel_index(flat, candidates.shape)
+        if candidates[block, x, y] and all((x - px, y - py) not in conflicts
+                                           for px, py in accepted[block]):
+            accepted[block].append((x, y))
+            chosen[block, x, y] = True
+    return chosen
+
+
+def lowest(chosen, priority, caps, n):
+    block, x, y = np.nonzero(chosen)
+    value = priority[block, x, y]
+    keep = [i for i in np.argsort(value)
+            if np.sum((block == block[i]) & (value <= value[i])) <= caps[block[i]]]
+    return {(block[i], x[i], y[i]) for i in keep[:n]}
+
+
+@pytest.mark.parametrize('radius', [None, 4.5])
+def test_greedy_set_matches_sequential_acceptance(radius):
+    rng = np.random.default_rng(3)
+    candidates = rng.random((5, 24, 21)) < 0.8
+    priority = rng.random(candidates.shape)
+    footprint = conflict_footprint(3, radius)
+    expected = sequential_set(candidates, priority, footprint)
+    assert np.array_equal(greedy_independent_set(candidates, priority, footprint), expected)
+
+    for caps in (np.array([2, 0, 40, 5, 9]), np.full(5, 1000)):
+        for n in (3, 40, 150, 1000):
+            chosen = greedy_independent_set(candidates, priority, footprint, caps=caps, n=n)
+            assert lowest(chosen, priority, caps, n) == lowest(expected, priority, caps, n)
+
+
+@pytest.mark.parametrize('strategy', ['random', 'poisson', 'grid'])
+def test_items_never_overlap(strategy):
+    blocks = ground_blocks(6)
+    placed = place_items(blocks, 'Tree', 10**6, strategy, rng=np.random.default_rng(0))
+    assert placed == sum(block.item_counts['Tree'] for block in blocks) > 0
+    for block in blocks:
+        area = sum(np.prod(item.get_extent()) for item in block.items)
+        assert block.occupied_spaces.sum() == area
+
+
+def test_poisson_keeps_min_distance():
+    blocks = ground_blocks(4)
+    place_items(blocks, 'Tree', 10**6, 'poisson', min_distance=7.5,
+                rng=np.random.default_rng(1))
+    for block in blocks:
+        trees = np.array([item.pos for item in block.items if type(item).__name__ == 'Tree'])
+        distance = np.hypot(*(trees[:, None] - trees[None, :]).transpose(2, 0, 1))
+        assert distance[np.triu_indices(len(trees), 1)].min() >= 7.5
+
+
+@pytest.mark.parametrize('strategy', ['random', 'poisson', 'grid'])
+def test_exact_counts_and_limits(strategy):
+    blocks = ground_blocks(6)
+    assert place_items(blocks, 'Tree', 13, strategy, rng=np.random.default_rng(2)) == 13
+    assert sum(block.item_counts['Tree'] for block in blocks) == 13
+
+    blocks = ground_blocks(6)
+    limits = [0, 1, 2, 3, 4, 5]
+    assert place_items(blocks, 'Tree', 100, strategy, rng=np.random.default_rng(2),
+                       limits=limits) == 15
+    assert [block.item_counts['Tree'] for block in blocks] == limits
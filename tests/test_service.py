@@ -0,0 +1,91 @@
+import asyncio
+import io
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pytest
+
+from engine import OMEGA
+from export import temperature_indices
+from layout import build_map
+from service import ThermalService
+
+
+@pytest.fixture(scope='module')
+def server():
+    thermal_map = build_map(16, (4, 4), (6, 6, 4), 12, 40, 50, np.random.default_rng(5))
+    service = ThermalService({'default': thermal_map}, workers=4)
+    loop = asyncio.new_event_loop()
+    listener = loop.run_until_complete(service.serve('127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{listener.sockets[0].getsockname()[1]}", thermal_map
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(10)
+    listener.close()
+    loop.run_until_complete(listener.wait_closed())
+    loop.close()
+    service.pool.shutdown()
+
+
+def get(base, path):
+    with urllib.request.urlopen(base + path, timeout=10) as response:
+        return response.status, response.headers['Content-Type'], response.read()
+
+
+def status(base, path):
+    with pytest.raises(urllib.error.HTTPError) as error:
+        get(base, path)
+    return error.value.code
+
+
+def test_frame_npy(server):
+    base, thermal_map = server
+    code, content_type, body = get(base, '/layouts/default/frame?t=14')
+    assert code == 200 and content_type == 'application/octet-stream'
+    assert np.array_equal(np.load(io.BytesIO(body)), thermal_map.frame_at(14.0))
+
+
+def test_frame_png(server):
+    base, thermal_map = server
+    code, content_type, body = get(base, '/layouts/default/frame?t=14&format=png')
+    assert code == 200 and content_type == 'image/png'
+    assert body.startswith(b'\x89PNG\r\n\x1a\n')
+    from PIL import Image
+    image = np.asarray(Image.open(io.BytesIO(body)))
+    assert np.array_equal(image, temperature_indices(thermal_map.frame_at(14.0)))
+
+
+def test_stats_and_blocks_match_frame(server):
+    base, thermal_map = server
+    stats = json.loads(get(base, '/layouts/default/stats?t=9')[2])
+    frame = thermal_map.frame_at(9.0)
+    assert stats['mean'] == pytest.approx(float(frame.mean()), abs=1e-4)
+    assert stats['min'] == pytest.approx(float(frame.min()), abs=1e-4)
+    assert stats['max'] == pytest.approx(float(frame.max()), abs=1e-4)
+    blocks = json.loads(get(base, '/layouts/default/blocks?t=9')[2])
+    assert blocks['block'] == list(range(16))
+    expected = [block.t_mean + block.t_amp * np.cos(OMEGA * (9.0 - block.t_peak))
+                for block in thermal_map]
+    assert blocks['temp'] == pytest.approx(expected, abs=1e-3)
+
+
+def test_time_quantized_on_every_route(server):
+    base, thermal_map = server
+    quantum = thermal_map.frame_cache.quantum
+    for route in ('blocks', 'stats'):
+        payload = json.loads(get(base, f'/layouts/default/{route}?t=9.004')[2])
+        assert payload['t'] == pytest.approx(round(9.004 / quantum) * quantum)
+        assert payload == json.loads(get(base, f'/layouts/default/{route}?t=9.0')[2])
+
+
+def test_errors(server):
+    base, _ = server
+    assert status(base, '/layouts/nope/frame?t=1') == 404
+    assert status(base, '/nothing') == 404
+    assert status(base, '/layouts/default/frame') == 400
+    assert status(base, '/layouts/default/stats?t=x') == 400
+    assert status(base, '/layouts/default/frame?t=1&format=gif') == 400
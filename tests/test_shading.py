@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from export import render_index_frames, shading_terms, temperature_indices
+from layout import build_map
+from shading import ShadingModel
+
+
+@pytest.fixture
+def thermal_map():
+    return build_map(16, (4, 4), (6, 6, 4), 12, 40, 50, np.random.default_rng(7))
+
+
+def test_shaded_frame_differs_only_under_mask(thermal_map):
+    shading = ShadingModel(thermal_map)
+    t = 15.0
+    mask = shading.mask(t)
+    assert mask is not None and mask.any() and not mask.all()
+    plain = thermal_map.frame_at(t)
+    shaded = thermal_map.frame_at(t, shading=shading)
+    assert shaded is not plain
+    assert np.array_equal(shaded[~mask], plain[~mask])
+    assert np.allclose(plain[mask] - shaded[mask], shading.cooling_at(t))
+    assert thermal_map.frame_at(t, shading=shading) is shaded
+
+
+def test_night_frame_is_unshaded(thermal_map):
+    shading = ShadingModel(thermal_map)
+    assert shading.mask(2.0) is None
+    assert np.array_equal(thermal_map.frame_at(2.0, shading=shading), thermal_map.frame_at(2.0))
+
+
+def test_incremental_frame_matches_frame_at(thermal_map):
+    shading = ShadingModel(thermal_map)
+    for t in (9.0, 9.1, 12.0, 16.5):
+        thermal_map.update_temperatures(t)
+        frame = thermal_map.incremental_frame(0.0, shading=shading, t=t)
+        assert np.allclose(frame, thermal_map.frame_at(t, shading=shading), atol=1e-4)
+
+
+def test_index_frames_use_shading(thermal_map):
+    shading = ShadingModel(thermal_map)
+    times = np.array([3.0, 15.0])
+    shades = shading_terms(shading, times)
+    frames = render_index_frames(thermal_map.engine, thermal_map.label_raster, times,
+                                 shades=shades)
+    assert np.array_equal(frames[0], temperature_indices(thermal_map.frame_at(3.0)))
+    assert np.array_equal(frames[1],
+                          temperature_indices(thermal_map.frame_at(15.0, shading=shading)))
+
+
+def test_level_coverage_averages_mask(thermal_map):
+    shading = ShadingModel(thermal_map)
+    coverage = shading.coverage(15.0, 1)
+    assert coverage.shape == thermal_map.pyramid().level(1).shape
+    assert np.isclose(coverage.mean(), shading.mask(15.0).mean())
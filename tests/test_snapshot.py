@@ -0,0 +1,29 @@
+import numpy as np
+
+from layout import build_map
+from snapshot import load_layout, save_layout
+
+
+def test_loaded_layout_renders_like_original(tmp_path):
+    thermal_map = build_map(16, (4, 4), (6, 6, 4), 12, 40, 50, np.random.default_rng(3))
+    path = str(tmp_path / 'layout.npz')
+    save_layout(thermal_map, path)
+    loaded = load_layout(path)
+    for t in (0.0, 14.0):
+        assert np.array_equal(loaded.frame_at(t), thermal_map.frame_at(t))
+    assert loaded.frame_cache is not thermal_map.frame_cache
+    assert loaded.frame_cache.stats()['frames'] == 2
+    loaded.update_temperatures(9.0)
+    assert np.array_equal(loaded.incremental_frame(), loaded.thermal_image())
+
+
+def test_incremental_frame_keeps_blocks_lazy(tmp_path):
+    thermal_map = build_map(64, (8, 8), (24, 24, 16), 30, 120, 20, np.random.default_rng(4))
+    path = str(tmp_path / 'layout.npz')
+    save_layout(thermal_map, path)
+    loaded = load_layout(path)
+    for t in (9.0, 9.5):
+        loaded.update_temperatures(t)
+        frame = loaded.incremental_frame()
+    assert np.abs(frame - loaded.thermal_image()).max() <= 0.05
+    assert all(block is None for block in loaded._blocks)
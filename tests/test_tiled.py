@@ -0,0 +1,67 @@
+import numpy as np
+
+from cano import Block
+from layout import add_roads_to_blocks
+from tiled import BLOCK_TYPE_NAMES, TiledMap, road_sides
+
+
+def tiled_map(tmp_path, num_houses=20, num_trees=60):
+    # 3 x 3 tiles of up to 2 x 2 blocks, more than the tile cache holds
+    return TiledMap((5, 6), 20, (10, 12, 8), num_houses, num_trees, str(tmp_path),
+                    tile_blocks=(2, 2), seed=11)
+
+
+def test_frame_matches_materialized_tiles(tmp_path):
+    tiled = tiled_map(tmp_path).build()
+    t = 15.5
+    frame = np.load(tiled.thermal_image(t))
+    rgb = np.load(tiled.path('rgb.npy'))
+    assert frame.shape == (tiled.height, tiled.width)
+    for tile_row, tile_col in tiled.tiles():
+        tile = tiled.materialize_tile(tile_row, tile_col)
+        tile.update_temperatures(t)
+        region = tiled._pixel_region(tile_row, tile_col)
+        np.testing.assert_allclose(frame[region], tile.thermal_image(), atol=1e-4)
+        assert np.array_equal(rgb[region], tile.rgb_image())
+
+
+def test_evicted_tiles_come_back_identical(tmp_path):
+    tiled = tiled_map(tmp_path)
+    first = tiled.materialize_tile(0, 0).rgb_image().copy()
+    for tile_row, tile_col in tiled.tiles():
+        tiled.materialize_tile(tile_row, tile_col)
+    assert (0, 0) not in tiled._tiles
+    assert np.array_equal(tiled.materialize_tile(0, 0).rgb_image(), first)
+
+
+def test_quotas_are_capped_and_counted(tmp_path):
+    tiled = tiled_map(tmp_path).build()
+    assert tiled.house_quota.sum() == 20 and tiled.tree_quota.sum() == 60
+    placed = {'House': 0, 'Tree': 0}
+    for tile_row, tile_col in tiled.tiles():
+        for block in tiled.materialize_tile(tile_row, tile_col).blocks:
+            for kind in placed:
+                placed[kind] += block.item_counts[kind]
+    # Roads leave room for fewer houses than the nominal capacity
+    assert tiled.item_counts() == {'House': (20, placed['House']), 'Tree': (60, 60)}
+
+    tiled = tiled_map(tmp_path / 'full', num_houses=10**4)
+    capacity = Block(20, (0, 0), 'Yard', 0).item_capacity('House')
+    assert tiled.house_quota.max() == capacity
+    assert tiled.house_quota.sum() == capacity * np.sum(tiled.block_types == BLOCK_TYPE_NAMES.index('Yard'))
+
+
+def test_road_sides_match_add_roads_to_blocks(tmp_path):
+    tiled = tiled_map(tmp_path)
+    rows, cols = tiled.map_shape
+    blocks = [Block(20, (0, 0), BLOCK_TYPE_NAMES[code], i)
+              for i, code in enumerate(tiled.block_types.ravel())]
+    add_roads_to_blocks(blocks, (rows, cols))
+    sides = road_sides(tiled.block_types)
+    for i, block in enumerate(blocks):
+        roads = sorted((item.get_topleft(), item.get_extent()) for item in block.items)
+        expected = Block(20, (0, 0), block.block_type, i)
+        for side in ('top', 'bottom', 'left', 'right'):
+            if sides[side].ravel()[i]:
+                expected.add_road(side)
+        assert roads == sorted((item.get_topleft(), item.get_extent()) for item in expected.items)
@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+def test_import_leaves_backend_unchosen():
+    code = ("import sys, viewer; "
+            "assert 'matplotlib.pyplot' not in sys.modules, 'pyplot imported'")
+    subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True)
+
+
+def test_benchmark_runs_headless():
+    code = ("import viewer, matplotlib; viewer.main(['--benchmark', '5', '--seed', '1']); "
+            "assert matplotlib.get_backend().lower() == 'agg'")
+    env = {key: value for key, value in os.environ.items() if key != 'MPLBACKEND'}
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True,
+                            text=True, env=env)
+    assert result.returncode == 0, result.stderr
+    assert 'fps' in result.stdout
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from cano import EFFECT_RATE, T_PEAK
+from engine import OMEGA
+from layout import build_map
+from weather import WeatherModel, WeatherSeries, run_daily
+
+
+@pytest.fixture
+def thermal_map():
+    return build_map(16, (4, 4), (6, 6, 4), 12, 40, 50, np.random.default_rng(7))
+
+
+def diurnal_days(means, amplitude=4.0, peak=T_PEAK):
+    hours = np.arange(24 * len(means))
+    return np.repeat(means, 24) + amplitude * np.cos(OMEGA * (hours - peak))
+
+
+def test_series_fits_each_day():
+    weather = WeatherSeries(diurnal_days([17.6, 30.0], amplitude=3.0, peak=15.0))
+    assert weather.mean == pytest.approx([17.6, 30.0])
+    assert weather.peak == pytest.approx([15.0, 15.0])
+
+
+def test_slot_parameters_follow_the_days_ambient(thermal_map):
+    ambient = 17.6
+    model = WeatherModel(thermal_map.engine, WeatherSeries(diurnal_days([ambient, ambient])))
+    means = np.empty(thermal_map.engine.size)
+    for block in thermal_map:
+        means[block.slot] = (block.initial_temp + ambient) / 2
+        for item in block.items:
+            means[item.slot] = (type(item).initial_temp + means[block.slot]) / 2
+    for t in (3.0, 14.0, 40.5):
+        expected = means * (1 + EFFECT_RATE * np.cos(OMEGA * (t - T_PEAK)))
+        assert model.temperatures(t) == pytest.approx(expected)
+
+
+def test_daily_river_mean_tracks_ambient(thermal_map, tmp_path):
+    model = WeatherModel(thermal_map.engine, WeatherSeries(diurnal_days([17.6, 17.6])))
+    run_daily(thermal_map, model, tmp_path / 'daily.csv', step=0.25)
+    header, *rows = (line.split(',') for line in
+                     (tmp_path / 'daily.csv').read_text().splitlines())
+    river = float(rows[0][header.index('River_mean')])
+    assert river == pytest.approx((10 + 17.6) / 2, abs=0.1)
+
+
+@pytest.mark.parametrize('first, second', [(23.0, 1.0), (1.0, 23.0), (1.0, 3.0), (3.0, 1.0)])
+def test_peak_interpolates_the_short_way_round(first, second):
+    weather = WeatherSeries(np.concatenate([diurnal_days([20.0], peak=first),
+                                            diurnal_days([20.0], peak=second)]))
+    assert weather.peak == pytest.approx([first, second])
+    _, peak = weather.modulation(np.array([12.0, 18.0, 24.0, 30.0, 36.0]))
+    step = (second - first + 12) % 24 - 12
+    expected = first + step * np.array([0, 0.25, 0.5, 0.75, 1])
+    assert (peak - expected + 12) % 24 - 12 == pytest.approx(0, abs=0.01)
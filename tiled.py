@@ -0,0 +1,259 @@
+import argparse
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from cano import Block
+from engine import ThermalEngine
+from layout import ThermalMap
+from placement import place_items
+
+# CONSTANTS
+BLOCK_TYPE_NAMES = ('Yard', 'Ground', 'River')
+RIVER = BLOCK_TYPE_NAMES.index('River')
+TILE_BLOCKS = (32, 32)
+CACHED_TILES = 4
+
+
+# 12.0 code ref
+# City-scale map split into tiles of blocks. Only per-block codes and item
+# quotas are kept in memory; each tile's blocks are materialized on demand
+# from a seed derived from the tile index (so a tile always comes back
+# identical), and build() writes the layout rasters to memory-mapped .npy
+# files one tile at a time. Peak RAM is bounded by the tile size.
+class TiledMap:
+    # 12.1 code ref
+    def __init__(self, map_shape, block_size, block_distribution, num_houses, num_trees,
+                 directory, tile_blocks=TILE_BLOCKS, seed=None, strategy='random'):
+        self.map_shape = tuple(map_shape)
+        self.block_size = block_size
+        self.tile_blocks = tuple(tile_blocks)
+        self.directory = directory
+        self.strategy = strategy
+        self.seed = np.random.SeedSequence(seed).entropy
+        self.height = self.map_shape[0] * block_size
+        self.width = self.map_shape[1] * block_size
+        self.tile_grid = (-(-self.map_shape[0] // self.tile_blocks[0]),
+                          -(-self.map_shape[1] // self.tile_blocks[1]))
+        os.makedirs(directory, exist_ok=True)
+
+        rng = np.random.default_rng([self.seed, 0])
+        codes = np.repeat(np.arange(len(BLOCK_TYPE_NAMES), dtype=np.uint8),
+                          block_distribution)
+        rng.shuffle(codes)
+        self.block_types = codes.reshape(self.map_shape)
+        self.roads = road_sides(self.block_types)
+        self.requested = {'House': num_houses, 'Tree': num_trees}
+        self.house_quota = self._quota(rng, 'House', num_houses)
+        self.tree_quota = self._quota(rng, 'Tree', num_trees)
+        # Items actually placed per tile, filled in as tiles are materialized
+        self.placed = {kind: np.zeros(self.tile_grid, dtype=np.int64) for kind in self.requested}
+
+        self.slot_offsets = None
+        self._tiles = OrderedDict()
+
+    # 12.2 code ref
+    # Per-block item quotas: a uniform multinomial over the eligible blocks,
+    # capped at each block's capacity, with the overflow redistributed over
+    # the blocks that still have room
+    def _quota(self, rng, kind, count):
+        block_type = Block.ITEM_BLOCK_TYPES[kind]
+        eligible = np.flatnonzero(self.block_types.ravel() == BLOCK_TYPE_NAMES.index(block_type))
+        quota = np.zeros(self.block_types.size, dtype=np.int64)
+        if len(eligible):
+            capacity = Block(self.block_size, (0, 0), block_type, 0,
+                             ThermalEngine(capacity=1)).item_capacity(kind)
+            drawn = rng.multinomial(count, np.full(len(eligible), 1 / len(eligible)))
+            capped = np.minimum(drawn, capacity)
+            room = capacity - capped
+            overflow = min(int(drawn.sum() - capped.sum()), int(room.sum()))
+            if overflow:
+                capped += rng.multivariate_hypergeometric(room, overflow)
+            quota[eligible] = capped
+        return quota.reshape(self.map_shape)
+
+    # 12.2.1 code ref
+    # (requested, placed) item counts per kind over the tiles materialized so
+    # far; after build() every tile is counted
+    def item_counts(self):
+        return {kind: (self.requested[kind], int(self.placed[kind].sum()))
+                for kind in self.requested}
+
+    # 12.3 code ref
+    def tile_bounds(self, tile_row, tile_col):
+        row_start = tile_row * self.tile_blocks[0]
+        col_start = tile_col * self.tile_blocks[1]
+        return (row_start, min(row_start + self.tile_blocks[0], self.map_shape[0]),
+                col_start, min(col_start + self.tile_blocks[1], self.map_shape[1]))
+
+    # 12.4 code ref
+    def tiles(self):
+        for tile_row in range(self.tile_grid[0]):
+            for tile_col in range(self.tile_grid[1]):
+                yield tile_row, tile_col
+
+    # 12.5 code ref
+    # Blocks of one tile as a ThermalMap in tile-local pixel coordinates
+    def materialize_tile(self, tile_row, tile_col):
+        key = (tile_row, tile_col)
+        if key in self._tiles:
+            self._tiles.move_to_end(key)
+            return self._tiles[key]
+
+        row_start, row_stop, col_start, col_stop = self.tile_bounds(tile_row, tile_col)
+        engine = ThermalEngine()
+        blocks = []
+        for row in range(row_start, row_stop):
+            for col in range(col_start, col_stop):
+                topleft = ((col - col_start) * self.block_size,
+                           (row - row_start) * self.block_size)
+                block = Block(self.block_size, topleft,
+                              BLOCK_TYPE_NAMES[self.block_types[row, col]],
+                              row * self.map_shape[1] + col, engine)
+                for side, flags in self.roads.items():
+                    if flags[row, col]:
+                        block.add_road(side)
+                blocks.append(block)
+        tile = ThermalMap(blocks, self.block_size,
+                          (row_stop - row_start, col_stop - col_start), engine)
+
+        rng = np.random.default_rng([self.seed, 1 + tile_row * self.tile_grid[1] + tile_col])
+        for kind, quota in (('House', self.house_quota), ('Tree', self.tree_quota)):
+            limits = quota[row_start:row_stop, col_start:col_stop].ravel()
+            self.placed[kind][key] = place_items(blocks, kind, int(limits.sum()), self.strategy,
+                                                 rng=rng, limits=limits)
+
+        self._tiles[key] = tile
+        if len(self._tiles) > CACHED_TILES:
+            self._tiles.popitem(last=False)
+        return tile
+
+    # 12.6 code ref
+    def block(self, block_number):
+        row, col = divmod(block_number, self.map_shape[1])
+        tile = self.materialize_tile(row // self.tile_blocks[0], col // self.tile_blocks[1])
+        tile_cols = tile.map_shape[1]
+        return tile[(row % self.tile_blocks[0]) * tile_cols + col % self.tile_blocks[1]]
+
+    # 12.7 code ref
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    # 12.8 code ref
+    # Write label.npy (global engine slot per pixel), rgb.npy and the diurnal
+    # parameters of every slot (params.bin, float64 rows of t_mean, t_amp,
+    # t_peak), tile by tile
+    def build(self):
+        np.lib.format.open_memmap(
+            self.path('label.npy'), mode='w+', dtype=np.int32, shape=(self.height, self.width))
+        np.lib.format.open_memmap(
+            self.path('rgb.npy'), mode='w+', dtype=np.uint8, shape=(self.height, self.width, 3))
+        offsets = [0]
+        with open(self.path('params.bin'), 'wb') as params:
+            for tile_row in range(self.tile_grid[0]):
+                label = np.load(self.path('label.npy'), mmap_mode='r+')
+                rgb = np.load(self.path('rgb.npy'), mmap_mode='r+')
+                for tile_col in range(self.tile_grid[1]):
+                    tile = self.materialize_tile(tile_row, tile_col)
+                    region = self._pixel_region(tile_row, tile_col)
+                    label[region] = tile.label_raster + offsets[-1]
+                    rgb[region] = tile.rgb_image()
+                    engine = tile.engine
+                    params.write(np.stack([engine.t_mean, engine.t_amp, engine.t_peak],
+                                          axis=1).tobytes())
+                    offsets.append(offsets[-1] + engine.size)
+                # Unmap each band of tiles so resident memory stays bounded
+                label.flush()
+                rgb.flush()
+                del label, rgb
+        self.slot_offsets = np.array(offsets)
+        np.save(self.path('slot_offsets.npy'), self.slot_offsets)
+        return self
+
+    # 12.9 code ref
+    def _pixel_region(self, tile_row, tile_col):
+        row_start, row_stop, col_start, col_stop = self.tile_bounds(tile_row, tile_col)
+        size = self.block_size
+        return (slice(row_start * size, row_stop * size),
+                slice(col_start * size, col_stop * size))
+
+    # 12.10 code ref
+    def _tile_engine(self, index, params):
+        start, stop = self.slot_offsets[index], self.slot_offsets[index + 1]
+        engine = ThermalEngine(capacity=stop - start)
+        tile_params = params[start:stop]
+        engine.register_many(tile_params[:, 0], tile_params[:, 1], tile_params[:, 2],
+                             tile_params[:, 0])
+        return engine, start
+
+    # 12.11 code ref
+    # Thermal frame at time t streamed tile by tile into a memory-mapped .npy
+    def thermal_image(self, t, path=None, dtype=np.float32):
+        if self.slot_offsets is None:
+            self.build()
+        path = path or self.path(f"thermal_{t:.2f}h.npy")
+        params = np.memmap(self.path('params.bin'), dtype=np.float64, mode='r').reshape(-1, 3)
+        np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(self.height, self.width))
+        index = 0
+        for tile_row in range(self.tile_grid[0]):
+            label = np.load(self.path('label.npy'), mmap_mode='r')
+            frame = np.load(path, mmap_mode='r+')
+            for tile_col in range(self.tile_grid[1]):
+                engine, offset = self._tile_engine(index, params)
+                temps = engine.temperatures(t).astype(dtype)
+                region = self._pixel_region(tile_row, tile_col)
+                np.take(temps, label[region] - offset, out=frame[region], mode='clip')
+                index += 1
+            frame.flush()
+            del label, frame
+        return path
+
+
+# 12.12 code ref
+# Function 31: Road flags per side, same rule as add_roads_to_blocks
+def road_sides(block_types):
+    land = block_types != RIVER
+    edge = np.ones_like(land)
+    up = np.concatenate([edge[:1], land[:-1]], axis=0)
+    down = np.concatenate([land[1:], edge[:1]], axis=0)
+    left = np.concatenate([edge[:, :1], land[:, :-1]], axis=1)
+    right = np.concatenate([land[:, 1:], edge[:, :1]], axis=1)
+    return {'top': land & up, 'bottom': land & down, 'left': land & left, 'right': land & right}
+
+
+# 12.13 code ref
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Build a city-scale tiled map and render a thermal frame to .npy files.")
+    parser.add_argument('--rows', type=int, required=True)
+    parser.add_argument('--cols', type=int, required=True)
+    parser.add_argument('--block-size', type=int, default=20)
+    parser.add_argument('--yards', type=int, required=True)
+    parser.add_argument('--grounds', type=int, required=True)
+    parser.add_argument('--houses', type=int, default=0)
+    parser.add_argument('--trees', type=int, default=0)
+    parser.add_argument('--time', type=float, default=14.0)
+    parser.add_argument('--tile-blocks', type=int, default=TILE_BLOCKS[0])
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--directory', default='./result/tiled')
+    args = parser.parse_args(argv)
+
+    num_blocks = args.rows * args.cols
+    rivers = num_blocks - args.yards - args.grounds
+    if rivers < 0:
+        parser.error("yards + grounds exceeds the number of blocks")
+    tiled = TiledMap((args.rows, args.cols), args.block_size, (args.yards, args.grounds, rivers),
+                     args.houses, args.trees, args.directory,
+                     (args.tile_blocks, args.tile_blocks), args.seed)
+    tiled.build()
+    path = tiled.thermal_image(args.time)
+    print(f"Built {num_blocks} blocks ({tiled.height} x {tiled.width} px) in {args.directory}; "
+          f"thermal frame at {args.time:.2f}h saved to {path}")
+    for kind, (requested, placed) in tiled.item_counts().items():
+        if placed < requested:
+            print(f"Only {placed} of {requested} {kind.lower()}s could be added due to space")
+
+
+if __name__ == "__main__":
+    main()
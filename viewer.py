@@ -0,0 +1,376 @@
+import argparse
+import collections
+import threading
+import time
+
+import numpy as np
+
+from profiling import PROFILER
+from shading import DAY_OF_YEAR, LATITUDE, ShadingModel
+
+# CONSTANTS
+FPS = 30
+STEP = 0.1                      # simulated hours per frame
+DAY = 24
+RING_SIZE = 32                  # frames prefetched ahead of the one on screen
+LABEL_LIMIT = 100               # per-block temperature labels only on maps this small
+VMIN, VMAX = 5, 40
+CMAP = 'Spectral_r'
+
+
+# 20.0 code ref
+# Background producer of thermal frames. Frame k (time k * step, wrapped to a
+# day) is rendered straight from the engine parameters into slot k % capacity
+# of a preallocated ring, so the producer never touches the engine's current
+# temperatures and never allocates per frame. Frames are rendered at the
+# current view, a (pyramid level, window) pair; a request outside the
+# prefetched window (a seek) or a new view restarts the producer there.
+# An optional ShadingModel cools shaded pixels of every frame.
+class FramePrefetcher:
+    # 20.1 code ref
+    def __init__(self, thermal_map, step=STEP, capacity=RING_SIZE, shading=None):
+        self.engine = thermal_map.engine
+        self.pyramid = thermal_map.pyramid()
+        self.shading = shading
+        self.block_slots = thermal_map._block_table()[0]
+        self.step = step
+        self.capacity = capacity
+        self.block_temps = np.empty((capacity, len(self.block_slots)), dtype=np.float32)
+        self.ready = np.full(capacity, -1, dtype=np.int64)
+        self._allocate((0, None))
+        self._next = 0
+        self._consumed = 0
+        self._generation = 0
+        self._stopped = False
+        self._cond = threading.Condition()
+        self.hits = 0
+        self.misses = 0
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    # 20.2 code ref
+    def time_of(self, k):
+        return (k * self.step) % DAY
+
+    def _render(self, k, view, frame, block_temps):
+        temps = self.engine.temperatures(self.time_of(k))
+        self.pyramid.thermal_view(*view, temps=temps, out=frame)
+        if self.shading is not None:
+            self.shading.apply(frame, self.time_of(k), *view)
+        np.take(temps.astype(np.float32), self.block_slots, out=block_temps)
+
+    # 20.2.1 code ref
+    def _allocate(self, view):
+        shape = self.pyramid.view_shape(*view)
+        self.view = view
+        self.frames = np.empty((self.capacity, *shape), dtype=np.float32)
+        self._scratch = (np.empty(shape, dtype=np.float32),
+                         np.empty(len(self.block_slots), dtype=np.float32))
+
+    # Render frames at another (level, window) from frame `k` on
+    def set_view(self, level, window, k):
+        if level:
+            self.pyramid.level(level)
+        with self._cond:
+            self._allocate((level, window))
+            self._generation += 1
+            self.ready[:] = -1
+            self._next = self._consumed = k
+            self._cond.notify_all()
+
+    # 20.3 code ref
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._stopped or
+                                    self._next - self._consumed < self.capacity - 1)
+                if self._stopped:
+                    return
+                k, generation, view = self._next, self._generation, self.view
+                slot = k % self.capacity
+                frame = self.frames[slot]
+                self.ready[slot] = -1
+                self._next += 1
+            self._render(k, view, frame, self.block_temps[slot])
+            with self._cond:
+                if generation == self._generation:
+                    self.ready[slot] = k
+                    self._cond.notify_all()
+
+    # 20.4 code ref
+    # (frame, block temperatures) of frame k. The arrays belong to the ring and
+    # are recycled once the consumer has moved `capacity` frames on.
+    def get(self, k):
+        slot = k % self.capacity
+        with self._cond:
+            pending = self._consumed <= k < self._next
+            self._consumed = k
+            self._cond.notify_all()
+            if pending:
+                self._cond.wait_for(lambda: self.ready[slot] == k, timeout=1.0)
+            if self.ready[slot] == k:
+                self.hits += 1
+                return self.frames[slot], self.block_temps[slot]
+            self.misses += 1
+            self._generation += 1
+            self._next = k + 1
+            self.ready[:] = -1
+            self._cond.notify_all()
+            view, scratch = self.view, self._scratch
+        self._render(k, view, *scratch)
+        return scratch
+
+    # 20.5 code ref
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._thread.join()
+
+
+# 20.6 code ref
+# Interactive thermal view. Every artist is created once; each frame only
+# swaps the image data and label texts and blits them over the cached static
+# background (RGB panel, colour bar, titles), which is re-captured whenever
+# the canvas does a full draw (first show, resize).
+class ThermalViewer:
+    # 20.7 code ref
+    def __init__(self, thermal_map, title=None, step=STEP, fps=FPS, labels=None,
+                 shading=None):
+        self.map = thermal_map
+        self.step = step
+        self.num_frames = int(round(DAY / step))
+        self.frame = 0
+        self.playing = True
+        self.pyramid = thermal_map.pyramid()
+        self.prefetcher = FramePrefetcher(thermal_map, step, shading=shading)
+        self._rgb_view = None
+        self._background = None
+        self._syncing = False
+        self._ticks = collections.deque(maxlen=FPS)
+        if labels is None:
+            labels = len(thermal_map) <= LABEL_LIMIT
+        self._build_figure(title or f"Thermal View for {len(thermal_map)} Blocks", labels)
+        self.timer = self.fig.canvas.new_timer(interval=int(1000 / fps))
+        self.timer.add_callback(self._tick)
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        self.fig.canvas.mpl_connect('close_event', lambda event: self.close())
+
+    # 20.8 code ref
+    # pyplot is imported here, not at module level, so callers can still pick
+    # a backend (main's --benchmark selects Agg) after importing this module
+    def _build_figure(self, title, labels):
+        import matplotlib.pyplot as plt
+        from matplotlib import gridspec
+        from matplotlib.widgets import Button, Slider
+
+        self.fig = plt.figure(figsize=(12, 6.5))
+        self.fig.suptitle(title, fontsize=12)
+        gs = gridspec.GridSpec(1, 3, width_ratios=[1, 0.05, 1], wspace=0.3,
+                               bottom=0.15, top=0.9)
+
+        ax1 = self.fig.add_subplot(gs[0])
+        self.rgb = ax1.imshow(self.map.rgb_image())
+        ax1.set_title("RGB View", fontsize=8)
+        ax1.axis('off')
+
+        ax2 = self.fig.add_subplot(gs[2])
+        frame, block_temps = self.prefetcher.get(0)
+        self.image = ax2.imshow(frame, cmap=CMAP, vmin=VMIN, vmax=VMAX, animated=True)
+        ax2.set_title("Thermal View", fontsize=8)
+        ax2.axis('off')
+
+        cbar = self.fig.colorbar(self.image, cax=self.fig.add_subplot(gs[1]),
+                                 orientation='vertical', ticks=np.linspace(VMIN, VMAX, num=5))
+        cbar.set_label('Temperature (°C)', fontsize=12)
+        cbar.ax.yaxis.set_label_position('left')
+        cbar.ax.tick_params(labelsize=8)
+
+        self.labels = []
+        if labels:
+            _, topleft, _ = self.map._block_table()
+            centres = topleft + self.map.block_size // 2
+            self.labels = [ax2.text(x, y, f"{temp:.1f}°C", fontsize=12, color='black',
+                                    ha='center', va='center', animated=True)
+                           for (x, y), temp in zip(centres.tolist(), block_temps.tolist())]
+        self.clock = ax2.text(0.08, 0.9, '', transform=ax2.transAxes, fontsize=8,
+                              color='black', ha='center', animated=True)
+
+        self.slider = Slider(self.fig.add_axes([0.2, 0.04, 0.5, 0.03]), 'Time (h)',
+                             0, DAY - self.step, valinit=0, valstep=self.step, valfmt='%.1f')
+        self.slider.drawon = False
+        slider_artists = [self.slider.poly, self.slider._handle, self.slider.valtext]
+        for artist in slider_artists:
+            artist.set_animated(True)
+        self.slider.on_changed(self._on_slider)
+        self.button = Button(self.fig.add_axes([0.78, 0.03, 0.08, 0.05]), 'Pause')
+        self.button.on_clicked(self.toggle)
+        self._animated = [self.image, *self.labels, self.clock, *slider_artists]
+        self._fit_views()
+
+    # 20.9 code ref
+    def _on_draw(self, event):
+        if self._fit_views():
+            self.fig.canvas.draw_idle()
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        for artist in self._animated:
+            self.fig.draw_artist(artist)
+
+    # 20.9.1 code ref
+    # Show each panel at the pyramid level matching its size on screen and its
+    # zoom window; returns True when the (static) RGB panel changed
+    def _fit_views(self):
+        view = self._view_for(self.image.axes)
+        if view != self.prefetcher.view:
+            self.prefetcher.set_view(*view, self.frame)
+            self._set_image(self.image, self.prefetcher.get(self.frame)[0], view)
+        view = self._view_for(self.rgb.axes)
+        if view == self._rgb_view:
+            return False
+        self._rgb_view = view
+        self._set_image(self.rgb, self.pyramid.rgb_view(*view), view)
+        return True
+
+    def _view_for(self, ax):
+        height, width = self.map.height, self.map.width
+        (x0, x1), (y0, y1) = sorted(ax.get_xlim()), sorted(ax.get_ylim())
+        window = (max(0, int(np.floor(y0 + 0.5))), min(height, int(np.ceil(y1 + 0.5))),
+                  max(0, int(np.floor(x0 + 0.5))), min(width, int(np.ceil(x1 + 0.5))))
+        if window == (0, height, 0, width) or window[0] >= window[1] or window[2] >= window[3]:
+            window = None
+        bbox = ax.get_window_extent()
+        return self.pyramid.level_for((bbox.height, bbox.width), window), window
+
+    def _set_image(self, image, data, view):
+        ax = image.axes
+        limits = ax.get_xlim(), ax.get_ylim()
+        image.set_data(data)
+        image.set_extent(self.pyramid.extent(*view))
+        ax.set_xlim(limits[0])
+        ax.set_ylim(limits[1])
+
+    # 20.10 code ref
+    def show_frame(self, k):
+        self.frame = k % self.num_frames
+        t = self.prefetcher.time_of(self.frame)
+        frame, block_temps = self.prefetcher.get(self.frame)
+        self.image.set_data(frame)
+        for label, temp in zip(self.labels, block_temps.tolist()):
+            label.set_text(f"{temp:.1f}°C")
+        self._ticks.append(time.perf_counter())
+        self.clock.set_text(f"Time: {t:.2f}h  {self.fps:.0f} fps")
+        self._syncing = True
+        self.slider.set_val(t)
+        self._syncing = False
+        self._blit()
+        PROFILER.count('frames')
+
+    def _blit(self):
+        canvas = self.fig.canvas
+        if self._background is None:
+            canvas.draw()
+            return
+        canvas.restore_region(self._background)
+        self._draw_animated()
+        canvas.blit(self.fig.bbox)
+        canvas.flush_events()
+
+    # 20.11 code ref
+    @property
+    def fps(self):
+        if len(self._ticks) < 2:
+            return 0.0
+        return (len(self._ticks) - 1) / max(self._ticks[-1] - self._ticks[0], 1e-9)
+
+    def _tick(self):
+        if self.playing:
+            self.show_frame(self.frame + 1)
+
+    def _on_slider(self, value):
+        if not self._syncing:
+            self.show_frame(int(round(value / self.step)))
+
+    def toggle(self, event=None):
+        self.playing = not self.playing
+        self.button.label.set_text('Pause' if self.playing else 'Play')
+        self.fig.canvas.draw_idle()
+
+    # 20.12 code ref
+    def show(self):
+        import matplotlib.pyplot as plt
+
+        self.timer.start()
+        plt.show()
+        self.close()
+
+    def close(self):
+        self.timer.stop()
+        if not self.prefetcher._stopped:
+            self.prefetcher.stop()
+
+    # 20.13 code ref
+    # Frames per second over `frames` steps on the current canvas (use the
+    # Agg backend to time rendering alone)
+    def benchmark(self, frames=240):
+        self.fig.canvas.draw()
+        begin = time.perf_counter()
+        for _ in range(frames):
+            self.show_frame(self.frame + 1)
+        return frames / (time.perf_counter() - begin)
+
+
+# 20.14 code ref
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Interactive thermal viewer with a time slider and play/pause.")
+    parser.add_argument('--input', default='input.txt', help="config file (see extract.py)")
+    parser.add_argument('--layout', default=None, help="load a snapshot saved by snapshot.py")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--step', type=float, default=STEP, help="hours per frame")
+    parser.add_argument('--benchmark', type=int, metavar='FRAMES', default=None,
+                        help="render FRAMES frames headless and print the frame rate")
+    parser.add_argument('--no-labels', action='store_true',
+                        help="hide the per-block temperature labels")
+    parser.add_argument('--shading', action='store_true',
+                        help="cool pixels shaded by houses and trees (see shading.py)")
+    parser.add_argument('--latitude', type=float, default=LATITUDE)
+    parser.add_argument('--day-of-year', type=int, default=DAY_OF_YEAR)
+    args = parser.parse_args(argv)
+
+    if args.benchmark:
+        import matplotlib
+        matplotlib.use('Agg')
+    if args.layout:
+        from snapshot import load_layout
+        thermal_map = load_layout(args.layout)
+    else:
+        from extract import extract_values_from_file
+        from layout import build_map
+        from utils import calculate_block_size
+
+        num_blocks, num_rows, yards, grounds, rivers, houses, trees, _ = \
+            extract_values_from_file(args.input)
+        thermal_map = build_map(num_blocks, (num_rows, num_blocks // num_rows),
+                                (yards, grounds, rivers), houses, trees,
+                                calculate_block_size(num_blocks),
+                                np.random.default_rng(args.seed))
+
+    shading = ShadingModel(thermal_map, args.latitude, args.day_of_year) \
+        if args.shading else None
+    viewer = ThermalViewer(thermal_map, step=args.step,
+                           labels=False if args.no_labels else None, shading=shading)
+    if args.benchmark:
+        fps = viewer.benchmark(args.benchmark)
+        viewer.close()
+        print(f"{len(thermal_map)} blocks, {thermal_map.height}x{thermal_map.width} px: "
+              f"{fps:.1f} fps (prefetch hits {viewer.prefetcher.hits}, "
+              f"misses {viewer.prefetcher.misses})")
+        return
+    viewer.show()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import csv
+import os
+import time
+
+import numpy as np
+
+from analytics import BLOCK_TYPE_NAMES, BUILT_UP, CHUNK_BYTES, GROUPS, NATURAL
+from cano import EFFECT_RATE, ITEM_CLASSES, T_PEAK
+from engine import OMEGA
+
+# CONSTANTS
+SYNTHETIC_MEAN = 25.0           # °C, annual mean of synthetic_weather
+SYNTHETIC_AMPLITUDE = 5.0       # °C, typical half-range of a synthetic day
+COLUMN = 'temperature'
+STEP = 1 / 60                   # hours between samples (1 minute)
+
+
+# 25.1 code ref
+# Hourly ambient temperatures reduced to each day's mean and the hour of the
+# peak of its diurnal harmonic. Rows start at midnight of day 0; gaps are
+# filled linearly and trailing hours that do not fill a day are ignored.
+class WeatherSeries:
+    def __init__(self, hourly):
+        hourly = np.asarray(hourly, dtype=float)
+        valid = np.isfinite(hourly)
+        if valid.sum() < 2:
+            raise ValueError("weather series needs at least two valid hours")
+        hours = np.arange(len(hourly))
+        hourly = np.interp(hours, hours[valid], hourly[valid])
+        days = len(hourly) // 24
+        if days == 0:
+            raise ValueError("weather series is shorter than one day")
+        self.hourly = hourly[:days * 24]
+        samples = self.hourly.reshape(days, 24)
+        harmonic = samples @ np.exp(-1j * OMEGA * np.arange(24)) / 12
+        self.mean = samples.mean(axis=1)
+        self.peak = -np.angle(harmonic) / OMEGA % 24
+
+    @property
+    def days(self):
+        return len(self.mean)
+
+    # 25.1.1 code ref
+    @classmethod
+    def from_csv(cls, path, column=COLUMN):
+        with open(path, newline='') as file:
+            reader = csv.DictReader(file)
+            if column not in (reader.fieldnames or ()):
+                raise ValueError(f"{path}: no {column!r} column")
+            hourly = [float(row[column]) if row[column].strip() else np.nan for row in reader]
+        return cls(hourly)
+
+    # 25.1.2 code ref
+    # Ambient mean and peak hour at hours `times`, interpolated between day
+    # centres so parameters change smoothly across midnight. Peak hours are
+    # interpolated on the circle, so 23 h and 1 h meet at midnight.
+    def modulation(self, times):
+        centres = 24 * np.arange(self.days) + 12
+        phase = OMEGA * self.peak
+        peak = np.arctan2(np.interp(times, centres, np.sin(phase)),
+                          np.interp(times, centres, np.cos(phase))) / OMEGA % 24
+        return np.interp(times, centres, self.mean), peak
+
+
+# 25.2 code ref
+# Function 65: Hourly CSV of synthetic weather for `days` days: a seasonal
+# cycle, a diurnal cycle peaking mid-afternoon and day-to-day noise
+def synthetic_weather(path, days=365, seed=None):
+    rng = np.random.default_rng(seed)
+    hours = np.arange(days * 24)
+    season = SYNTHETIC_MEAN - 8 * np.cos(2 * np.pi * (hours / 24 + 10) / 365)
+    daily = np.repeat(rng.normal(0, 1.5, days), 24)
+    diurnal = (SYNTHETIC_AMPLITUDE + np.repeat(rng.normal(0, 1, days), 24)) * \
+        np.cos(OMEGA * (hours - T_PEAK))
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['hour', COLUMN])
+        writer.writerows(zip(hours.tolist(), np.round(season + daily + diurnal, 2).tolist()))
+    return path
+
+
+# 25.3 code ref
+# Engine temperatures driven by a WeatherSeries. The day's ambient mean takes
+# the place of the fixed ambient of cano.py: a block's mean is
+# (initial + ambient) / 2, an item's is (initial + its block's mean) / 2, every
+# amplitude is EFFECT_RATE * mean and the peak is the day's peak hour. Means
+# are linear in the ambient, so a sample still costs two multiply-adds per
+# slot. `temperatures(t, slots)` matches ThermalEngine.temperatures, so it
+# plugs into analytics.stream_statistics.
+class WeatherModel:
+    # 25.3.1 code ref
+    def __init__(self, engine, weather):
+        self.engine = engine
+        self.weather = weather
+        kind = engine.kind
+        initial = np.zeros(max(ITEM_CLASSES) + 1)
+        for item_kind, item_class in ITEM_CLASSES.items():
+            initial[item_kind] = item_class.initial_temp
+        # A block's fixed mean is its initial temperature
+        block_initial = engine.t_mean[engine.owner]
+        is_block = kind == 0
+        self._base = np.where(is_block, block_initial / 2, initial[kind] / 2 + block_initial / 4)
+        self._weight = np.where(is_block, 1 / 2, 1 / 4)
+
+    @property
+    def hours(self):
+        return 24 * self.weather.days
+
+    # 25.3.2 code ref
+    def temperatures(self, t, slots=None, out=None):
+        if slots is None:
+            slots = slice(0, self.engine.size)
+        times = np.asarray(t, dtype=float)
+        ambient, peak = self.weather.modulation(times)
+        gain = 1 + EFFECT_RATE * np.cos(OMEGA * (times - peak))
+        result = np.multiply.outer(ambient, self._weight[slots], out=out)
+        result += self._base[slots]
+        result *= gain[..., None] if times.ndim else gain
+        return result
+
+
+# 25.4 code ref
+# Function 66: Stream (times, temperatures) over hours [start, stop) every
+# `step` hours. Chunks hold whole days while a day fits in `chunk_bytes`,
+# otherwise parts of a day, so memory stays bounded for any horizon.
+def simulate(model, start=0.0, stop=None, step=STEP, slots=None, chunk_bytes=CHUNK_BYTES):
+    stop = model.hours if stop is None else stop
+    slots = np.arange(model.engine.size) if slots is None else slots
+    count = int(round((stop - start) / step))
+    per_day = max(1, int(round(24 / step)))
+    budget = max(1, chunk_bytes // (8 * max(len(slots), 1)))
+    chunk = budget // per_day * per_day if budget >= per_day else budget
+    for first in range(0, count, chunk):
+        times = start + step * np.arange(first, min(first + chunk, count))
+        yield times, model.temperatures(times, slots)
+
+
+# 25.5 code ref
+# Function 67: Per-day area means of every block type and the UHI index
+# (mean and max over the day) for a ThermalMap under `model`, written to
+# daily.csv a chunk at a time. Returns (days, samples, seconds).
+def run_daily(thermal_map, model, path, step=STEP, chunk_bytes=CHUNK_BYTES, progress=None):
+    engine = thermal_map.engine
+    block_slots, _, block_types = thermal_map._block_table()
+    block_index = np.zeros(engine.size, dtype=np.intp)
+    block_index[block_slots] = np.arange(len(block_slots))
+    pixels = np.bincount(thermal_map.label_raster.ravel(), minlength=engine.size)
+    slots = np.flatnonzero(pixels)
+    slot_types = np.asarray(block_types)[block_index[engine.owner[slots]]]
+    names = [(name,) for name in BLOCK_TYPE_NAMES] + [BUILT_UP, NATURAL]
+    weights = np.zeros((len(slots), len(names)))
+    for column, group in enumerate(names):
+        members = np.isin(slot_types, group)
+        weights[members, column] = pixels[slots][members] / max(pixels[slots][members].sum(), 1)
+
+    days = model.weather.days
+    total = np.zeros((days, len(GROUPS)))
+    peak = np.full((days, len(GROUPS)), -np.inf)
+    counts = np.zeros(days, dtype=np.int64)
+    written = 0
+    begin = time.perf_counter()
+    with open(path, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(['day', 'ambient_mean'] + [f"{group}_{field}" for group in GROUPS
+                                                   for field in ('mean', 'max')])
+        for times, temps in simulate(model, 0.0, model.hours, step, slots, chunk_bytes):
+            series = temps @ weights
+            series = np.column_stack([series[:, :len(BLOCK_TYPE_NAMES)],
+                                      series[:, -2] - series[:, -1]])
+            day = np.minimum((times // 24).astype(np.intp), days - 1)
+            np.add.at(total, day, series)
+            np.maximum.at(peak, day, series)
+            counts += np.bincount(day, minlength=days)
+            done = min(days, int((times[-1] + step) / 24 + 1e-9))
+            for index in range(written, done):
+                mean = total[index] / counts[index]
+                writer.writerow([index, f"{model.weather.mean[index]:.2f}"] +
+                                [f"{value:.4f}" for pair in zip(mean, peak[index]) for value in pair])
+            file.flush()
+            written = done
+            if progress is not None:
+                progress(written, days, times[-1] + step, time.perf_counter() - begin)
+    return days, int(counts.sum()), time.perf_counter() - begin
+
+
+# 25.6 code ref
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Multi-day thermal simulation driven by an hourly ambient temperature CSV.")
+    parser.add_argument('weather', nargs='?', default=None,
+                        help="hourly CSV with a temperature column, starting at midnight")
+    parser.add_argument('--column', default=COLUMN, help="temperature column name")
+    parser.add_argument('--synthetic', type=int, default=None, metavar='DAYS',
+                        help="generate a synthetic weather CSV of DAYS days and run on it")
+    parser.add_argument('--input', default='input.txt', help="layout config file")
+    parser.add_argument('--layout', default=None, help="load a snapshot saved by snapshot.py")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--step', type=float, default=STEP * 60, help="minutes between samples")
+    parser.add_argument('--output', default='./result/weather',
+                        help="directory for daily.csv")
+    args = parser.parse_args(argv)
+    if args.weather is None and args.synthetic is None:
+        parser.error("give a weather CSV or --synthetic DAYS")
+
+    os.makedirs(args.output, exist_ok=True)
+    path = args.weather
+    if args.synthetic is not None:
+        path = synthetic_weather(os.path.join(args.output, 'synthetic_weather.csv'),
+                                 args.synthetic, args.seed)
+    weather = WeatherSeries.from_csv(path, args.column)
+
+    if args.layout:
+        from snapshot import load_layout
+        thermal_map = load_layout(args.layout)
+    else:
+        from extract import extract_values_from_file
+        from layout import build_map
+        from utils import calculate_block_size
+
+        num_blocks, num_rows, yards, grounds, rivers, houses, trees, _ = \
+            extract_values_from_file(args.input)
+        thermal_map = build_map(num_blocks, (num_rows, num_blocks // num_rows),
+                                (yards, grounds, rivers), houses, trees,
+                                calculate_block_size(num_blocks),
+                                np.random.default_rng(args.seed))
+
+    def progress(done, days, hours, elapsed):
+        print(f"\rday {done}/{days}, {hours / max(elapsed, 1e-9):,.0f} simulated h/s",
+              end='', flush=True)
+
+    days, samples, seconds = run_daily(thermal_map, WeatherModel(thermal_map.engine, weather),
+                                       os.path.join(args.output, 'daily.csv'), args.step / 60,
+                                       progress=progress)
+    print()
+    print(f"{days} days ({samples} samples) in {seconds:.1f}s: "
+          f"{24 * days / seconds:,.0f} simulated hours per second, "
+          f"results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()